@@ -55,6 +55,7 @@ DB_NAME=$DB_NAME
 DB_PASSWORD=$DB_PASSWORD
 DB_HOST=postgres
 DB_PORT=5432
+DJANGO_ALLOWED_HOSTS=localhost
 EOF
     fi
 
@@ -77,6 +78,10 @@ case "$subcommand" in
         prepare_env_files
         docker compose up -d --build
         ;;
+    prod)
+        prepare_env_files
+        docker compose -f docker-compose.prod.yml up -d --build
+        ;;
     remove)
         docker compose down &&
         docker volume rm knyfe_postgres_knyfe_data
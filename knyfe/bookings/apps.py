@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def _create_event_partitions(sender, using, **kwargs):
+    from .services import booking_event_partition_service
+
+    # also a no-op when migrated back to before the table was partitioned
+    if using == "default" and booking_event_partition_service.is_partitioned():
+        booking_event_partition_service.ensure_partitions()
 
 
 class BookingsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "bookings"
+
+    def ready(self):
+        post_migrate.connect(_create_event_partitions, sender=self)
@@ -0,0 +1,163 @@
+"""async read endpoints, served without a worker thread per request under ASGI
+
+The handlers query through the `utils.async_db` connection pool, so a slow read
+only holds a pooled connection while the event loop serves other requests.
+Requests authenticate with the session cookie of the synchronous API, and
+read the cache through its async API.
+"""
+
+import functools
+import typing
+
+from asgiref.sync import sync_to_async
+from django import db
+from django.contrib import auth
+from django.http import HttpResponse, HttpResponseNotAllowed
+from rest_framework import status
+from utils import renderers
+
+from . import views
+from .services import booking_handler
+
+
+def _json_response(
+    data, status_code: int = status.HTTP_200_OK, headers=None
+) -> HttpResponse:
+    # rendered like the synchronous API's responses
+    return HttpResponse(
+        renderers.dumps(data),
+        status=status_code,
+        content_type="application/json",
+        headers=headers,
+    )
+
+
+def _get_user(request):
+    """auth.get_user() on a pool thread rather than the single sync thread, so
+    concurrent requests do not queue behind each other's session lookups"""
+    try:
+        return auth.get_user(request)
+    finally:
+        # the pool thread's connections outlive the request, so they expire
+        # by CONN_MAX_AGE as a request's own would at its end
+        db.close_old_connections()
+
+
+def _read_view(view):
+    """GET only, for authenticated users"""
+
+    @functools.wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return HttpResponseNotAllowed(["GET", "HEAD"])
+        request.user = await sync_to_async(_get_user, thread_sensitive=False)(request)
+        if not request.user.is_authenticated:
+            return _json_response(
+                {"detail": "Authentication credentials were not provided."},
+                status_code=status.HTTP_403_FORBIDDEN,
+            )
+        return await view(request, *args, **kwargs)
+
+    return wrapped
+
+
+async def _wait_for_projection(request) -> dict:
+    event_id = request.headers.get(views.EVENT_ID_HEADER, "")
+    if not event_id.isdigit() or await booking_handler.ahandle_wait_for_projection(
+        int(event_id)
+    ):
+        return views._read_model_headers()
+    return {"X-Booking-Projection-Pending": "true", **views._read_model_headers()}
+
+
+def _not_modified(request, etag: typing.Optional[str], headers: dict):
+    if not views._none_match(request, etag):
+        return None
+    return HttpResponse(
+        status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, **headers}
+    )
+
+
+@_read_view
+async def list_bookings(request):
+    request_serializer = views.BookingListRequestSerializer(data=request.GET)
+    if not request_serializer.is_valid():
+        return _json_response(
+            request_serializer.errors, status_code=status.HTTP_400_BAD_REQUEST
+        )
+    request_data = dict(request_serializer.validated_data)
+    headers = await _wait_for_projection(request)
+    # read before the page, so a concurrent write can only make it stale
+    etag = await booking_handler.ahandle_list_etag(user=request.user)
+    not_modified = _not_modified(request, etag, headers)
+    if not_modified is not None:
+        return not_modified
+    result = await booking_handler.ahandle_list(
+        user=request.user,
+        cursor=request_data.pop("cursor", None),
+        limit=request_data.pop("limit"),
+        filters=request_data,
+    )
+    if result.is_error():
+        return _json_response(
+            {"error": result.unwrap_error()},
+            status_code=result.get_metadata("status", status.HTTP_400_BAD_REQUEST),
+            headers=headers,
+        )
+    return _json_response(
+        views._page_data(result.unwrap()),
+        headers={**views._etag_headers(etag), **headers},
+    )
+
+
+@_read_view
+async def retrieve_booking(request, booking_key):
+    headers = await _wait_for_projection(request)
+    if "If-None-Match" in request.headers:
+        version = await booking_handler.ahandle_retrieve_version(
+            user=request.user, booking_key=booking_key
+        )
+        if version is not None:
+            not_modified = _not_modified(request, views._version_etag(version), headers)
+            if not_modified is not None:
+                return not_modified
+    result = await booking_handler.ahandle_retrieve(
+        user=request.user,
+        booking_key=booking_key,
+    )
+    if result.is_error():
+        return _json_response(
+            {"error": result.unwrap_error()},
+            status_code=result.get_metadata("status", status.HTTP_400_BAD_REQUEST),
+            headers=headers,
+        )
+    etag = views._booking_etag(result.unwrap())
+    not_modified = _not_modified(request, etag, headers)
+    if not_modified is not None:
+        return not_modified
+    return _json_response(
+        result.unwrap(),
+        headers={"ETag": etag, **headers},
+    )
+
+
+@_read_view
+async def list_availability(request):
+    serializer = views.BookingAvailabilityRequestSerializer(data=request.GET)
+    if not serializer.is_valid():
+        return _json_response(
+            serializer.errors, status_code=status.HTTP_400_BAD_REQUEST
+        )
+    headers = await _wait_for_projection(request)
+    etag = await booking_handler.ahandle_list_availability_etag(user_id=request.user.id)
+    not_modified = _not_modified(request, etag, headers)
+    if not_modified is not None:
+        return not_modified
+    data = await booking_handler.ahandle_list_availability(
+        date=serializer.validated_data["date_utc"],
+        user_id=request.user.id,
+    )
+    return _json_response(
+        views._availability_data(data),
+        headers={**views._etag_headers(etag), **headers},
+    )
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services import booking_event_partition_service
+
+
+class Command(BaseCommand):
+    help = (
+        "Detach the booking event partitions of months older than "
+        "--older-than-months, write them to gzipped CSV files under "
+        "BOOKING_EVENT_ARCHIVE_DIR and drop them. Replays still read archived "
+        "events; keep the files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-months",
+            type=int,
+            default=settings.BOOKING_EVENT_HOT_MONTHS,
+            help="Months before the current one whose partitions stay attached.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the partitions that would be archived.",
+        )
+
+    def handle(self, *args, **options):
+        if options["older_than_months"] < 1:
+            raise CommandError("--older-than-months must be at least 1.")
+        partitions = booking_event_partition_service.archivable_partitions(
+            older_than_months=options["older_than_months"]
+        )
+        if options["dry_run"]:
+            for partition in partitions:
+                self.stdout.write(partition.name)
+            return
+        archived = 0
+        for partition in partitions:
+            try:
+                archive = booking_event_partition_service.archive_partition(partition)
+            except booking_event_partition_service.PendingEvents:
+                self.stderr.write(
+                    f"Skipped {partition.name}: events are still waiting for the "
+                    "projector."
+                )
+                continue
+            archived += 1
+            self.stdout.write(
+                f"Archived {archive.events:,} event(s) of {archive.partition} to "
+                f"{booking_event_partition_service.archive_path(archive)}."
+            )
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} partition(s)."))
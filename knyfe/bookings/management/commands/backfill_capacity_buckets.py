@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...services import booking_capacity_service
+
+
+class Command(BaseCommand):
+    help = "Rebuild hourly capacity buckets from the booking projections."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report buckets that disagree with the booking projections.",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            mismatches = booking_capacity_service.query_capacity_bucket_mismatches()
+            for mismatch in mismatches:
+                self.stdout.write(
+                    f"owner={mismatch.owner_id} "
+                    f"starts_at={mismatch.starts_at.isoformat()} "
+                    f"expected={mismatch.expected} actual={mismatch.actual}"
+                )
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} inconsistent bucket(s).")
+            self.stdout.write(self.style.SUCCESS("Capacity buckets are consistent."))
+            return
+
+        with transaction.atomic():
+            count = booking_capacity_service.rebuild_capacity_buckets()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} capacity bucket(s)."))
@@ -0,0 +1,100 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from ...models import BookingEvent, BookingSnapshot, User
+from ...services import booking_event_service
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare load_booking_state fold time with and without snapshots on "
+        "synthetic long event streams. Seeded rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--events",
+            type=int,
+            nargs="+",
+            default=[100, 1_000, 10_000],
+            help="Stream lengths to benchmark.",
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            owner, _ = User.objects.get_or_create(username="benchmark-booking-state")
+            for length in options["events"]:
+                booking_key = self._seed_stream(owner.pk, length)
+                without = self._measure(booking_key, False, options["repeat"])
+                with_snapshots = self._measure(booking_key, True, options["repeat"])
+                self.stdout.write(
+                    f"{length:>7,} events: "
+                    f"without snapshots {without * 1000:8.2f} ms, "
+                    f"with snapshots {with_snapshots * 1000:8.2f} ms "
+                    f"({without / with_snapshots:5.1f}x)"
+                )
+            transaction.set_rollback(True)
+
+    def _seed_stream(self, owner_id, length):
+        booking_key = booking_event_service.generate_key()
+        starts_at = timezone.now() + timezone.timedelta(days=10)
+        interval = booking_event_service.get_snapshot_interval()
+        events = [
+            BookingEvent(
+                user_id=owner_id,
+                booking_key=booking_key,
+                event_type=BookingEvent.EventType.CREATED,
+                version=1,
+                timestamp=timezone.now(),
+                data={
+                    "owner_id": owner_id,
+                    "starts_at": starts_at.isoformat(),
+                    "ends_at": (starts_at + timezone.timedelta(hours=1)).isoformat(),
+                    "applicants": 1,
+                },
+            )
+        ] + [
+            BookingEvent(
+                user_id=owner_id,
+                booking_key=booking_key,
+                event_type=BookingEvent.EventType.UPDATED,
+                version=version,
+                timestamp=timezone.now(),
+                data={"applicants": version},
+            )
+            for version in range(2, length + 1)
+        ]
+        events = BookingEvent.objects.bulk_create(events, batch_size=5_000)
+        state = None
+        snapshots = []
+        for event in events:
+            state = booking_event_service.fold_booking_event(
+                state, event.event_type, event.data, event.version
+            )
+            if event.version % interval == 0:
+                snapshots.append(
+                    BookingSnapshot(
+                        booking_key=booking_key,
+                        version=event.version,
+                        event_id=event.id,
+                        timestamp=event.timestamp,
+                        state=state._asdict(),
+                    )
+                )
+        BookingSnapshot.objects.bulk_create(snapshots, batch_size=5_000)
+        return booking_key
+
+    def _measure(self, booking_key, use_snapshots, repeat):
+        timings = []
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            booking_event_service.load_booking_state(
+                booking_key, use_snapshots=use_snapshots
+            )
+            timings.append(time.perf_counter() - started_at)
+        return statistics.median(timings)
@@ -0,0 +1,333 @@
+import contextlib
+import json
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ...models import (
+    BookingEvent,
+    BookingOutbox,
+    BookingProjection,
+    BookingSnapshot,
+    BookingStream,
+    User,
+)
+from ...services import (
+    booking_capacity_service,
+    booking_handler,
+    booking_projection_service,
+)
+
+USERNAME_PREFIX = "benchmark-endpoints-"
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed users, events and projections into the database, then report "
+        "p50/p95/p99 latency, queries per call and throughput of the booking "
+        "service functions and API endpoints. Seeded rows are deleted afterwards "
+        "unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--bookings-per-user", type=int, default=1_000)
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Random seed for the users, bookings and dates each call uses.",
+        )
+        parser.add_argument(
+            "--only",
+            nargs="+",
+            default=None,
+            help="Benchmark names to run; all by default.",
+        )
+        parser.add_argument(
+            "--output",
+            default=None,
+            help="Write the report as JSON to this path.",
+        )
+        parser.add_argument("--keep", action="store_true", help="Keep seeded rows.")
+
+    def handle(self, *args, **options):
+        if options["users"] < 1 or options["bookings_per_user"] < 1:
+            raise CommandError("--users and --bookings-per-user must be at least 1.")
+        if options["iterations"] < 2:
+            raise CommandError("--iterations must be at least 2.")
+        if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError(
+                f"Users named {USERNAME_PREFIX}* already exist; delete them first."
+            )
+        self.rng = random.Random(options["seed"])
+        self.starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            minute=0, second=0, microsecond=0
+        )
+        self.bookings_per_user = options["bookings_per_user"]
+        self.clients = {}
+
+        started_at = time.perf_counter()
+        self._seed(options["users"])
+        self.stdout.write(
+            f"Seeded {options['users']:,} users and "
+            f"{options['users'] * self.bookings_per_user:,} bookings in "
+            f"{time.perf_counter() - started_at:.1f}s."
+        )
+        results = {}
+        try:
+            for name, call in self._benchmarks():
+                if options["only"] and name not in options["only"]:
+                    continue
+                results[name] = self._measure(call, options["iterations"])
+                self._write_result(name, results[name])
+        finally:
+            if not options["keep"]:
+                self._delete_seeded_rows()
+
+        if options["output"]:
+            report = {
+                "started_at": timezone.now().isoformat(),
+                "projection_mode": settings.BOOKING_PROJECTION_MODE,
+                "users": options["users"],
+                "bookings_per_user": self.bookings_per_user,
+                "iterations": options["iterations"],
+                "seed": options["seed"],
+                "results": results,
+            }
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+    def _seed(self, users):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                """
+INSERT INTO bookings_user (
+    password, is_superuser, username, first_name, last_name, email,
+    is_staff, is_active, date_joined
+)
+SELECT '', false, %s || n, '', '', '', n = 0, true, now()
+FROM generate_series(0, %s) AS n
+ORDER BY n
+RETURNING id;
+""",
+                [USERNAME_PREFIX, users],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            self.admin_user = User.objects.get(pk=ids[0])
+            self.owner_ids = ids[1:]
+            # one booking per owner per hour, every other one approved
+            cursor.execute(
+                """
+INSERT INTO bookings_bookingprojection (
+    booking_key, owner_id, starts_at, ends_at, applicants, status, version
+)
+SELECT
+    gen_random_uuid(),
+    u.id,
+    %s::timestamptz + n * interval '1 hour',
+    %s::timestamptz + n * interval '1 hour' + interval '90 minutes',
+    1 + n %% 5,
+    CASE WHEN n %% 2 = 0 THEN 'APPROVED' ELSE 'PENDING' END,
+    CASE WHEN n %% 2 = 0 THEN 2 ELSE 1 END
+FROM unnest(%s::bigint[]) AS u(id)
+CROSS JOIN generate_series(0, %s - 1) AS n;
+""",
+                [
+                    self.starts_at,
+                    self.starts_at,
+                    self.owner_ids,
+                    self.bookings_per_user,
+                ],
+            )
+            cursor.execute(
+                """
+INSERT INTO bookings_bookingevent (
+    user_id, booking_key, event_type, version, timestamp, data
+)
+SELECT e.user_id, b.booking_key, e.event_type, e.version, now(), e.data
+FROM bookings_bookingprojection b
+CROSS JOIN LATERAL (
+    VALUES
+        (
+            b.owner_id,
+            'CREATED',
+            1,
+            jsonb_build_object(
+                'owner_id', b.owner_id,
+                'starts_at', b.starts_at,
+                'ends_at', b.ends_at,
+                'applicants', b.applicants
+            )
+        ),
+        (%s, 'UPDATED', 2, '{"status": "APPROVED"}'::jsonb)
+) AS e(user_id, event_type, version, data)
+WHERE b.owner_id = ANY(%s) AND e.version <= b.version;
+""",
+                [self.admin_user.pk, self.owner_ids],
+            )
+            booking_capacity_service.rebuild_capacity_buckets(owner_ids=self.owner_ids)
+            cursor.execute(
+                "ANALYZE bookings_bookingprojection, bookings_bookingevent, "
+                "bookings_bookingcapacitybucket;"
+            )
+            self.booking_keys = list(
+                BookingProjection.objects.filter(owner_id__in=self.owner_ids)
+                .order_by("?")
+                .values_list("owner_id", "booking_key")[:1_000]
+            )
+        # the seeded owners are new, but staff listings now include them
+        booking_projection_service.invalidate_booking_cache()
+
+    def _delete_seeded_rows(self):
+        for client in self.clients.values():
+            client.logout()
+        ids = list(
+            User.objects.filter(username__startswith=USERNAME_PREFIX).values_list(
+                "id", flat=True
+            )
+        )
+        booking_keys = BookingEvent.objects.filter(user_id__in=ids).values(
+            "booking_key"
+        )
+        with transaction.atomic():
+            BookingOutbox.objects.filter(booking_key__in=booking_keys).delete()
+            BookingSnapshot.objects.filter(booking_key__in=booking_keys).delete()
+            BookingStream.objects.filter(booking_key__in=booking_keys).delete()
+            BookingEvent.objects.filter(booking_key__in=booking_keys).delete()
+            BookingProjection.objects.filter(owner_id__in=ids).delete()
+            # capacity buckets cascade
+            User.objects.filter(id__in=ids).delete()
+        booking_projection_service.invalidate_booking_cache()
+
+    def _benchmarks(self):
+        # the first literal allowed host; DEBUG allows localhost when none is set
+        host = next(
+            (host for host in settings.ALLOWED_HOSTS if host[0] not in "*."),
+            "localhost",
+        )
+        # log every user in up front so no measured call pays for a login
+        for user in User.objects.filter(pk__in=[self.admin_user.pk, *self.owner_ids]):
+            self.clients[user.pk] = APIClient(SERVER_NAME=host)
+            self.clients[user.pk].force_login(user)
+
+        def request(method, user_id, url, data=None):
+            response = getattr(self.clients[user_id], method)(url, data, format="json")
+            if response.status_code >= 400:
+                raise CommandError(
+                    f"{method.upper()} {url} returned {response.status_code}: "
+                    f"{response.data}"
+                )
+
+        def owner():
+            return self.rng.choice(self.owner_ids)
+
+        def starts_at():
+            return self.starts_at + timezone.timedelta(
+                hours=self.rng.randrange(self.bookings_per_user)
+            )
+
+        def create_data():
+            value = starts_at()
+            return {
+                "starts_at": value,
+                "ends_at": value + timezone.timedelta(hours=1),
+                "applicants": 1,
+            }
+
+        def create():
+            result = booking_handler.handle_create(
+                user=User(pk=owner()), data=create_data()
+            )
+            if result.is_error():
+                raise CommandError(f"handle_create failed: {result.unwrap_error()}")
+
+        def remaining_capacity():
+            value = starts_at()
+            booking_projection_service.query_remaining_capacity(
+                starts_at=value,
+                ends_at=value + timezone.timedelta(hours=1),
+                user_id=owner(),
+            )
+
+        def retrieve():
+            owner_id, booking_key = self.rng.choice(self.booking_keys)
+            request("get", owner_id, f"/api/bookings/{booking_key}/")
+
+        return [
+            (
+                "service.handle_list.owner",
+                lambda: booking_handler.handle_list(user=User(pk=owner())),
+            ),
+            (
+                "service.handle_list.staff",
+                lambda: booking_handler.handle_list(user=self.admin_user),
+            ),
+            ("service.handle_create", create),
+            (
+                "service.handle_list_availability",
+                lambda: booking_handler.handle_list_availability(
+                    date=starts_at().date(), user_id=owner()
+                ),
+            ),
+            ("service.query_remaining_capacity", remaining_capacity),
+            ("api.list.owner", lambda: request("get", owner(), "/api/bookings/")),
+            (
+                "api.list.staff",
+                lambda: request("get", self.admin_user.pk, "/api/bookings/"),
+            ),
+            ("api.retrieve", retrieve),
+            (
+                "api.create",
+                lambda: request("post", owner(), "/api/bookings/", create_data()),
+            ),
+            (
+                "api.availability",
+                lambda: request(
+                    "get",
+                    owner(),
+                    "/api/availability/segments/",
+                    {"date_utc": starts_at().date().isoformat()},
+                ),
+            ),
+        ]
+
+    def _measure(self, call, iterations):
+        timings = []
+        queries = []
+        for _ in range(iterations):
+            # reads may go to a replica's connection (see utils.db_router)
+            with contextlib.ExitStack() as stack:
+                captured = [
+                    stack.enter_context(CaptureQueriesContext(database))
+                    for database in connections.all()
+                ]
+                started_at = time.perf_counter()
+                call()
+                timings.append(time.perf_counter() - started_at)
+            queries.append(sum(len(context) for context in captured))
+        percentiles = statistics.quantiles(timings, n=100, method="inclusive")
+        return {
+            "calls": iterations,
+            "p50_ms": percentiles[49] * 1000,
+            "p95_ms": percentiles[94] * 1000,
+            "p99_ms": percentiles[98] * 1000,
+            "queries_per_call": statistics.mean(queries),
+            "calls_per_second": iterations / sum(timings),
+        }
+
+    def _write_result(self, name, result):
+        self.stdout.write(
+            f"{name:<36} p50 {result['p50_ms']:8.2f} ms  "
+            f"p95 {result['p95_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+            f"{result['queries_per_call']:5.1f} queries  "
+            f"{result['calls_per_second']:8.1f} calls/s"
+        )
@@ -0,0 +1,223 @@
+import itertools
+import json
+import random
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from ...models import (
+    BookingEvent,
+    BookingOutbox,
+    BookingProjection,
+    BookingSnapshot,
+    BookingStream,
+    User,
+)
+from ...services import (
+    booking_group_commit_service,
+    booking_handler,
+    booking_projection_service,
+)
+
+USERNAME_PREFIX = "benchmark-group-commit-"
+
+
+class Command(BaseCommand):
+    help = (
+        "Create bookings from concurrent threads, committing each on its own and "
+        "then with group commit, and report p50/p95/p99 latency and throughput "
+        "of both at each concurrency. Created rows are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            nargs="+",
+            default=[1, 8, 32, 64],
+            help="Threads creating bookings at once, one run per value.",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=5.0, help="Seconds per run."
+        )
+        parser.add_argument(
+            "--window",
+            type=float,
+            default=None,
+            help="BOOKING_GROUP_COMMIT_WINDOW for the group commit runs.",
+        )
+        parser.add_argument(
+            "--same-slot",
+            action="store_true",
+            help="Have every thread book the same hour, so writes contend for one "
+            "slot's row locks; writes past its capacity are rejected.",
+        )
+        parser.add_argument(
+            "--min-throughput",
+            type=float,
+            default=None,
+            help="Fail when any run completes fewer requests per second.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output",
+            default=None,
+            help="Write the report as JSON to this path.",
+        )
+
+    def handle(self, *args, **options):
+        if min(options["concurrency"]) < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError(
+                f"Users named {USERNAME_PREFIX}* already exist; delete them first."
+            )
+        self.rng = random.Random(options["seed"])
+        self.starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            minute=0, second=0, microsecond=0
+        )
+        users = User.objects.bulk_create(
+            User(username=f"{USERNAME_PREFIX}{i}")
+            for i in range(max(options["concurrency"]))
+        )
+        group_commit = {"BOOKING_GROUP_COMMIT": True}
+        if options["window"] is not None:
+            group_commit["BOOKING_GROUP_COMMIT_WINDOW"] = options["window"]
+        results = {}
+        try:
+            for concurrency in options["concurrency"]:
+                results[concurrency] = {}
+                for mode, overrides in (
+                    ("per_request", {"BOOKING_GROUP_COMMIT": False}),
+                    ("group_commit", group_commit),
+                ):
+                    with override_settings(**overrides):
+                        result = self._run(
+                            users[:concurrency],
+                            options["duration"],
+                            options["same_slot"],
+                        )
+                    booking_group_commit_service.stop()
+                    results[concurrency][mode] = result
+                    self._write_result(mode, concurrency, result)
+        finally:
+            self._delete_created_rows()
+
+        slow = [
+            f"{mode} x{concurrency}"
+            for concurrency, modes in results.items()
+            for mode, result in modes.items()
+            if options["min_throughput"] is not None
+            and result["requests_per_second"] < options["min_throughput"]
+        ]
+
+        if options["output"]:
+            report = {
+                "started_at": timezone.now().isoformat(),
+                "duration": options["duration"],
+                "results": results,
+            }
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        if slow:
+            raise CommandError(
+                f"Below {options['min_throughput']} requests/s: {', '.join(slow)}."
+            )
+
+    def _run(self, users, duration, same_slot=False):
+        deadline = time.perf_counter() + duration
+        latencies = []
+        errors = []
+        if same_slot:
+            # one user's first hour, so every write waits on the same bucket row
+            users = [users[0]] * len(users)
+            hours = [itertools.repeat(0) for _ in users]
+        else:
+            # every thread books hours of its own user, so that runs never
+            # compete for capacity and only commits differ
+            hours = [iter(self.rng.sample(range(24 * 365), 24 * 365)) for _ in users]
+
+        def worker(user, hours):
+            try:
+                for hour in hours:
+                    if time.perf_counter() >= deadline:
+                        break
+                    starts_at = self.starts_at + timezone.timedelta(hours=hour)
+                    started_at = time.perf_counter()
+                    result = booking_handler.handle_create(
+                        user=user,
+                        data={
+                            "starts_at": starts_at,
+                            "ends_at": starts_at + timezone.timedelta(minutes=30),
+                            "applicants": 1,
+                        },
+                    )
+                    if result.is_error():
+                        errors.append(result.error)
+                    else:
+                        latencies.append(time.perf_counter() - started_at)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(user, user_hours))
+            for user, user_hours in zip(users, hours)
+        ]
+        started_at = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started_at
+        result = {
+            "writes": len(latencies) + len(errors),
+            "errors": len(errors),
+            "writes_per_second": len(latencies) / elapsed,
+            "requests_per_second": (len(latencies) + len(errors)) / elapsed,
+        }
+        if len(latencies) >= 2:
+            percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+            result.update(
+                p50_ms=percentiles[49] * 1000,
+                p95_ms=percentiles[94] * 1000,
+                p99_ms=percentiles[98] * 1000,
+            )
+        return result
+
+    def _write_result(self, mode, concurrency, result):
+        latency = (
+            f"p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+            f"p99 {result['p99_ms']:8.2f} ms"
+            if "p50_ms" in result
+            else "no successful writes"
+        )
+        self.stdout.write(
+            f"{mode:<12} x{concurrency:<4} {latency}  "
+            f"{result['writes_per_second']:8.1f} writes/s  "
+            f"{result['requests_per_second']:8.1f} requests/s  "
+            f"{result['errors']:,} errors"
+        )
+
+    def _delete_created_rows(self):
+        ids = list(
+            User.objects.filter(username__startswith=USERNAME_PREFIX).values_list(
+                "id", flat=True
+            )
+        )
+        booking_keys = BookingEvent.objects.filter(user_id__in=ids).values(
+            "booking_key"
+        )
+        with transaction.atomic():
+            BookingOutbox.objects.filter(booking_key__in=booking_keys).delete()
+            BookingSnapshot.objects.filter(booking_key__in=booking_keys).delete()
+            BookingStream.objects.filter(booking_key__in=booking_keys).delete()
+            BookingEvent.objects.filter(booking_key__in=booking_keys).delete()
+            BookingProjection.objects.filter(owner_id__in=ids).delete()
+            # capacity buckets cascade
+            User.objects.filter(id__in=ids).delete()
+        booking_projection_service.invalidate_booking_cache()
@@ -0,0 +1,94 @@
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from utils.renderers import ORJSONRenderer
+
+from ... import views
+from ...models import BookingProjection
+from ...services import booking_handler
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rendering read responses through their DRF serializers and "
+        "JSONRenderer with rendering the handler results directly with "
+        "ORJSONRenderer, on synthetic responses of --rows rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            nargs="+",
+            default=[10_000],
+            help="Rows per response (bookings per list page, availability rows, "
+            "retrieved bookings).",
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        for rows in options["rows"]:
+            bookings = self._bookings(rows)
+            page = booking_handler.BookingPage(results=bookings, next="cursor")
+            availability = [
+                booking_handler.BookingAvailability(index=index % 24, remaining=index)
+                for index in range(rows)
+            ]
+            benchmarks = {
+                "list": (
+                    lambda: JSONRenderer().render(
+                        views.BookingPageSerializer(page).data
+                    ),
+                    lambda: ORJSONRenderer().render(page),
+                ),
+                "retrieve": (
+                    lambda: [
+                        JSONRenderer().render(views.BookingSerializer(booking).data)
+                        for booking in bookings
+                    ],
+                    lambda: [ORJSONRenderer().render(booking) for booking in bookings],
+                ),
+                "availability": (
+                    lambda: JSONRenderer().render(
+                        views.BookingAvailabilitySerializer(
+                            availability, many=True
+                        ).data
+                    ),
+                    lambda: ORJSONRenderer().render(availability),
+                ),
+            }
+            for name, (serialized, direct) in benchmarks.items():
+                before = self._measure(serialized, options["repeat"])
+                after = self._measure(direct, options["repeat"])
+                self.stdout.write(
+                    f"{name:<12} {rows:>7,} rows: "
+                    f"serializer + JSONRenderer {before * 1000:9.2f} ms, "
+                    f"ORJSONRenderer {after * 1000:8.2f} ms "
+                    f"({before / after:5.1f}x)"
+                )
+
+    def _bookings(self, rows):
+        starts_at = timezone.now().replace(minute=0, second=0, microsecond=0)
+        return [
+            {
+                "booking_key": uuid.uuid4(),
+                "starts_at": starts_at + timezone.timedelta(hours=index),
+                "ends_at": starts_at + timezone.timedelta(hours=index + 1),
+                "applicants": index % 1_000 + 1,
+                "status": BookingProjection.Status.PENDING.value,
+                "version": 1,
+            }
+            for index in range(rows)
+        ]
+
+    def _measure(self, render, repeat):
+        timings = []
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            render()
+            timings.append(time.perf_counter() - started_at)
+        return statistics.median(timings)
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services import booking_event_partition_service
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the monthly booking event partitions of the coming months, and "
+        "of any month whose events landed in the default partition. Run it at "
+        "least monthly, e.g. from cron; `migrate` also runs it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=settings.BOOKING_EVENT_PARTITIONS_AHEAD,
+            help="Months after the current one to create partitions for.",
+        )
+
+    def handle(self, *args, **options):
+        if options["months_ahead"] < 0:
+            raise CommandError("--months-ahead must not be negative.")
+        if not booking_event_partition_service.is_partitioned():
+            raise CommandError("The booking event table is not partitioned.")
+        created = booking_event_partition_service.ensure_partitions(
+            months_ahead=options["months_ahead"]
+        )
+        for partition in created:
+            self.stdout.write(f"Created {partition.name}.")
+        self.stdout.write(self.style.SUCCESS(f"Created {len(created)} partition(s)."))
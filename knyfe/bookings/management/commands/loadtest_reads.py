@@ -0,0 +1,244 @@
+import asyncio
+import datetime
+import json
+import random
+import statistics
+import time
+import urllib.parse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.utils import timezone
+
+from ...models import BookingProjection, User
+
+# (synchronous path, async path) of each read endpoint
+ENDPOINTS = {
+    "availability": (
+        "/api/availability/segments/",
+        "/api/async/availability/segments/",
+    ),
+    "list": ("/api/bookings/", "/api/async/bookings/"),
+    "retrieve": ("/api/bookings/{}/", "/api/async/bookings/{}/"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test a read endpoint on a WSGI server and on an ASGI server at "
+        "increasing concurrency, and report throughput, latency and errors of "
+        "each. Start the servers first, e.g. `gunicorn knyfe.wsgi -b :8000 "
+        "--threads 8` and `uvicorn knyfe.asgi:application --port 8001`; both "
+        "must use this command's database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--wsgi-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--asgi-url", default="http://127.0.0.1:8001")
+        parser.add_argument(
+            "--endpoint", choices=sorted(ENDPOINTS), default="availability"
+        )
+        parser.add_argument(
+            "--username",
+            required=True,
+            help="User the requests authenticate as.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            nargs="+",
+            default=[10, 50, 200, 500],
+            help="Connections kept busy at once, one run per value.",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=10.0, help="Seconds per run."
+        )
+        parser.add_argument(
+            "--timeout", type=float, default=30.0, help="Seconds per request."
+        )
+        parser.add_argument(
+            "--dates",
+            type=int,
+            default=365,
+            help="Distinct availability dates requested, so that most requests "
+            "miss the availability cache.",
+        )
+        parser.add_argument(
+            "--servers",
+            nargs="+",
+            choices=["wsgi", "asgi"],
+            default=["wsgi", "asgi"],
+            help="Servers to load, e.g. only wsgi to compare settings profiles.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output",
+            default=None,
+            help="Write the report as JSON to this path.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist.")
+        if options["endpoint"] == "retrieve":
+            self.booking_keys = list(
+                BookingProjection.objects.filter(owner_id=user.pk).values_list(
+                    "booking_key", flat=True
+                )[:1_000]
+            )
+            if not self.booking_keys:
+                raise CommandError(f"{user.username} has no bookings to retrieve.")
+        self.rng = random.Random(options["seed"])
+        self.first_date = timezone.now().date()
+        self.dates = options["dates"]
+
+        client = Client()
+        client.force_login(user)
+        session_key = client.session.session_key
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={session_key}"
+        results = {}
+        try:
+            for server, url, path in (
+                ("wsgi", options["wsgi_url"], ENDPOINTS[options["endpoint"]][0]),
+                ("asgi", options["asgi_url"], ENDPOINTS[options["endpoint"]][1]),
+            ):
+                if server not in options["servers"]:
+                    continue
+                results[server] = {}
+                for concurrency in options["concurrency"]:
+                    result = asyncio.run(
+                        self._run(
+                            url,
+                            path,
+                            endpoint=options["endpoint"],
+                            concurrency=concurrency,
+                            duration=options["duration"],
+                            timeout=options["timeout"],
+                        )
+                    )
+                    results[server][concurrency] = result
+                    self._write_result(server, concurrency, result)
+        finally:
+            client.logout()
+
+        if options["output"]:
+            report = {
+                "started_at": timezone.now().isoformat(),
+                "endpoint": options["endpoint"],
+                "duration": options["duration"],
+                "results": results,
+            }
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+    def _target(self, endpoint: str, path: str) -> str:
+        if endpoint == "retrieve":
+            return path.format(self.rng.choice(self.booking_keys))
+        if endpoint == "list":
+            return path
+        date = self.first_date + datetime.timedelta(days=self.rng.randrange(self.dates))
+        return f"{path}?{urllib.parse.urlencode({'date_utc': date.isoformat()})}"
+
+    async def _run(self, url, path, endpoint, concurrency, duration, timeout):
+        deadline = time.perf_counter() + duration
+        latencies = []
+        errors = []
+
+        async def worker():
+            connection = None
+            while time.perf_counter() < deadline:
+                started_at = time.perf_counter()
+                try:
+                    if connection is None:
+                        connection = await _open(url, timeout)
+                    status, keep_alive = await asyncio.wait_for(
+                        _get(
+                            connection, url, self._target(endpoint, path), self.cookie
+                        ),
+                        timeout,
+                    )
+                except (OSError, EOFError, asyncio.TimeoutError, ValueError) as e:
+                    errors.append(type(e).__name__)
+                    connection = _close(connection)
+                    continue
+                if status != 200:
+                    errors.append(str(status))
+                else:
+                    latencies.append(time.perf_counter() - started_at)
+                if not keep_alive:
+                    connection = _close(connection)
+            _close(connection)
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started_at
+        result = {
+            "requests": len(latencies) + len(errors),
+            "errors": len(errors),
+            "error_kinds": sorted(set(errors)),
+            "requests_per_second": len(latencies) / elapsed,
+        }
+        if len(latencies) >= 2:
+            percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+            result.update(
+                p50_ms=percentiles[49] * 1000,
+                p95_ms=percentiles[94] * 1000,
+                p99_ms=percentiles[98] * 1000,
+            )
+        return result
+
+    def _write_result(self, server, concurrency, result):
+        latency = (
+            f"p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+            f"p99 {result['p99_ms']:8.2f} ms"
+            if "p50_ms" in result
+            else "no successful requests"
+        )
+        self.stdout.write(
+            f"{server} x{concurrency:<5} {result['requests_per_second']:8.1f} req/s  "
+            f"{latency}  {result['errors']} errors"
+            + (f" ({', '.join(result['error_kinds'])})" if result["errors"] else "")
+        )
+
+
+async def _open(url: str, timeout: float):
+    parsed = urllib.parse.urlsplit(url)
+    return await asyncio.wait_for(
+        asyncio.open_connection(parsed.hostname, parsed.port or 80), timeout
+    )
+
+
+def _close(connection) -> None:
+    if connection is not None:
+        connection[1].close()
+
+
+async def _get(connection, url: str, target: str, cookie: str):
+    """status of an HTTP/1.1 GET over a kept-alive connection, and whether the
+    connection can be reused"""
+    reader, writer = connection
+    host = urllib.parse.urlsplit(url).netloc
+    writer.write(
+        f"GET {target} HTTP/1.1\r\nHost: {host}\r\nCookie: {cookie}\r\n\r\n".encode()
+    )
+    await writer.drain()
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    status = int(head[0].split(" ", 2)[1])
+    headers = {
+        name.strip().lower(): value.strip()
+        for name, _, value in (line.partition(":") for line in head[1:] if line)
+    }
+    keep_alive = headers.get("connection", "").lower() != "close"
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        while size := int((await reader.readuntil(b"\r\n")).split(b";")[0], 16):
+            await reader.readexactly(size + 2)
+        await reader.readuntil(b"\r\n")
+    else:
+        await reader.read()
+        keep_alive = False
+    return status, keep_alive
@@ -0,0 +1,58 @@
+import io
+import pstats
+
+from django.core.management.base import BaseCommand, CommandError
+from utils import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        "List the request profiles captured under PROFILING_DIR, newest first, "
+        "and summarize their hottest functions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--route",
+            default=None,
+            help="Only profiles whose request path contains this text.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=20,
+            help="Newest profiles to list and summarize.",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=20,
+            help="Hottest functions to print across the selected profiles.",
+        )
+        parser.add_argument(
+            "--sort",
+            choices=["tottime", "cumulative", "ncalls"],
+            default="tottime",
+        )
+
+    def handle(self, *args, **options):
+        profiles = [
+            info
+            for info in profiling.list_profiles()
+            if options["route"] is None or options["route"] in info.route
+        ][: options["limit"]]
+        if not profiles:
+            raise CommandError("No profiles captured.")
+
+        for info in profiles:
+            self.stdout.write(
+                f"{info.captured_at:%Y-%m-%d %H:%M:%S} {info.method:<6} "
+                f"{info.status} {info.elapsed_ms:>6} ms  {info.route}"
+            )
+        if options["top"] <= 0:
+            return
+
+        output = io.StringIO()
+        stats = pstats.Stats(*(info.path for info in profiles), stream=output)
+        stats.strip_dirs().sort_stats(options["sort"]).print_stats(options["top"])
+        self.stdout.write(output.getvalue(), ending="")
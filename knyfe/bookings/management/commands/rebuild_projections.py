@@ -0,0 +1,130 @@
+import multiprocessing
+import queue
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from ...services import booking_replay_service
+
+
+def _replay_partition(partition, partitions, chunk_size, report):
+    """fold and stage one booking_key hash partition of the event log"""
+    states = booking_replay_service.fold_events(
+        booking_replay_service.iter_events(
+            partition=partition,
+            partitions=partitions,
+            chunk_size=chunk_size,
+        ),
+        progress=lambda count: report(("progress", partition, count)),
+    )
+    report(("done", partition, booking_replay_service.copy_states_to_staging(states)))
+
+
+def _replay_partition_process(partition, partitions, chunk_size, messages):
+    connections.close_all()
+    try:
+        _replay_partition(partition, partitions, chunk_size, messages.put)
+    except Exception as e:
+        messages.put(("error", partition, repr(e)))
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild booking projections and capacity buckets by replaying the "
+        "booking event log. Stop writers before running."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10_000,
+            help="Events fetched per server-side cursor round trip.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Worker processes, each replaying one booking_key hash partition.",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        if workers < 1:
+            raise CommandError("--workers must be at least 1.")
+        self.started_at = time.monotonic()
+        self.progress = {}
+        errors = []
+
+        def handle_message(message):
+            kind, partition, value = message
+            if kind == "progress":
+                self.progress[partition] = value
+                self._write_progress(partition)
+            elif kind == "error":
+                errors.append(f"worker {partition}: {value}")
+
+        booking_replay_service.create_staging_table()
+        try:
+            if workers == 1:
+                _replay_partition(0, 1, options["chunk_size"], handle_message)
+            else:
+                self._run_workers(workers, options["chunk_size"], handle_message)
+            if errors:
+                raise CommandError("; ".join(errors))
+            with transaction.atomic():
+                count = booking_replay_service.swap_staging_table()
+        except booking_replay_service.PendingEvents:
+            raise CommandError(
+                "Events are still waiting for the projector; run run_projector "
+                "until the outbox is empty, then rebuild again."
+            )
+        finally:
+            booking_replay_service.drop_staging_table()
+
+        elapsed = time.monotonic() - self.started_at
+        events = sum(self.progress.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Replayed {events:,} events into {count:,} projections in "
+                f"{elapsed:.1f}s ({events / max(elapsed, 1e-9):,.0f} rows/s)."
+            )
+        )
+
+    def _run_workers(self, workers, chunk_size, handle_message):
+        context = multiprocessing.get_context("fork")
+        messages = context.Queue()
+        connections.close_all()
+        processes = [
+            context.Process(
+                target=_replay_partition_process,
+                args=(partition, workers, chunk_size, messages),
+            )
+            for partition in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        finished = 0
+        while finished < workers:
+            try:
+                message = messages.get(timeout=1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    raise CommandError("A replay worker exited without reporting.")
+                continue
+            handle_message(message)
+            if message[0] != "progress":
+                finished += 1
+        for process in processes:
+            process.join()
+
+    def _write_progress(self, partition):
+        elapsed = time.monotonic() - self.started_at
+        events = sum(self.progress.values())
+        self.stdout.write(
+            f"[worker {partition}] {self.progress[partition]:,} events; "
+            f"total {events:,} events ({events / max(elapsed, 1e-9):,.0f} rows/s)"
+        )
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from ...services import booking_projector_service
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply booking events appended with BOOKING_PROJECTION_MODE=async to the "
+        "projections. Runs until interrupted unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--name",
+            default="default",
+            help="Checkpoint name; projectors sharing a name take turns.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait for a NOTIFY wakeup before polling again.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the outbox is drained.",
+        )
+
+    def handle(self, *args, **options):
+        self.applied = 0
+
+        def on_batch(applied):
+            self.applied += applied
+            self.stdout.write(f"Applied {applied} event(s), {self.applied} in total.")
+
+        try:
+            booking_projector_service.run(
+                name=options["name"],
+                batch_size=options["batch_size"],
+                poll_interval=options["poll_interval"],
+                once=options["once"],
+                on_batch=on_batch,
+            )
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Applied {self.applied} event(s)."))
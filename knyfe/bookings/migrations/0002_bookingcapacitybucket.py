@@ -0,0 +1,46 @@
+# Generated by Django 4.2.16 on 2026-10-17 10:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingCapacityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('starts_at', models.DateTimeField()),
+                ('applicants', models.IntegerField(default=0)),
+                ('owner', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'bookings_bookingcapacitybucket',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bookingcapacitybucket',
+            constraint=models.UniqueConstraint(fields=('owner', 'starts_at'), name='bookings_capacitybucket_owner_starts_at_uniq'),
+        ),
+        migrations.RunSQL(
+            sql="""
+INSERT INTO bookings_bookingcapacitybucket (owner_id, starts_at, applicants)
+SELECT b.owner_id, h.starts_at, SUM(b.applicants)
+FROM bookings_bookingprojection b
+CROSS JOIN LATERAL generate_series(
+    date_trunc('hour', b.starts_at),
+    b.ends_at - interval '1 microsecond',
+    interval '1 hour'
+) AS h(starts_at)
+WHERE b.status = 'APPROVED'
+GROUP BY b.owner_id, h.starts_at;
+""",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
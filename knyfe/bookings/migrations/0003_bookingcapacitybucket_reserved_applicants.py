@@ -0,0 +1,35 @@
+# Generated by Django 4.2.16 on 2026-10-17 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0002_bookingcapacitybucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookingcapacitybucket',
+            name='reserved_applicants',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunSQL(
+            sql="""
+INSERT INTO bookings_bookingcapacitybucket
+    (owner_id, starts_at, applicants, reserved_applicants)
+SELECT b.owner_id, h.starts_at, 0, SUM(b.applicants)
+FROM bookings_bookingprojection b
+CROSS JOIN LATERAL generate_series(
+    date_trunc('hour', b.starts_at),
+    b.ends_at - interval '1 microsecond',
+    interval '1 hour'
+) AS h(starts_at)
+GROUP BY b.owner_id, h.starts_at
+ON CONFLICT (owner_id, starts_at) DO UPDATE
+SET reserved_applicants = EXCLUDED.reserved_applicants;
+""",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.16 on 2026-10-17 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0003_bookingcapacitybucket_reserved_applicants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookingevent',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='bookingprojection',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunSQL(
+            sql="""
+UPDATE bookings_bookingevent e
+SET version = v.version
+FROM (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY booking_key ORDER BY id) AS version
+    FROM bookings_bookingevent
+) v
+WHERE e.id = v.id;
+
+UPDATE bookings_bookingprojection p
+SET version = v.version
+FROM (
+    SELECT booking_key, MAX(version) AS version
+    FROM bookings_bookingevent
+    GROUP BY booking_key
+) v
+WHERE p.booking_key = v.booking_key;
+""",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='bookingevent',
+            constraint=models.UniqueConstraint(fields=('booking_key', 'version'), name='bookings_bookingevent_booking_key_version_uniq'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.16 on 2026-10-17 10:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_booking_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('booking_key', models.UUIDField()),
+                ('version', models.PositiveIntegerField()),
+                ('event_id', models.BigIntegerField()),
+                ('timestamp', models.DateTimeField()),
+                ('state', models.JSONField()),
+            ],
+            options={
+                'db_table': 'bookings_bookingsnapshot',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bookingsnapshot',
+            constraint=models.UniqueConstraint(fields=('booking_key', 'version'), name='bookings_bookingsnapshot_booking_key_version_uniq'),
+        ),
+    ]
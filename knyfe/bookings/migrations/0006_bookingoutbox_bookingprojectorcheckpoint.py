@@ -0,0 +1,36 @@
+# Generated by Django 4.2.16 on 2026-10-17 10:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_bookingsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.BigIntegerField(unique=True)),
+                ('booking_key', models.UUIDField()),
+            ],
+            options={
+                'db_table': 'bookings_bookingoutbox',
+            },
+        ),
+        migrations.CreateModel(
+            name='BookingProjectorCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'bookings_bookingprojectorcheckpoint',
+            },
+        ),
+    ]
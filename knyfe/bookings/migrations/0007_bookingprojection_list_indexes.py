@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-17 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_bookingoutbox_bookingprojectorcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookingprojection',
+            index=models.Index(fields=['owner', 'starts_at', 'id'], name='bookings_proj_owner_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingprojection',
+            index=models.Index(fields=['starts_at', 'id'], name='bookings_proj_starts_at_id_idx'),
+        ),
+    ]
@@ -0,0 +1,162 @@
+# Generated by Django 4.2.16 on 2026-10-17 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0007_bookingprojection_list_indexes'),
+    ]
+
+    # Postgres only allows unique constraints on a partitioned table if they
+    # include the partition key, so (booking_key, version) uniqueness moves to
+    # bookings_bookingstream, seeded with each booking's latest version. The
+    # table is rebuilt as monthly range partitions of `timestamp`, covering the
+    # existing events through three months ahead; `manage.py
+    # create_event_partitions` keeps creating them. Events outside every month
+    # land in the default partition until their month is created.
+    # Reversing restores a plain table from the partitions still attached;
+    # archived months are not read back.
+    operations = [
+        migrations.CreateModel(
+            name='BookingEventArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('partition', models.CharField(max_length=63, unique=True)),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField()),
+                ('filename', models.CharField(max_length=255)),
+                ('events', models.BigIntegerField()),
+                ('sha256', models.CharField(max_length=64)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'bookings_bookingeventarchive',
+            },
+        ),
+        migrations.CreateModel(
+            name='BookingStream',
+            fields=[
+                ('booking_key', models.UUIDField(primary_key=True, serialize=False)),
+                ('version', models.PositiveIntegerField()),
+            ],
+            options={
+                'db_table': 'bookings_bookingstream',
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name='bookingevent',
+            name='bookings_bookingevent_booking_key_version_uniq',
+        ),
+        migrations.RunSQL(
+            sql="""
+ALTER TABLE bookings_bookingevent RENAME TO bookings_bookingevent_unpartitioned;
+ALTER INDEX bookings_bookingevent_pkey
+RENAME TO bookings_bookingevent_unpartitioned_pkey;
+ALTER INDEX bookings_bookingevent_booking_key_560b7184
+RENAME TO bookings_bookingevent_unpartitioned_booking_key;
+ALTER SEQUENCE bookings_bookingevent_id_seq
+RENAME TO bookings_bookingevent_unpartitioned_id_seq;
+
+CREATE TABLE bookings_bookingevent (
+    id bigint GENERATED BY DEFAULT AS IDENTITY,
+    user_id integer NOT NULL,
+    booking_key uuid NOT NULL,
+    event_type varchar(10) NOT NULL,
+    "timestamp" timestamp with time zone NOT NULL,
+    data jsonb NOT NULL,
+    version integer NOT NULL
+        CONSTRAINT bookings_bookingevent_version_check CHECK (version >= 0),
+    PRIMARY KEY (id, "timestamp")
+) PARTITION BY RANGE ("timestamp");
+
+CREATE TABLE bookings_bookingevent_default
+PARTITION OF bookings_bookingevent DEFAULT;
+
+DO $$
+DECLARE
+    month timestamp := date_trunc(
+        'month',
+        COALESCE(
+            (SELECT min("timestamp") FROM bookings_bookingevent_unpartitioned),
+            now()
+        ) AT TIME ZONE 'UTC'
+    );
+    last_month timestamp :=
+        date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months';
+BEGIN
+    WHILE month <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF bookings_bookingevent '
+            'FOR VALUES FROM (%L) TO (%L)',
+            'bookings_bookingevent_p' || to_char(month, 'YYYYMM'),
+            month AT TIME ZONE 'UTC',
+            (month + interval '1 month') AT TIME ZONE 'UTC'
+        );
+        month := month + interval '1 month';
+    END LOOP;
+END
+$$;
+
+INSERT INTO bookings_bookingevent (
+    id, user_id, booking_key, event_type, "timestamp", data, version
+)
+SELECT id, user_id, booking_key, event_type, "timestamp", data, version
+FROM bookings_bookingevent_unpartitioned;
+
+SELECT setval(
+    pg_get_serial_sequence('bookings_bookingevent', 'id'),
+    COALESCE((SELECT max(id) FROM bookings_bookingevent_unpartitioned), 0) + 1,
+    false
+);
+
+CREATE INDEX bookings_bookingevent_booking_key_560b7184
+ON bookings_bookingevent (booking_key);
+
+INSERT INTO bookings_bookingstream (booking_key, version)
+SELECT booking_key, max(version)
+FROM bookings_bookingevent_unpartitioned
+GROUP BY booking_key;
+
+DROP TABLE bookings_bookingevent_unpartitioned;
+""",
+            reverse_sql="""
+ALTER TABLE bookings_bookingevent RENAME TO bookings_bookingevent_partitioned;
+ALTER INDEX bookings_bookingevent_pkey
+RENAME TO bookings_bookingevent_partitioned_pkey;
+ALTER INDEX bookings_bookingevent_booking_key_560b7184
+RENAME TO bookings_bookingevent_partitioned_booking_key;
+ALTER SEQUENCE bookings_bookingevent_id_seq
+RENAME TO bookings_bookingevent_partitioned_id_seq;
+
+CREATE TABLE bookings_bookingevent (
+    id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    user_id integer NOT NULL,
+    booking_key uuid NOT NULL,
+    event_type varchar(10) NOT NULL,
+    "timestamp" timestamp with time zone NOT NULL,
+    data jsonb NOT NULL,
+    version integer NOT NULL
+        CONSTRAINT bookings_bookingevent_version_check CHECK (version >= 0)
+);
+
+INSERT INTO bookings_bookingevent (
+    id, user_id, booking_key, event_type, "timestamp", data, version
+)
+SELECT id, user_id, booking_key, event_type, "timestamp", data, version
+FROM bookings_bookingevent_partitioned;
+
+SELECT setval(
+    pg_get_serial_sequence('bookings_bookingevent', 'id'),
+    COALESCE((SELECT max(id) FROM bookings_bookingevent_partitioned), 0) + 1,
+    false
+);
+
+CREATE INDEX bookings_bookingevent_booking_key_560b7184
+ON bookings_bookingevent (booking_key);
+
+DROP TABLE bookings_bookingevent_partitioned;
+""",
+        ),
+    ]
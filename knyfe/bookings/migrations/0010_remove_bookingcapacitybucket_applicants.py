@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-17 13:48
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0009_bookingevent_partitions'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='bookingcapacitybucket',
+            name='applicants',
+        ),
+    ]
@@ -1,9 +1,21 @@
+from .booking_capacity_bucket import BookingCapacityBucket
 from .booking_event import BookingEvent
+from .booking_event_archive import BookingEventArchive
+from .booking_outbox import BookingOutbox
 from .booking_projection import BookingProjection
+from .booking_projector_checkpoint import BookingProjectorCheckpoint
+from .booking_snapshot import BookingSnapshot
+from .booking_stream import BookingStream
 from .user import User
 
 __all__ = [
     "User",
     "BookingEvent",
     "BookingProjection",
+    "BookingCapacityBucket",
+    "BookingSnapshot",
+    "BookingOutbox",
+    "BookingProjectorCheckpoint",
+    "BookingStream",
+    "BookingEventArchive",
 ]
@@ -0,0 +1,22 @@
+from django.db import models
+
+
+class BookingCapacityBucket(models.Model):
+    """Applicants per owner and hour.
+
+    `reserved_applicants` counts every live booking, pending or approved, and is
+    reserved by `booking_handler` before a write is accepted.
+    """
+
+    owner = models.ForeignKey("User", on_delete=models.CASCADE, db_index=False)
+    starts_at = models.DateTimeField()
+    reserved_applicants = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "bookings_bookingcapacitybucket"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "starts_at"],
+                name="bookings_capacitybucket_owner_starts_at_uniq",
+            ),
+        ]
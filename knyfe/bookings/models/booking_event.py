@@ -2,6 +2,10 @@ from django.db import models
 
 
 class BookingEvent(models.Model):
+    """Appended booking event. The table is range partitioned by month of
+    `timestamp` (see migration 0009); its primary key is (id, timestamp), so
+    versions are kept unique per booking by BookingStream instead."""
+
     class EventType(models.TextChoices):
         CREATED = "CREATED"
         UPDATED = "UPDATED"
@@ -13,6 +17,7 @@ class BookingEvent(models.Model):
         max_length=10,
         choices=EventType.choices,
     )
+    version = models.PositiveIntegerField()
     timestamp = models.DateTimeField()
     data = models.JSONField()
 
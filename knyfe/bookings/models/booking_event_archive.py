@@ -0,0 +1,18 @@
+from django.db import models
+
+
+class BookingEventArchive(models.Model):
+    """Monthly event partition detached from the event table and written to a
+    gzipped CSV file under BOOKING_EVENT_ARCHIVE_DIR, where replays still read
+    it."""
+
+    partition = models.CharField(max_length=63, unique=True)
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+    filename = models.CharField(max_length=255)
+    events = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "bookings_bookingeventarchive"
@@ -0,0 +1,11 @@
+from django.db import models
+
+
+class BookingOutbox(models.Model):
+    """Events appended but not yet applied by the asynchronous projector."""
+
+    event_id = models.BigIntegerField(unique=True)
+    booking_key = models.UUIDField(null=False)
+
+    class Meta:
+        db_table = "bookings_bookingoutbox"
@@ -15,6 +15,18 @@ class BookingProjection(models.Model):
         max_length=10,
         choices=Status.choices,
     )
+    version = models.PositiveIntegerField(default=1)
 
     class Meta:
         db_table = "bookings_bookingprojection"
+        indexes = [
+            # keyset pagination of the booking list, per owner and for staff
+            models.Index(
+                fields=["owner", "starts_at", "id"],
+                name="bookings_proj_owner_start_idx",
+            ),
+            models.Index(
+                fields=["starts_at", "id"],
+                name="bookings_proj_starts_at_id_idx",
+            ),
+        ]
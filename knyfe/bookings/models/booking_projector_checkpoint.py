@@ -0,0 +1,13 @@
+from django.db import models
+
+
+class BookingProjectorCheckpoint(models.Model):
+    """Last event applied by a projector. The row is locked while a batch is
+    applied, so only one projector with the same name is active at a time."""
+
+    name = models.CharField(max_length=50, unique=True)
+    event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "bookings_bookingprojectorcheckpoint"
@@ -0,0 +1,21 @@
+from django.db import models
+
+
+class BookingSnapshot(models.Model):
+    """Folded booking state as of `version`, so replays can skip the events up to
+    and including `event_id`."""
+
+    booking_key = models.UUIDField(null=False)
+    version = models.PositiveIntegerField()
+    event_id = models.BigIntegerField()
+    timestamp = models.DateTimeField()
+    state = models.JSONField()
+
+    class Meta:
+        db_table = "bookings_bookingsnapshot"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["booking_key", "version"],
+                name="bookings_bookingsnapshot_booking_key_version_uniq",
+            ),
+        ]
@@ -0,0 +1,12 @@
+from django.db import models
+
+
+class BookingStream(models.Model):
+    """Latest version appended to a booking's event stream; an append only
+    succeeds with a later version, so no version is appended twice."""
+
+    booking_key = models.UUIDField(primary_key=True)
+    version = models.PositiveIntegerField()
+
+    class Meta:
+        db_table = "bookings_bookingstream"
@@ -0,0 +1,46 @@
+import time
+import typing
+
+from django.core.cache import cache
+
+
+def get_generations(keys: typing.List[str]) -> typing.Dict[str, int]:
+    """current value of each generation stamp, starting a fresh one where the
+    stamp is missing (never set, or evicted)"""
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            generations[key] = reset_generation(key)
+    return generations
+
+
+def reset_generation(key: str, timeout: typing.Optional[int] = None) -> int:
+    """invalidate every cache entry keyed under this generation stamp; a stamp
+    guarding entries that expire may expire with them after `timeout`"""
+    # a fresh timestamp never matches an entry written under an earlier
+    # generation, even if the previous stamp was evicted
+    generation = time.time_ns()
+    cache.set(key, generation, timeout)
+    return generation
+
+
+def reset_generations(
+    keys: typing.List[str], timeout: typing.Optional[int] = None
+) -> None:
+    """reset_generation() for many stamps with one cache write"""
+    cache.set_many(dict.fromkeys(keys, time.time_ns()), timeout)
+
+
+async def aget_generations(keys: typing.List[str]) -> typing.Dict[str, int]:
+    """get_generations() through the async cache API, for the event loop"""
+    generations = await cache.aget_many(keys)
+    for key in keys:
+        if key not in generations:
+            generations[key] = await areset_generation(key)
+    return generations
+
+
+async def areset_generation(key: str, timeout: typing.Optional[int] = None) -> int:
+    generation = time.time_ns()
+    await cache.aset(key, generation, timeout)
+    return generation
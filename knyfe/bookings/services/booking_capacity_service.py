@@ -0,0 +1,396 @@
+import collections
+import datetime
+import functools
+import typing
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import dateparse
+from utils import async_db, db_router
+
+from ..models import BookingCapacityBucket
+from . import booking_cache_service
+
+AVAILABILITY_CACHE_TIMEOUT = 300
+_AVAILABILITY_CACHE_KEY_PREFIX = "bookings:availability:"
+_AVAILABILITY_GENERATION_KEY = f"{_AVAILABILITY_CACHE_KEY_PREFIX}generation"
+
+# process-local availability cache counters
+cache_stats: typing.Counter[str] = collections.Counter()
+
+
+def _booking_hours_sql(starts_at: str, ends_at: str) -> str:
+    """every hour bucket the half-open [starts_at, ends_at) interval overlaps"""
+    return (
+        f"generate_series(date_trunc('hour', {starts_at}), "
+        f"{ends_at} - interval '1 microsecond', interval '1 hour')"
+    )
+
+
+class CapacityDelta(typing.NamedTuple):
+    starts_at: typing.Union[datetime.datetime, str]
+    ends_at: typing.Union[datetime.datetime, str]
+    applicants: int
+
+
+def _to_datetime(value: typing.Union[datetime.datetime, str]) -> datetime.datetime:
+    if isinstance(value, str):
+        return dateparse.parse_datetime(value)
+    return value
+
+
+class OwnerCapacityDelta(typing.NamedTuple):
+    owner_id: int
+    starts_at: typing.Union[datetime.datetime, str]
+    ends_at: typing.Union[datetime.datetime, str]
+    applicants: int
+
+
+def _owner_deltas_params(deltas: typing.List[OwnerCapacityDelta]) -> list:
+    return [
+        [delta.owner_id for delta in deltas],
+        [_to_datetime(delta.starts_at) for delta in deltas],
+        [_to_datetime(delta.ends_at) for delta in deltas],
+        [delta.applicants for delta in deltas],
+    ]
+
+
+_OWNER_DELTAS_SQL = f"""
+SELECT d.owner_id, h.starts_at, SUM(d.applicants) AS applicants
+FROM unnest(%s::int[], %s::timestamptz[], %s::timestamptz[], %s::int[])
+    AS d(owner_id, starts_at, ends_at, applicants)
+CROSS JOIN LATERAL {_booking_hours_sql("d.starts_at", "d.ends_at")} AS h(starts_at)
+GROUP BY d.owner_id, h.starts_at
+HAVING SUM(d.applicants) <> 0
+"""
+
+
+def apply_owner_capacity_deltas(deltas: typing.List[OwnerCapacityDelta]) -> None:
+    """add applicants to the reserved totals of many owners in one statement,
+    without a capacity check: for deltas that only release capacity"""
+    deltas = [delta for delta in deltas if delta.applicants]
+    if not deltas:
+        return
+    query = f"""
+INSERT INTO bookings_bookingcapacitybucket (owner_id, starts_at, reserved_applicants)
+SELECT owner_id, starts_at, applicants
+FROM ({_OWNER_DELTAS_SQL}) AS deltas
+ORDER BY owner_id, starts_at
+ON CONFLICT (owner_id, starts_at) DO UPDATE
+SET reserved_applicants = bookings_bookingcapacitybucket.reserved_applicants
+    + EXCLUDED.reserved_applicants;
+"""
+    with connection.cursor() as cursor:
+        cursor.execute(query, _owner_deltas_params(deltas))
+    for owner_id in {delta.owner_id for delta in deltas}:
+        transaction.on_commit(
+            functools.partial(
+                booking_cache_service.reset_generation,
+                _owner_generation_key(owner_id),
+            )
+        )
+
+
+def booking_hours(
+    starts_at: datetime.datetime, ends_at: datetime.datetime
+) -> typing.List[datetime.datetime]:
+    """_booking_hours_sql() in Python: the UTC hour buckets [starts_at, ends_at)
+    overlaps"""
+    hour = starts_at.astimezone(datetime.timezone.utc).replace(
+        minute=0, second=0, microsecond=0
+    )
+    hours = []
+    while hour < ends_at:
+        hours.append(hour)
+        hour += datetime.timedelta(hours=1)
+    return hours
+
+
+def reserve_capacity_each(
+    owner_id: int,
+    deltas: typing.List[CapacityDelta],
+    capacity: int,
+) -> typing.List[bool]:
+    """reserve positive deltas one after another, skipping each that would take
+    a bucket over capacity; returns which were reserved.
+
+    Every touched bucket is row-locked and read in one statement, the deltas are
+    checked against it in order, and the accepted ones are reserved in a second,
+    so a batch costs two statements however many deltas it holds.
+    """
+    if not deltas:
+        return []
+    query = f"""
+WITH hours AS (
+    SELECT DISTINCT h.starts_at
+    FROM unnest(%s::timestamptz[], %s::timestamptz[]) AS d(starts_at, ends_at)
+    CROSS JOIN LATERAL {_booking_hours_sql("d.starts_at", "d.ends_at")} AS h(starts_at)
+)
+INSERT INTO bookings_bookingcapacitybucket (owner_id, starts_at, reserved_applicants)
+SELECT %s, starts_at, 0
+FROM hours
+ORDER BY starts_at
+ON CONFLICT (owner_id, starts_at) DO UPDATE
+SET reserved_applicants = bookings_bookingcapacitybucket.reserved_applicants
+RETURNING starts_at, reserved_applicants;
+"""
+    starts_at = [_to_datetime(delta.starts_at) for delta in deltas]
+    ends_at = [_to_datetime(delta.ends_at) for delta in deltas]
+    with connection.cursor() as cursor:
+        cursor.execute(query, [starts_at, ends_at, owner_id])
+        reserved = dict(cursor.fetchall())
+    accepted = []
+    for delta, delta_starts_at, delta_ends_at in zip(deltas, starts_at, ends_at):
+        hours = booking_hours(delta_starts_at, delta_ends_at)
+        accepted.append(
+            all(reserved[hour] + delta.applicants <= capacity for hour in hours)
+        )
+        if accepted[-1]:
+            for hour in hours:
+                reserved[hour] += delta.applicants
+    # the buckets are locked, so the reservation cannot overflow any more
+    reserve_capacity(
+        owner_id=owner_id,
+        deltas=[delta for delta, ok in zip(deltas, accepted) if ok],
+        capacity=capacity,
+    )
+    return accepted
+
+
+def reserve_capacity(
+    owner_id: int,
+    deltas: typing.List[CapacityDelta],
+    capacity: int,
+) -> bool:
+    """add applicants to the reserved total of every hour bucket touched by each
+    delta, and report whether every bucket that grew is still within capacity.
+
+    The upsert row-locks only the touched (owner, hour) buckets, in ascending hour
+    order, until the surrounding transaction ends, so concurrent reservations for
+    the same slot serialize while unrelated slots never contend. Callers must roll
+    back the transaction when this returns False.
+    """
+    deltas = [delta for delta in deltas if delta.applicants]
+    if not deltas:
+        return True
+    query = f"""
+WITH deltas AS (
+    SELECT h.starts_at, SUM(d.applicants) AS applicants
+    FROM unnest(%s::timestamptz[], %s::timestamptz[], %s::int[])
+        AS d(starts_at, ends_at, applicants)
+    CROSS JOIN LATERAL {_booking_hours_sql("d.starts_at", "d.ends_at")} AS h(starts_at)
+    GROUP BY h.starts_at
+    HAVING SUM(d.applicants) <> 0
+),
+reserved AS (
+    INSERT INTO bookings_bookingcapacitybucket
+        (owner_id, starts_at, reserved_applicants)
+    SELECT %s, starts_at, applicants
+    FROM deltas
+    ORDER BY starts_at
+    ON CONFLICT (owner_id, starts_at) DO UPDATE
+    SET reserved_applicants = bookings_bookingcapacitybucket.reserved_applicants
+        + EXCLUDED.reserved_applicants
+    RETURNING starts_at, reserved_applicants
+)
+SELECT COUNT(*)
+FROM reserved r
+JOIN deltas d ON d.starts_at = r.starts_at
+WHERE d.applicants > 0 AND r.reserved_applicants > %s;
+"""
+    params = [
+        [_to_datetime(delta.starts_at) for delta in deltas],
+        [_to_datetime(delta.ends_at) for delta in deltas],
+        [delta.applicants for delta in deltas],
+        owner_id,
+        capacity,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        within_capacity = cursor.fetchone()[0] == 0
+    # reserved applicants changed, so every cached availability of the owner is
+    # stale once this commits
+    transaction.on_commit(
+        lambda: booking_cache_service.reset_generation(_owner_generation_key(owner_id))
+    )
+    return within_capacity
+
+
+def query_applicants_by_hour(
+    date: datetime.date,
+    owner_id: int,
+) -> typing.List[typing.Tuple[int, int]]:
+    """reserved applicants, pending or approved, per hour of the day; the
+    capacity creates check against. Read-through: cached per (owner, date) under
+    the owner's generation, which every committed reservation bumps"""
+    key = _availability_cache_key(
+        date=date,
+        owner_id=owner_id,
+        generation=get_availability_generation(owner_id),
+    )
+    data = cache.get(key)
+    if data is not None:
+        cache_stats["hits"] += 1
+        return data
+    cache_stats["misses"] += 1
+    data = _applicants_by_hour(
+        _applicants_by_hour_queryset(date=date, owner_id=owner_id)
+    )
+    # buckets read inside a transaction may be uncommitted or rolled back later
+    if not connection.in_atomic_block:
+        cache.set(key, data, db_router.cache_timeout(AVAILABILITY_CACHE_TIMEOUT))
+    return data
+
+
+async def aquery_applicants_by_hour(
+    date: datetime.date,
+    owner_id: int,
+) -> typing.List[typing.Tuple[int, int]]:
+    """query_applicants_by_hour() reading through the async connection pool and
+    the async cache API"""
+    key = _availability_cache_key(
+        date=date,
+        owner_id=owner_id,
+        generation=await aget_availability_generation(owner_id),
+    )
+    data = await cache.aget(key)
+    if data is not None:
+        cache_stats["hits"] += 1
+        return data
+    cache_stats["misses"] += 1
+    data = _applicants_by_hour(
+        await async_db.fetch_all(
+            _applicants_by_hour_queryset(date=date, owner_id=owner_id)
+        )
+    )
+    # pooled connections autocommit, so the buckets are always committed
+    await cache.aset(key, data, db_router.cache_timeout(AVAILABILITY_CACHE_TIMEOUT))
+    return data
+
+
+def _availability_cache_key(date: datetime.date, owner_id: int, generation: str) -> str:
+    return f"{_AVAILABILITY_CACHE_KEY_PREFIX}{owner_id}:{date.isoformat()}:{generation}"
+
+
+def get_availability_generation(owner_id: int) -> str:
+    """change stamp of the owner's reserved applicants across every date"""
+    owner_generation_key = _owner_generation_key(owner_id)
+    generations = booking_cache_service.get_generations(
+        [_AVAILABILITY_GENERATION_KEY, owner_generation_key]
+    )
+    return (
+        f"{generations[_AVAILABILITY_GENERATION_KEY]}-"
+        f"{generations[owner_generation_key]}"
+    )
+
+
+async def aget_availability_generation(owner_id: int) -> str:
+    owner_generation_key = _owner_generation_key(owner_id)
+    generations = await booking_cache_service.aget_generations(
+        [_AVAILABILITY_GENERATION_KEY, owner_generation_key]
+    )
+    return (
+        f"{generations[_AVAILABILITY_GENERATION_KEY]}-"
+        f"{generations[owner_generation_key]}"
+    )
+
+
+def get_cache_stats() -> typing.Dict[str, int]:
+    return {"hits": cache_stats["hits"], "misses": cache_stats["misses"]}
+
+
+def _owner_generation_key(owner_id: int) -> str:
+    return f"{_AVAILABILITY_GENERATION_KEY}:{owner_id}"
+
+
+def _applicants_by_hour_queryset(date: datetime.date, owner_id: int):
+    starts_at = datetime.datetime.combine(
+        date, datetime.time.min, datetime.timezone.utc
+    )
+    return BookingCapacityBucket.objects.filter(
+        owner_id=owner_id,
+        starts_at__gte=starts_at,
+        starts_at__lt=starts_at + datetime.timedelta(days=1),
+    ).values_list("starts_at", "reserved_applicants")
+
+
+def _applicants_by_hour(
+    buckets: typing.Iterable[typing.Tuple[datetime.datetime, int]],
+) -> typing.List[typing.Tuple[int, int]]:
+    applicants = [0] * 24
+    for bucket_starts_at, bucket_applicants in buckets:
+        applicants[bucket_starts_at.astimezone(datetime.timezone.utc).hour] += (
+            bucket_applicants
+        )
+    return list(enumerate(applicants))
+
+
+def _expected_buckets_sql(where: str = "") -> str:
+    return f"""
+SELECT b.owner_id, h.starts_at, SUM(b.applicants) AS reserved_applicants
+FROM bookings_bookingprojection b
+CROSS JOIN LATERAL {_booking_hours_sql("b.starts_at", "b.ends_at")} AS h(starts_at)
+{where}
+GROUP BY b.owner_id, h.starts_at
+"""
+
+
+_EXPECTED_BUCKETS_SQL = _expected_buckets_sql()
+
+
+def rebuild_capacity_buckets(
+    owner_ids: typing.Optional[typing.List[int]] = None,
+) -> int:
+    """recompute every bucket, or only those of `owner_ids`, from the booking
+    projections"""
+    with connection.cursor() as cursor:
+        if owner_ids is None:
+            cursor.execute("DELETE FROM bookings_bookingcapacitybucket;")
+            cursor.execute(
+                "INSERT INTO bookings_bookingcapacitybucket "
+                "(owner_id, starts_at, reserved_applicants) "
+                f"{_EXPECTED_BUCKETS_SQL};"
+            )
+        else:
+            cursor.execute(
+                "DELETE FROM bookings_bookingcapacitybucket "
+                "WHERE owner_id = ANY(%s);",
+                [owner_ids],
+            )
+            cursor.execute(
+                "INSERT INTO bookings_bookingcapacitybucket "
+                "(owner_id, starts_at, reserved_applicants) "
+                f"{_expected_buckets_sql('WHERE b.owner_id = ANY(%s)')};",
+                [owner_ids],
+            )
+        count = cursor.rowcount
+    transaction.on_commit(
+        lambda: booking_cache_service.reset_generation(_AVAILABILITY_GENERATION_KEY)
+    )
+    return count
+
+
+class CapacityBucketMismatch(typing.NamedTuple):
+    owner_id: int
+    starts_at: datetime.datetime
+    expected: int
+    actual: int
+
+
+def query_capacity_bucket_mismatches() -> typing.List[CapacityBucketMismatch]:
+    query = f"""
+WITH expected AS ({_EXPECTED_BUCKETS_SQL})
+SELECT
+    COALESCE(e.owner_id, c.owner_id),
+    COALESCE(e.starts_at, c.starts_at),
+    COALESCE(e.reserved_applicants, 0),
+    COALESCE(c.reserved_applicants, 0)
+FROM expected e
+FULL OUTER JOIN bookings_bookingcapacitybucket c
+ON c.owner_id = e.owner_id AND c.starts_at = e.starts_at
+WHERE COALESCE(e.reserved_applicants, 0) <> COALESCE(c.reserved_applicants, 0)
+ORDER BY 1, 2;
+"""
+    with connection.cursor() as cursor:
+        cursor.execute(query)
+        return [CapacityBucketMismatch(*row) for row in cursor.fetchall()]
@@ -0,0 +1,342 @@
+import csv
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import re
+import typing
+import uuid
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import dateparse, timezone
+
+from ..models import (
+    BookingEvent,
+    BookingEventArchive,
+    BookingOutbox,
+    BookingSnapshot,
+)
+from . import booking_event_service
+
+TABLE = BookingEvent._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+_PARTITION_NAME = re.compile(rf"^{TABLE}_p(\d{{4}})(\d{{2}})$")
+_ARCHIVE_COLUMNS = (
+    "id",
+    "user_id",
+    "booking_key",
+    "event_type",
+    "version",
+    "timestamp",
+    "data",
+)
+_SNAPSHOT_BATCH_SIZE = 1_000
+
+
+class EventPartition(typing.NamedTuple):
+    name: str
+    starts_at: datetime.datetime
+    ends_at: datetime.datetime
+
+
+class ArchivedEvent(typing.NamedTuple):
+    id: int
+    user_id: int
+    booking_key: uuid.UUID
+    event_type: str
+    version: int
+    timestamp: datetime.datetime
+    data: dict
+
+
+class PendingEvents(Exception):
+    """the partition holds events the asynchronous projector has not applied"""
+
+
+class CorruptArchive(Exception):
+    """an archive file no longer matches the sha256 recorded when it was
+    written"""
+
+
+def month_start(value: datetime.datetime) -> datetime.datetime:
+    value = value.astimezone(datetime.timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime.datetime, months: int) -> datetime.datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_for(month: datetime.datetime) -> EventPartition:
+    month = month_start(month)
+    return EventPartition(
+        name=f"{TABLE}_p{month:%Y%m}",
+        starts_at=month,
+        ends_at=add_months(month, 1),
+    )
+
+
+def is_partitioned() -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s);",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions() -> typing.List[EventPartition]:
+    """monthly partitions attached to the event table, oldest first"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+SELECT child.relname
+FROM pg_inherits
+JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+WHERE pg_inherits.inhparent = to_regclass(%s);
+""",
+            [TABLE],
+        )
+        names = [name for (name,) in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match is not None:
+            partitions.append(
+                partition_for(
+                    datetime.datetime(
+                        int(match[1]), int(match[2]), 1, tzinfo=datetime.timezone.utc
+                    )
+                )
+            )
+    return sorted(partitions, key=lambda partition: partition.starts_at)
+
+
+def _default_partition_months() -> typing.List[datetime.datetime]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+SELECT DISTINCT date_trunc('month', "timestamp" AT TIME ZONE 'UTC')
+FROM {DEFAULT_PARTITION};
+"""
+        )
+        return [
+            month.replace(tzinfo=datetime.timezone.utc)
+            for (month,) in cursor.fetchall()
+        ]
+
+
+def ensure_partitions(
+    months_ahead: typing.Optional[int] = None,
+    now: typing.Optional[datetime.datetime] = None,
+) -> typing.List[EventPartition]:
+    """create the partitions of the current month, the `months_ahead` after it
+    and any month with events parked in the default partition; returns the
+    partitions created"""
+    if months_ahead is None:
+        months_ahead = settings.BOOKING_EVENT_PARTITIONS_AHEAD
+    current = month_start(now or timezone.now())
+    wanted = {add_months(current, months) for months in range(months_ahead + 1)}
+    wanted.update(_default_partition_months())
+    existing = {partition.name for partition in list_partitions()}
+    archived = set(BookingEventArchive.objects.values_list("partition", flat=True))
+    created = []
+    for month in sorted(wanted):
+        partition = partition_for(month)
+        if partition.name in existing or partition.name in archived:
+            continue
+        if _create_partition(partition):
+            created.append(partition)
+    return created
+
+
+def _create_partition(partition: EventPartition) -> bool:
+    """create and attach one partition, moving its month's events out of the
+    default partition; False if a concurrent call created it first"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", [TABLE])
+        cursor.execute("SELECT to_regclass(%s);", [partition.name])
+        if cursor.fetchone()[0] is not None:
+            return False
+        cursor.execute(
+            f"CREATE TABLE {partition.name} "
+            f"(LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);"
+        )
+        cursor.execute(
+            f"""
+WITH moved AS (
+    DELETE FROM {DEFAULT_PARTITION}
+    WHERE "timestamp" >= %s AND "timestamp" < %s
+    RETURNING *
+)
+INSERT INTO {partition.name} SELECT * FROM moved;
+""",
+            [partition.starts_at, partition.ends_at],
+        )
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {partition.name} "
+            "FOR VALUES FROM (%s) TO (%s);",
+            [partition.starts_at, partition.ends_at],
+        )
+    return True
+
+
+def archivable_partitions(
+    older_than_months: typing.Optional[int] = None,
+    now: typing.Optional[datetime.datetime] = None,
+) -> typing.List[EventPartition]:
+    """attached partitions ending at least `older_than_months` months before
+    the current month"""
+    if older_than_months is None:
+        older_than_months = settings.BOOKING_EVENT_HOT_MONTHS
+    cutoff = add_months(month_start(now or timezone.now()), -older_than_months)
+    return [partition for partition in list_partitions() if partition.ends_at <= cutoff]
+
+
+def archive_path(archive: BookingEventArchive) -> str:
+    return os.path.join(settings.BOOKING_EVENT_ARCHIVE_DIR, archive.filename)
+
+
+def archive_partition(partition: EventPartition) -> BookingEventArchive:
+    """write the partition's events to a gzipped CSV file, snapshot the
+    streams it ends, then detach and drop it"""
+    os.makedirs(settings.BOOKING_EVENT_ARCHIVE_DIR, exist_ok=True)
+    filename = f"{partition.name}.csv.gz"
+    path = os.path.join(settings.BOOKING_EVENT_ARCHIVE_DIR, filename)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # readers go on; appends to the month, if any still come, wait
+            cursor.execute(f"LOCK TABLE {partition.name} IN SHARE MODE;")
+            cursor.execute(
+                f"""
+SELECT 1
+FROM {BookingOutbox._meta.db_table} outbox
+JOIN {partition.name} event ON event.id = outbox.event_id
+LIMIT 1;
+"""
+            )
+            if cursor.fetchone() is not None:
+                raise PendingEvents(partition.name)
+        _snapshot_streams(partition)
+        events = _write_archive_file(partition, path)
+        with connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {partition.name};")
+            cursor.execute(f"DROP TABLE {partition.name};")
+        return BookingEventArchive.objects.create(
+            partition=partition.name,
+            starts_at=partition.starts_at,
+            ends_at=partition.ends_at,
+            filename=filename,
+            events=events,
+            sha256=_sha256(path),
+        )
+
+
+def _write_archive_file(partition: EventPartition, path: str) -> int:
+    columns = ", ".join(f'"{column}"' for column in _ARCHIVE_COLUMNS)
+    partial_path = f"{path}.partial"
+    with gzip.open(partial_path, "wb") as f, connection.cursor() as cursor:
+        with cursor.copy(
+            f"COPY (SELECT {columns} FROM {partition.name} ORDER BY id) "
+            "TO STDOUT WITH (FORMAT csv, HEADER)"
+        ) as copy:
+            for data in copy:
+                f.write(data)
+        events = cursor.rowcount
+    with open(partial_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(partial_path, path)
+    return events
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _snapshot_streams(partition: EventPartition) -> None:
+    """snapshot every live booking as of its last event in the partition, so
+    loading a booking never needs the archived events"""
+    streams = []
+
+    def flush_streams():
+        # the states the streams continue, for a batch of bookings at once
+        states = booking_event_service.load_booking_states_before(
+            {stream[0][1]: stream[0][3] for stream in streams if stream[0][3] > 1}
+        )
+        snapshots = []
+        for stream in streams:
+            state = states.get(stream[0][1])
+            for _, _, event_type, version, _, data in stream:
+                # Django leaves jsonb undecoded outside the ORM
+                state = booking_event_service.fold_booking_event(
+                    state, event_type, json.loads(data), version
+                )
+            if state is not None:
+                last = stream[-1]
+                snapshots.append(
+                    BookingSnapshot(
+                        booking_key=last[1],
+                        version=last[3],
+                        event_id=last[0],
+                        timestamp=last[4],
+                        state=state._asdict(),
+                    )
+                )
+        BookingSnapshot.objects.bulk_create(snapshots, ignore_conflicts=True)
+        streams.clear()
+
+    stream = []
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(
+            f"""
+SELECT id, booking_key, event_type, version, "timestamp", data
+FROM {partition.name}
+ORDER BY booking_key, version;
+"""
+        )
+        while rows := cursor.fetchmany(_SNAPSHOT_BATCH_SIZE):
+            for row in rows:
+                if stream and stream[0][1] != row[1]:
+                    streams.append(stream)
+                    stream = []
+                    if len(streams) >= _SNAPSHOT_BATCH_SIZE:
+                        flush_streams()
+                stream.append(row)
+    if stream:
+        streams.append(stream)
+    flush_streams()
+
+
+def iter_archived_events(
+    archive: BookingEventArchive,
+    booking_key: typing.Optional[uuid.UUID] = None,
+) -> typing.Iterator[ArchivedEvent]:
+    """events of an archive file in id order, optionally of one booking only;
+    raises CorruptArchive before reading a file that changed since archiving"""
+    key = None if booking_key is None else str(booking_key)
+    path = archive_path(archive)
+    if _sha256(path) != archive.sha256:
+        raise CorruptArchive(archive.filename)
+    with gzip.open(path, "rt", newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for id, user_id, booking_key_, event_type, version, timestamp, data in reader:
+            if key is not None and booking_key_ != key:
+                continue
+            yield ArchivedEvent(
+                id=int(id),
+                user_id=int(user_id),
+                booking_key=uuid.UUID(booking_key_),
+                event_type=event_type,
+                version=int(version),
+                timestamp=dateparse.parse_datetime(timestamp),
+                data=json.loads(data),
+            )
@@ -1,31 +1,125 @@
+import collections
+import datetime
+import functools
+import json
+import typing
 import uuid
 
-from django.utils import timezone
+from django.db import connection, transaction
+from django.utils import dateparse, timezone
 
-from ..models import BookingEvent, BookingProjection
+from ..models import (
+    BookingEvent,
+    BookingEventArchive,
+    BookingOutbox,
+    BookingProjection,
+    BookingSnapshot,
+    BookingStream,
+)
+from . import (
+    booking_event_partition_service,
+    booking_projection_service,
+)
 
 
 def generate_key() -> uuid.UUID:
     return uuid.uuid4()
 
 
+def get_snapshot_interval() -> int:
+    """events between two snapshots of the same booking"""
+    return 50
+
+
+class VersionConflict(Exception):
+    """another event with the same version was appended to the booking stream;
+    args are the booking key and version, or the (booking_key, version) pairs
+    of every conflict when raised by create_booking_events()"""
+
+
 def create_booking_event(
     booking_key,
     user_id,
     event_type: str,
     data: dict,
+    version: int,
 ) -> BookingEvent:
     obj = BookingEvent(
         user_id=user_id,
         timestamp=timezone.now(),
         booking_key=booking_key,
         event_type=event_type,
+        version=version,
         data=data,
     )
-    obj.save()
+    # no savepoint of its own: nothing is written on a conflict, and a failed
+    # INSERT aborts the caller's transaction anyway
+    with transaction.atomic(savepoint=False):
+        advanced = _advance_stream(booking_key, version)
+        if advanced:
+            obj.save()
+    if not advanced:
+        raise VersionConflict(booking_key, version)
     return obj
 
 
+def create_booking_events(
+    events: typing.List[BookingEvent],
+) -> typing.List[BookingEvent]:
+    """create_booking_event() for unsaved events of distinct bookings, appended
+    with one statement per table"""
+    timestamp = timezone.now()
+    for event in events:
+        event.timestamp = timestamp
+    with transaction.atomic():
+        conflicts = _advance_streams(
+            [(event.booking_key, event.version) for event in events]
+        )
+        if conflicts:
+            raise VersionConflict(*conflicts)
+        BookingEvent.objects.bulk_create(events)
+    return events
+
+
+def _advance_streams(
+    heads: typing.List[typing.Tuple[uuid.UUID, int]],
+) -> typing.List[typing.Tuple[uuid.UUID, int]]:
+    """_advance_stream() for many bookings; returns the heads that could not be
+    advanced. The heads are locked in booking_key order, like the bucket upserts
+    lock in hour order, so concurrent bulk writes cannot deadlock on them"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+INSERT INTO {BookingStream._meta.db_table} AS stream (booking_key, version)
+SELECT * FROM unnest(%s::uuid[], %s::int[]) AS head(booking_key, version)
+ORDER BY booking_key
+ON CONFLICT (booking_key) DO UPDATE SET version = excluded.version
+WHERE stream.version < excluded.version
+RETURNING booking_key;
+""",
+            [[key for key, _ in heads], [version for _, version in heads]],
+        )
+        advanced = {booking_key for (booking_key,) in cursor.fetchall()}
+    return [head for head in heads if head[0] not in advanced]
+
+
+def _advance_stream(booking_key: uuid.UUID, version: int) -> bool:
+    """move the booking's stream head forward to `version`, unless it is already
+    there or past it; a concurrent append of the same version waits for this
+    one's transaction and then fails"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+INSERT INTO {BookingStream._meta.db_table} AS stream (booking_key, version)
+VALUES (%s, %s)
+ON CONFLICT (booking_key) DO UPDATE SET version = excluded.version
+WHERE stream.version < excluded.version;
+""",
+            [booking_key, version],
+        )
+        return cursor.rowcount == 1
+
+
 def apply_created_event(
     event: BookingEvent,
 ) -> BookingProjection:
@@ -36,24 +130,397 @@ def apply_created_event(
         ends_at=event.data["ends_at"],
         applicants=event.data["applicants"],
         status=BookingProjection.Status.PENDING,
+        version=event.version,
     )
     obj.save()
+    _snapshot_if_due(event, obj)
+    _invalidate_caches_on_commit(event.booking_key, obj.owner_id)
     return obj
 
 
-def apply_updated_event(event: BookingEvent) -> BookingProjection:
-    obj = BookingProjection.objects.filter(booking_key=event.booking_key).get()
-    if "starts_at" in event.data:
-        obj.starts_at = event.data["starts_at"]
-    if "ends_at" in event.data:
-        obj.ends_at = event.data["ends_at"]
-    if "applicants" in event.data:
-        obj.applicants = event.data["applicants"]
-    if "status" in event.data:
-        obj.status = event.data["status"]
-    obj.save()
+def apply_created_events(
+    events: typing.List[BookingEvent],
+) -> typing.List[BookingProjection]:
+    """apply_created_event() for many events with one INSERT"""
+    objs = BookingProjection.objects.bulk_create(
+        [
+            BookingProjection(
+                booking_key=event.booking_key,
+                owner_id=event.data["owner_id"],
+                starts_at=event.data["starts_at"],
+                ends_at=event.data["ends_at"],
+                applicants=event.data["applicants"],
+                status=BookingProjection.Status.PENDING,
+                version=event.version,
+            )
+            for event in events
+        ]
+    )
+    for event, obj in zip(events, objs):
+        _snapshot_if_due(event, obj)
+    # new bookings are never cached one by one; only the listings go stale
+    for owner_id in {obj.owner_id for obj in objs}:
+        transaction.on_commit(
+            functools.partial(booking_projection_service.bump_list_generation, owner_id)
+        )
+    return objs
+
+
+def apply_approved_events(
+    events: typing.List[BookingEvent],
+    currents: typing.List[BookingProjection],
+) -> typing.List[BookingProjection]:
+    """apply_updated_event() for many approvals with one UPDATE; `currents` are
+    the bookings the events were appended to, in the same order"""
+    approved = BookingProjection.Status.APPROVED
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+UPDATE {BookingProjection._meta.db_table} AS projection
+SET status = %s, version = event.version
+FROM unnest(%s::uuid[], %s::int[]) AS event(booking_key, version)
+WHERE projection.booking_key = event.booking_key;
+""",
+            [
+                approved.value,
+                [event.booking_key for event in events],
+                [event.version for event in events],
+            ],
+        )
+    for event, obj in zip(events, currents):
+        obj.status = approved
+        obj.version = event.version
+        _snapshot_if_due(event, obj)
+    _invalidate_bulk_caches_on_commit(currents)
+    return currents
+
+
+def apply_deleted_events(events: typing.List[BookingEvent]) -> None:
+    """apply_deleted_event() for many events with one DELETE"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+DELETE FROM {BookingProjection._meta.db_table}
+WHERE booking_key = ANY(%s)
+RETURNING booking_key, owner_id;
+""",
+            [[event.booking_key for event in events]],
+        )
+        objs = [
+            BookingProjection(booking_key=booking_key, owner_id=owner_id)
+            for booking_key, owner_id in cursor.fetchall()
+        ]
+    _invalidate_bulk_caches_on_commit(objs)
+
+
+def _invalidate_bulk_caches_on_commit(objs: typing.List[BookingProjection]) -> None:
+    booking_keys = [obj.booking_key for obj in objs]
+    owner_ids = {obj.owner_id for obj in objs}
+
+    def invalidate():
+        booking_projection_service.invalidate_cached_bookings(booking_keys)
+        for owner_id in owner_ids:
+            booking_projection_service.bump_list_generation(owner_id)
+
+    transaction.on_commit(invalidate)
+
+
+def apply_updated_event(
+    event: BookingEvent, current: typing.Optional[BookingProjection] = None
+) -> BookingProjection:
+    """update the projection with the event's fields; `current` is the row as
+    the writer locked it, saving a second read"""
+    obj = current
+    if obj is None:
+        obj = BookingProjection.objects.filter(booking_key=event.booking_key).get()
+    fields = [
+        field
+        for field in ("starts_at", "ends_at", "applicants", "status")
+        if field in event.data
+    ]
+    for field in fields:
+        setattr(obj, field, event.data[field])
+    obj.version = event.version
+    obj.save(update_fields=[*fields, "version"])
+    _snapshot_if_due(event, obj)
+    _invalidate_caches_on_commit(event.booking_key, obj.owner_id)
     return obj
 
 
-def apply_deleted_event(booking_key):
-    return BookingProjection.objects.filter(booking_key=booking_key).delete()
+def apply_deleted_event(
+    booking_key, current: typing.Optional[BookingProjection] = None
+):
+    obj = current
+    if obj is None:
+        obj = BookingProjection.objects.filter(booking_key=booking_key).first()
+    if obj is None:
+        return 0, {}
+    _invalidate_caches_on_commit(booking_key, obj.owner_id)
+    return obj.delete()
+
+
+def _invalidate_caches_on_commit(booking_key: uuid.UUID, owner_id: int) -> None:
+    def invalidate():
+        booking_projection_service.invalidate_cached_booking(booking_key)
+        booking_projection_service.bump_list_generation(owner_id)
+
+    transaction.on_commit(invalidate)
+
+
+class BookingState(typing.NamedTuple):
+    owner_id: int
+    starts_at: str
+    ends_at: str
+    applicants: int
+    status: str
+    version: int
+
+
+def fold_booking_event(
+    state: typing.Optional[BookingState],
+    event_type: str,
+    data: dict,
+    version: int,
+) -> typing.Optional[BookingState]:
+    """apply one event to a booking state without touching the database"""
+    if event_type == BookingEvent.EventType.CREATED:
+        return BookingState(
+            owner_id=data["owner_id"],
+            starts_at=data["starts_at"],
+            ends_at=data["ends_at"],
+            applicants=data["applicants"],
+            status=BookingProjection.Status.PENDING.value,
+            version=version,
+        )
+    if event_type == BookingEvent.EventType.DELETED or state is None:
+        return None
+    return state._replace(
+        **{
+            field: data[field]
+            for field in ("starts_at", "ends_at", "applicants", "status")
+            if field in data
+        },
+        version=version,
+    )
+
+
+def _isoformat(value: typing.Union[datetime.datetime, str]) -> str:
+    return value if isinstance(value, str) else value.isoformat()
+
+
+def _snapshot_if_due(event: BookingEvent, obj: BookingProjection) -> None:
+    if event.version % get_snapshot_interval():
+        return
+    state = BookingState(
+        owner_id=obj.owner_id,
+        starts_at=_isoformat(obj.starts_at),
+        ends_at=_isoformat(obj.ends_at),
+        applicants=obj.applicants,
+        status=obj.status,
+        version=obj.version,
+    )
+    BookingSnapshot.objects.create(
+        booking_key=event.booking_key,
+        version=event.version,
+        event_id=event.id,
+        timestamp=event.timestamp,
+        state=state._asdict(),
+    )
+
+
+def load_booking_state(
+    booking_key: uuid.UUID,
+    as_of: typing.Optional[datetime.datetime] = None,
+    use_snapshots: bool = True,
+    before_version: typing.Optional[int] = None,
+) -> typing.Optional[BookingState]:
+    """fold a booking's event stream up to `as_of` (and short of
+    `before_version`), starting from the newest snapshot at or before that
+    point; None if the booking does not exist then"""
+    state = None
+    events = BookingEvent.objects.filter(booking_key=booking_key)
+    snapshots = BookingSnapshot.objects.filter(booking_key=booking_key)
+    if as_of is not None:
+        events = events.filter(timestamp__lte=as_of)
+        snapshots = snapshots.filter(timestamp__lte=as_of)
+    if before_version is not None:
+        events = events.filter(version__lt=before_version)
+        snapshots = snapshots.filter(version__lt=before_version)
+    if use_snapshots:
+        snapshot = (
+            snapshots.order_by("-version").values_list("state", flat=True).first()
+        )
+        if snapshot is not None:
+            state = BookingState(**snapshot)
+            events = events.filter(version__gt=state.version)
+    rows = list(events.order_by("version").values_list("event_type", "data", "version"))
+    next_version = 1 if state is None else state.version + 1
+    # archiving snapshots every stream it ends, so the archives are only read
+    # for a history the live events do not continue, or one asked for without
+    # the newest snapshot
+    if (rows and rows[0][2] != next_version) or (
+        not rows and (as_of is not None or not use_snapshots)
+    ):
+        rows = [
+            (event.event_type, event.data, event.version)
+            for event in _iter_archived_events(
+                booking_key,
+                as_of=as_of,
+                from_version=next_version,
+                before_version=rows[0][2] if rows else before_version,
+            )
+        ] + rows
+    for event_type, data, version in rows:
+        state = fold_booking_event(state, event_type, data, version)
+    return state
+
+
+def load_booking_states_before(
+    before_versions: typing.Dict[uuid.UUID, int],
+) -> typing.Dict[uuid.UUID, typing.Optional[BookingState]]:
+    """load_booking_state(before_version=...) for many bookings in one query:
+    the newest snapshot short of each version and the live events after it.
+    A booking whose history continues in the archives is loaded on its own."""
+    if not before_versions:
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+SELECT
+    stream.booking_key,
+    snapshot.version,
+    snapshot.state,
+    event.event_type,
+    event.data,
+    event.version
+FROM unnest(%s::uuid[], %s::int[]) AS stream(booking_key, before_version)
+LEFT JOIN LATERAL (
+    SELECT version, state
+    FROM {BookingSnapshot._meta.db_table}
+    WHERE booking_key = stream.booking_key AND version < stream.before_version
+    ORDER BY version DESC
+    LIMIT 1
+) AS snapshot ON true
+LEFT JOIN {BookingEvent._meta.db_table} AS event
+ON event.booking_key = stream.booking_key
+AND event.version > COALESCE(snapshot.version, 0)
+AND event.version < stream.before_version
+ORDER BY stream.booking_key, event.version;
+""",
+            [list(before_versions), list(before_versions.values())],
+        )
+        rows = cursor.fetchall()
+    snapshots = {}
+    events = collections.defaultdict(list)
+    for booking_key, version, state, event_type, data, event_version in rows:
+        snapshots[booking_key] = (version or 0, state)
+        if event_version is not None:
+            events[booking_key].append((event_type, data, event_version))
+    states = {}
+    for booking_key, before_version in before_versions.items():
+        version, state = snapshots[booking_key]
+        if [row[2] for row in events[booking_key]] != list(
+            range(version + 1, before_version)
+        ):
+            states[booking_key] = load_booking_state(
+                booking_key, before_version=before_version
+            )
+            continue
+        # Django leaves jsonb undecoded outside the ORM
+        state = None if state is None else BookingState(**json.loads(state))
+        for event_type, data, event_version in events[booking_key]:
+            state = fold_booking_event(
+                state, event_type, json.loads(data), event_version
+            )
+        states[booking_key] = state
+    return states
+
+
+def _iter_archived_events(
+    booking_key: uuid.UUID,
+    as_of: typing.Optional[datetime.datetime],
+    from_version: int,
+    before_version: typing.Optional[int],
+) -> typing.Iterator["booking_event_partition_service.ArchivedEvent"]:
+    archives = BookingEventArchive.objects.order_by("starts_at")
+    if as_of is not None:
+        archives = archives.filter(starts_at__lte=as_of)
+    for archive in archives:
+        for event in booking_event_partition_service.iter_archived_events(
+            archive, booking_key=booking_key
+        ):
+            if (
+                event.version >= from_version
+                and (before_version is None or event.version < before_version)
+                and (as_of is None or event.timestamp <= as_of)
+            ):
+                yield event
+
+
+def to_booking_projection(
+    booking_key: uuid.UUID, state: BookingState
+) -> BookingProjection:
+    """unsaved projection carrying a folded state"""
+    return BookingProjection(
+        booking_key=booking_key,
+        owner_id=state.owner_id,
+        starts_at=dateparse.parse_datetime(state.starts_at),
+        ends_at=dateparse.parse_datetime(state.ends_at),
+        applicants=state.applicants,
+        status=state.status,
+        version=state.version,
+    )
+
+
+def load_booking_projections(
+    booking_keys: typing.List[uuid.UUID],
+) -> typing.Dict[uuid.UUID, BookingProjection]:
+    """load_booking_projection() for many bookings in two queries: the events
+    still waiting for the projector, folded over the projection rows"""
+    # pending events first: any event missing from them was applied before the
+    # projection rows are read, and those read twice are skipped by version
+    pending = collections.defaultdict(list)
+    for booking_key, event_type, data, version in (
+        BookingEvent.objects.filter(
+            booking_key__in=booking_keys,
+            id__in=BookingOutbox.objects.filter(booking_key__in=booking_keys).values(
+                "event_id"
+            ),
+        )
+        .order_by("id")
+        .values_list("booking_key", "event_type", "data", "version")
+    ):
+        pending[booking_key].append((event_type, data, version))
+    objs = {
+        obj.booking_key: obj
+        for obj in BookingProjection.objects.filter(booking_key__in=booking_keys)
+    }
+    for booking_key, events in pending.items():
+        obj = objs.pop(booking_key, None)
+        state = None if obj is None else _projection_state(obj)
+        for event_type, data, version in events:
+            if state is None or version > state.version:
+                state = fold_booking_event(state, event_type, data, version)
+        if state is not None:
+            objs[booking_key] = to_booking_projection(booking_key, state)
+    return objs
+
+
+def _projection_state(obj: BookingProjection) -> BookingState:
+    return BookingState(
+        owner_id=obj.owner_id,
+        starts_at=_isoformat(obj.starts_at),
+        ends_at=_isoformat(obj.ends_at),
+        applicants=obj.applicants,
+        status=obj.status,
+        version=obj.version,
+    )
+
+
+def load_booking_projection(booking_key: uuid.UUID) -> BookingProjection:
+    """current booking state read from the event log rather than the projection
+    table, which may lag behind it while projection is asynchronous"""
+    state = load_booking_state(booking_key)
+    if state is None:
+        raise BookingProjection.DoesNotExist
+    return to_booking_projection(booking_key, state)
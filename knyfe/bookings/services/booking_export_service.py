@@ -0,0 +1,120 @@
+import csv
+import datetime
+import io
+import json
+import typing
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from ..models import BookingEvent, BookingProjection
+
+BOOKING_EXPORT_COLUMNS = (
+    "booking_key",
+    "owner_id",
+    "starts_at",
+    "ends_at",
+    "applicants",
+    "status",
+    "version",
+)
+EVENT_EXPORT_COLUMNS = (
+    "id",
+    "booking_key",
+    "user_id",
+    "event_type",
+    "version",
+    "timestamp",
+    "data",
+)
+
+
+def iter_booking_rows(
+    starts_at_gte: typing.Optional[datetime.datetime] = None,
+    starts_at_lt: typing.Optional[datetime.datetime] = None,
+    chunk_size: int = 2_000,
+) -> typing.Iterator[tuple]:
+    qs = BookingProjection.objects.order_by("starts_at", "id")
+    if starts_at_gte is not None:
+        qs = qs.filter(starts_at__gte=starts_at_gte)
+    if starts_at_lt is not None:
+        qs = qs.filter(starts_at__lt=starts_at_lt)
+    yield from _iter_rows(qs.values_list(*BOOKING_EXPORT_COLUMNS), chunk_size)
+
+
+def iter_event_rows(
+    timestamp_gte: typing.Optional[datetime.datetime] = None,
+    timestamp_lt: typing.Optional[datetime.datetime] = None,
+    chunk_size: int = 2_000,
+) -> typing.Iterator[tuple]:
+    qs = BookingEvent.objects.order_by("id")
+    if timestamp_gte is not None:
+        qs = qs.filter(timestamp__gte=timestamp_gte)
+    if timestamp_lt is not None:
+        qs = qs.filter(timestamp__lt=timestamp_lt)
+    yield from _iter_rows(qs.values_list(*EVENT_EXPORT_COLUMNS), chunk_size)
+
+
+def _iter_rows(qs, chunk_size: int) -> typing.Iterator[tuple]:
+    # outside a transaction the server-side cursor is declared WITH HOLD and
+    # Postgres materializes the whole result before the first fetch
+    with transaction.atomic():
+        yield from qs.iterator(chunk_size=chunk_size)
+
+
+def iter_ndjson(
+    columns: typing.Sequence[str],
+    rows: typing.Iterable[tuple],
+    rows_per_chunk: int = 1_000,
+) -> typing.Iterator[str]:
+    """one JSON object per line, flushed every `rows_per_chunk` rows"""
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    lines = []
+    for row in rows:
+        lines.append(encoder.encode(dict(zip(columns, row))))
+        if len(lines) >= rows_per_chunk:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def iter_csv(
+    columns: typing.Sequence[str],
+    rows: typing.Iterable[tuple],
+    rows_per_chunk: int = 1_000,
+) -> typing.Iterator[str]:
+    """a header line, then one CSV record per row; nested JSON values are written
+    as JSON text"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield _drain(buffer)
+    count = 0
+    for row in rows:
+        writer.writerow(
+            [
+                json.dumps(value, cls=DjangoJSONEncoder)
+                if isinstance(value, (dict, list))
+                else _csv_value(value)
+                for value in row
+            ]
+        )
+        count += 1
+        if count % rows_per_chunk == 0:
+            yield _drain(buffer)
+    if count % rows_per_chunk:
+        yield _drain(buffer)
+
+
+def _csv_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def _drain(buffer: io.StringIO) -> str:
+    value = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return value
@@ -0,0 +1,200 @@
+"""group commit for booking writes
+
+Writes submitted within BOOKING_GROUP_COMMIT_WINDOW seconds of each other are
+run one after another by a flusher thread inside a single transaction, each in
+a savepoint of its own, and committed together. A write that fails rolls back
+its savepoint only; its caller gets the exception, the others their results
+once the shared commit succeeds.
+
+Batches run in lock key order, so concurrent batches take their locks in the
+same order. A write chosen as a deadlock or serialization failure victim is
+retried in a transaction of its own after the batch, and when the shared
+commit itself fails that way, every write of the batch is.
+"""
+
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+import time
+import typing
+
+import psycopg
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+T = typing.TypeVar("T")
+
+
+class _Write(typing.NamedTuple):
+    write: typing.Callable[[], typing.Any]
+    lock_key: str
+    future: concurrent.futures.Future
+
+
+class GroupCommitter:
+    def __init__(self):
+        self._queue: "queue.SimpleQueue[typing.Optional[_Write]]" = queue.SimpleQueue()
+
+    def submit(self, write: typing.Callable[[], T], lock_key: str = "") -> T:
+        future = concurrent.futures.Future()
+        self._queue.put(_Write(write, lock_key, future))
+        try:
+            return future.result(timeout=settings.BOOKING_GROUP_COMMIT_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            if future.cancel():
+                raise TimeoutError(
+                    "booking write was not flushed within "
+                    f"{settings.BOOKING_GROUP_COMMIT_TIMEOUT} seconds"
+                ) from None
+        # the flusher started the write, and settles it even if it dies
+        return future.result()
+
+    def run(self) -> None:
+        """flush batches until stop()"""
+        batch = []
+        try:
+            while (batch := self._next_batch()) is not None:
+                self._flush(batch)
+        except Exception as exc:
+            logger.exception("booking group commit flusher died")
+            error = RuntimeError("booking group commit flusher died")
+            error.__cause__ = exc
+            for item in batch or []:
+                if not item.future.done():
+                    item.future.set_exception(error)
+            # fail the writes still queued; new ones start another flusher
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None and item.future.set_running_or_notify_cancel():
+                    item.future.set_exception(error)
+        finally:
+            connection.close()
+
+    def stop(self) -> None:
+        self._queue.put(None)
+
+    def _next_batch(self) -> typing.Optional[typing.List[_Write]]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + settings.BOOKING_GROUP_COMMIT_WINDOW
+        while len(batch) < settings.BOOKING_GROUP_COMMIT_MAX_BATCH:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                # flush what was collected, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _flush(self, batch: typing.List[_Write]) -> None:
+        # writes whose callers gave up waiting are dropped
+        batch = sorted(
+            (item for item in batch if item.future.set_running_or_notify_cancel()),
+            key=lambda item: item.lock_key,
+        )
+        outcomes = []
+        try:
+            with transaction.atomic():
+                for item in batch:
+                    try:
+                        outcomes.append((item.write(), None))
+                    except Exception as exc:
+                        outcomes.append((None, exc))
+        except Exception as exc:
+            # the connection may be gone; the next batch opens a new one
+            connection.close()
+            if _is_retryable(exc):
+                for item in batch:
+                    _run_alone(item)
+                return
+            for item in batch:
+                item.future.set_exception(exc)
+            return
+        for item, (result, exc) in zip(batch, outcomes):
+            if exc is None:
+                item.future.set_result(result)
+            elif _is_retryable(exc):
+                _run_alone(item)
+            else:
+                item.future.set_exception(exc)
+
+
+def _run_alone(item: _Write) -> None:
+    """retry a write in a transaction of its own"""
+    try:
+        item.future.set_result(item.write())
+    except Exception as exc:
+        item.future.set_exception(exc)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    """whether the database aborted the write only to break a lock cycle or
+    keep transactions serializable, so running it again may succeed"""
+    return isinstance(exc, OperationalError) and isinstance(
+        exc.__cause__,
+        (psycopg.errors.DeadlockDetected, psycopg.errors.SerializationFailure),
+    )
+
+
+_committer: typing.Optional[GroupCommitter] = None
+_thread: typing.Optional[threading.Thread] = None
+_pid: typing.Optional[int] = None
+_start_lock = threading.Lock()
+
+
+def run_write(write: typing.Callable[[], T], lock_key: str = "") -> T:
+    """run a booking write, group-committed with concurrent ones when enabled.
+
+    `write` must do all its database work inside its own transaction.atomic()
+    block, which becomes its savepoint in the shared transaction, and may run
+    more than once. `lock_key` names the first lock it takes. Inside an open
+    transaction it always runs in place, since the flusher could neither see
+    nor wait for the caller's uncommitted rows.
+    """
+    if not settings.BOOKING_GROUP_COMMIT or connection.in_atomic_block:
+        return write()
+    committer = _committer
+    if committer is None or _pid != os.getpid() or not _thread.is_alive():
+        committer = _start()
+    return committer.submit(write, lock_key)
+
+
+def _start() -> GroupCommitter:
+    global _committer, _thread, _pid
+    with _start_lock:
+        # a forked worker inherits the object but not the flusher thread
+        if _committer is None or _pid != os.getpid() or not _thread.is_alive():
+            _committer = GroupCommitter()
+            _pid = os.getpid()
+            _thread = threading.Thread(
+                target=_committer.run, name="booking-group-commit", daemon=True
+            )
+            _thread.start()
+        return _committer
+
+
+def stop() -> None:
+    """flush pending writes and stop this process's flusher"""
+    global _committer, _thread, _pid
+    with _start_lock:
+        if _committer is not None and _pid == os.getpid():
+            _committer.stop()
+            _thread.join()
+        _committer = None
+        _thread = None
+        _pid = None
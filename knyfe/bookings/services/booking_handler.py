@@ -1,15 +1,28 @@
+import asyncio
+import base64
 import dataclasses
 import datetime
+import time
 import typing
 import uuid
 
+from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
 from typing_extensions import NotRequired
+from utils import db_router
 from utils.result import Result
 
-from ..models import User
-from . import booking_event_service, booking_projection_service
+from ..models import BookingEvent, User
+from . import (
+    booking_capacity_service,
+    booking_event_service,
+    booking_export_service,
+    booking_group_commit_service,
+    booking_projection_service,
+    booking_projector_service,
+    booking_read_model_service,
+)
 
 
 class CreateData(typing.TypedDict):
@@ -24,45 +37,135 @@ class BookingData(typing.TypedDict):
     ends_at: datetime.datetime
     applicants: int
     status: str
+    version: int
 
 
 def handle_create(user: User, data: CreateData) -> Result[BookingData, str]:
     """create booking event and update projection"""
-    if not _validate_booking_capacity(
-        starts_at=data["starts_at"],
-        ends_at=data["starts_at"],
-        user_id=user.pk,
-        applicants=data["applicants"],
-    ):
-        return Result(error="Applicants must be under booking capacity per slot.")
-    if not _validate_applicants(data["applicants"]):
-        return Result(error="Applicants must be a positive integer.")
-    if not _validate_starts_at(data["starts_at"]):
-        return Result(error="Booking must be made at least 3 days in advance.")
+    error = _create_error(data)
+    if error is not None:
+        return Result(error=error)
+
+    def write() -> Result[BookingData, str]:
+        with transaction.atomic():
+            if not _reserve_booking_capacity(
+                user_id=user.pk,
+                deltas=[
+                    booking_capacity_service.CapacityDelta(
+                        starts_at=data["starts_at"],
+                        ends_at=data["ends_at"],
+                        applicants=data["applicants"],
+                    )
+                ],
+            ):
+                transaction.set_rollback(True)
+                return Result(error=_OVER_CAPACITY)
+            event = booking_event_service.create_booking_event(
+                booking_key=booking_event_service.generate_key(),
+                user_id=user.pk,
+                event_type="CREATED",
+                data={
+                    "owner_id": user.pk,
+                    "starts_at": data["starts_at"].isoformat(),
+                    "ends_at": data["ends_at"].isoformat(),
+                    "applicants": data["applicants"],
+                },
+                version=1,
+            )
+            booking = booking_projector_service.project_event(event)
+        return Result(
+            value={
+                "booking_key": booking.booking_key,
+                "starts_at": booking.starts_at,
+                "ends_at": booking.ends_at,
+                "applicants": booking.applicants,
+                "status": booking.status,
+                "version": booking.version,
+            }
+        ).with_metadata("event_id", event.id)
+
+    return booking_group_commit_service.run_write(write, f"owner:{user.pk}")
+
+
+@dataclasses.dataclass
+class BulkCreateItem:
+    index: int
+    booking: typing.Optional[BookingData] = None
+    error: typing.Optional[str] = None
+
+
+def handle_bulk_create(
+    user: User,
+    items: typing.List[CreateData],
+    atomic: bool = True,
+) -> Result[typing.List[BulkCreateItem], str]:
+    """create a batch of bookings in one transaction, with one capacity check and
+    one INSERT per table for the whole batch. An `atomic` batch is created
+    entirely or not at all; otherwise the items that fail are skipped. Either
+    way every item gets its booking or its error."""
+    results = [
+        BulkCreateItem(index=index, error=_create_error(data))
+        for index, data in enumerate(items)
+    ]
+    valid = [result for result in results if result.error is None]
+    if atomic and len(valid) < len(results):
+        return _bulk_create_failed(results)
     with transaction.atomic():
-        event = booking_event_service.create_booking_event(
-            booking_key=booking_event_service.generate_key(),
-            user_id=user.pk,
-            event_type="CREATED",
-            data={
-                "owner_id": user.pk,
-                "starts_at": data["starts_at"].isoformat(),
-                "ends_at": data["ends_at"].isoformat(),
-                "applicants": data["applicants"],
-            },
+        reserved = booking_capacity_service.reserve_capacity_each(
+            owner_id=user.pk,
+            deltas=[
+                booking_capacity_service.CapacityDelta(
+                    starts_at=items[result.index]["starts_at"],
+                    ends_at=items[result.index]["ends_at"],
+                    applicants=items[result.index]["applicants"],
+                )
+                for result in valid
+            ],
+            capacity=booking_projection_service.get_booking_capacity(),
         )
-        obj = booking_event_service.apply_created_event(event)
-    return Result(
-        value={
+        for result, ok in zip(valid, reserved):
+            if not ok:
+                result.error = _OVER_CAPACITY
+        if atomic and not all(reserved):
+            transaction.set_rollback(True)
+            return _bulk_create_failed(results)
+        accepted = [result for result in valid if result.error is None]
+        events = booking_event_service.create_booking_events(
+            [
+                BookingEvent(
+                    booking_key=booking_event_service.generate_key(),
+                    user_id=user.pk,
+                    event_type="CREATED",
+                    data={
+                        "owner_id": user.pk,
+                        "starts_at": items[result.index]["starts_at"].isoformat(),
+                        "ends_at": items[result.index]["ends_at"].isoformat(),
+                        "applicants": items[result.index]["applicants"],
+                    },
+                    version=1,
+                )
+                for result in accepted
+            ]
+        )
+        objs = booking_projector_service.project_created_events(events)
+    for result, obj in zip(accepted, objs):
+        result.booking = {
             "booking_key": obj.booking_key,
             "starts_at": obj.starts_at,
             "ends_at": obj.ends_at,
             "applicants": obj.applicants,
             "status": obj.status,
+            "version": obj.version,
         }
+    return Result(value=results).with_metadata(
+        "event_id", max((event.id for event in events), default=None)
     )
 
 
+def _bulk_create_failed(results: typing.List[BulkCreateItem]) -> Result:
+    return Result(error="No booking was created.").with_metadata("results", results)
+
+
 class UpdateData(typing.TypedDict):
     starts_at: NotRequired[datetime.datetime]
     ends_at: NotRequired[datetime.datetime]
@@ -70,125 +173,537 @@ class UpdateData(typing.TypedDict):
 
 
 def handle_update(
-    user: User, booking_key: uuid.UUID, data: UpdateData
+    user: User,
+    booking_key: uuid.UUID,
+    data: UpdateData,
+    expected_version: typing.Optional[int] = None,
 ) -> Result[BookingData, str]:
+    def write() -> Result[BookingData, str]:
+        with transaction.atomic():
+            obj = _load_booking_for_write(user, booking_key, owned=True)
+            if obj is None:
+                return _booking_not_found()
+            if not _validate_version(obj.version, expected_version):
+                return _version_mismatch(booking_key)
+            if not _validate_status_for_modification(user, obj.status):
+                return Result(
+                    error="Confirmed booking cannot be updated"
+                ).with_metadata("status", 400)
+            starts_at = data.get("starts_at", obj.starts_at)
+            ends_at = data.get("ends_at", obj.ends_at)
+            applicants = data.get("applicants", obj.applicants)
+            if not _validate_applicants(applicants):
+                return Result(error="Applicants must be a positive integer.")
+            if not _validate_starts_at(starts_at):
+                return Result(error="Booking must be made at least 3 days in advance.")
+            error = _period_error(starts_at, ends_at)
+            if error is not None:
+                return Result(error=error)
+            if not _reserve_booking_capacity(
+                user_id=obj.owner_id,
+                deltas=[
+                    booking_capacity_service.CapacityDelta(
+                        starts_at=obj.starts_at,
+                        ends_at=obj.ends_at,
+                        applicants=-obj.applicants,
+                    ),
+                    booking_capacity_service.CapacityDelta(
+                        starts_at=starts_at,
+                        ends_at=ends_at,
+                        applicants=applicants,
+                    ),
+                ],
+            ):
+                transaction.set_rollback(True)
+                return Result(error=_OVER_CAPACITY)
+            event = booking_event_service.create_booking_event(
+                booking_key=booking_key,
+                user_id=user.pk,
+                event_type="UPDATED",
+                data={
+                    "starts_at": starts_at.isoformat(),
+                    "ends_at": ends_at.isoformat(),
+                    "applicants": applicants,
+                },
+                version=obj.version + 1,
+            )
+            booking = booking_projector_service.project_event(event, current=obj)
+        return Result(
+            value={
+                "booking_key": booking.booking_key,
+                "starts_at": booking.starts_at,
+                "ends_at": booking.ends_at,
+                "applicants": booking.applicants,
+                "status": booking.status,
+                "version": booking.version,
+            }
+        ).with_metadata("event_id", event.id)
+
     try:
-        obj = booking_projection_service.query_by_booking_key(booking_key=booking_key)
-    except booking_projection_service.BookingProjection.DoesNotExist:
-        return Result(error="Booking not found").with_metadata("status", 404)
-    if not user.is_staff and obj.owner_id != user.pk:
-        return Result(error="Booking not found").with_metadata("status", 404)
-    # TODO: optimize and simplify partial update.
-    if "starts_at" not in data:
-        data["starts_at"] = obj.starts_at
-    if "ends_at" not in data:
-        data["ends_at"] = obj.ends_at
-    if "applicants" not in data:
-        data["applicants"] = obj.applicants
-    if not _validate_status_for_modification(user, obj.status):
-        return Result(error="Confirmed booking cannot be updated").with_metadata(
-            "status", 400
-        )
-    if not _validate_booking_capacity(
-        starts_at=data["starts_at"],
-        ends_at=data["ends_at"],
-        user_id=user.pk,
-        applicants=data["applicants"],
-    ):
-        return Result(error="Applicants must be under booking capacity per slot.")
-    if not _validate_applicants(data["applicants"]):
-        return Result(error="Applicants must be a positive integer.")
-    if not _validate_starts_at(data["starts_at"]):
-        return Result(error="Booking must be made at least 3 days in advance.")
+        return booking_group_commit_service.run_write(write, f"booking:{booking_key}")
+    except booking_event_service.VersionConflict:
+        return _version_conflict(booking_key)
+
+
+def handle_delete(
+    user: User,
+    booking_key: uuid.UUID,
+    expected_version: typing.Optional[int] = None,
+) -> Result[None, str]:
+    def write() -> Result[None, str]:
+        with transaction.atomic():
+            obj = _load_booking_for_write(user, booking_key, owned=True)
+            if obj is None:
+                return _booking_not_found()
+            if not _validate_version(obj.version, expected_version):
+                return _version_mismatch(booking_key)
+            if not _validate_status_for_modification(user, obj.status):
+                return Result(
+                    error="Confirmed booking cannot be deleted"
+                ).with_metadata("status", 400)
+            _reserve_booking_capacity(
+                user_id=obj.owner_id,
+                deltas=[
+                    booking_capacity_service.CapacityDelta(
+                        starts_at=obj.starts_at,
+                        ends_at=obj.ends_at,
+                        applicants=-obj.applicants,
+                    )
+                ],
+            )
+            event = booking_event_service.create_booking_event(
+                booking_key=booking_key,
+                user_id=user.pk,
+                event_type="DELETED",
+                data={},
+                version=obj.version + 1,
+            )
+            booking_projector_service.project_event(event, current=obj)
+        return Result(None, error=None).with_metadata("event_id", event.id)
+
+    try:
+        return booking_group_commit_service.run_write(write, f"booking:{booking_key}")
+    except booking_event_service.VersionConflict:
+        return _version_conflict(booking_key)
+
+
+def handle_approve(
+    user: User,
+    booking_key: uuid.UUID,
+    expected_version: typing.Optional[int] = None,
+) -> Result[BookingData, str]:
+    def write() -> Result[BookingData, str]:
+        with transaction.atomic():
+            obj = _load_booking_for_write(user, booking_key, owned=False)
+            if obj is None:
+                return _booking_not_found()
+            if not _validate_version(obj.version, expected_version):
+                return _version_mismatch(booking_key)
+            event = booking_event_service.create_booking_event(
+                booking_key=booking_key,
+                user_id=user.pk,
+                event_type="UPDATED",
+                data={"status": "APPROVED"},
+                version=obj.version + 1,
+            )
+            booking = booking_projector_service.project_event(event, current=obj)
+        return Result(
+            value={
+                "booking_key": booking.booking_key,
+                "starts_at": booking.starts_at,
+                "ends_at": booking.ends_at,
+                "applicants": booking.applicants,
+                "status": booking.status,
+                "version": booking.version,
+            }
+        ).with_metadata("event_id", event.id)
+
+    try:
+        return booking_group_commit_service.run_write(write, f"booking:{booking_key}")
+    except booking_event_service.VersionConflict:
+        return _version_conflict(booking_key)
+
+
+@dataclasses.dataclass
+class BulkWriteItem:
+    booking_key: uuid.UUID
+    booking: typing.Optional[BookingData] = None
+    error: typing.Optional[str] = None
+
+
+def handle_bulk_approve(
+    user: User,
+    booking_keys: typing.List[uuid.UUID],
+    atomic: bool = True,
+) -> Result[typing.List[BulkWriteItem], str]:
+    """approve a batch of bookings with one event INSERT and one projection
+    UPDATE; `atomic` as in handle_bulk_create(). Approval needs no capacity
+    check: the applicants were reserved against capacity when created."""
+    results, currents = _load_bulk_write(user, booking_keys)
+    approved = booking_projection_service.BookingProjection.Status.APPROVED
+    if atomic and len(currents) < len(results):
+        return _bulk_write_failed(results)
     with transaction.atomic():
-        event = booking_event_service.create_booking_event(
-            booking_key=booking_key,
-            user_id=user.pk,
-            event_type="UPDATED",
-            data={
-                "starts_at": data["starts_at"].isoformat(),
-                "ends_at": data["ends_at"].isoformat(),
-                "applicants": data["applicants"],
-            },
+        events = _create_bulk_events(
+            user, results, currents, "UPDATED", {"status": approved.value}, atomic
         )
-        obj = booking_event_service.apply_updated_event(event)
-    return Result(
-        value={
+        if events is None:
+            transaction.set_rollback(True)
+            return _bulk_write_failed(results, status=409)
+        objs = booking_projector_service.project_approved_events(
+            events, [currents[event.booking_key] for event in events]
+        )
+    for obj in objs:
+        results[obj.booking_key].booking = {
             "booking_key": obj.booking_key,
             "starts_at": obj.starts_at,
             "ends_at": obj.ends_at,
             "applicants": obj.applicants,
             "status": obj.status,
+            "version": obj.version,
         }
-    )
-
-
-def handle_delete(user: User, booking_key: uuid.UUID) -> Result[None, str]:
-    try:
-        obj = booking_projection_service.query_by_booking_key(booking_key=booking_key)
-    except booking_projection_service.BookingProjection.DoesNotExist:
-        return Result(error="Booking not found").with_metadata("status", 404)
-    if not user.is_staff and obj.owner_id != user.pk:
-        return Result(error="Booking not found").with_metadata("status", 404)
-    if not _validate_status_for_modification(user, obj.status):
-        return Result(error="Confirmed booking cannot be deleted").with_metadata(
-            "status", 400
-        )
+    return _bulk_written(results, events)
+
+
+def handle_bulk_delete(
+    user: User,
+    booking_keys: typing.List[uuid.UUID],
+    atomic: bool = True,
+) -> Result[typing.List[BulkWriteItem], str]:
+    """delete a batch of bookings with one event INSERT and one projection
+    DELETE; `atomic` as in handle_bulk_create()"""
+    results, currents = _load_bulk_write(user, booking_keys)
+    for booking_key, obj in list(currents.items()):
+        if not _validate_status_for_modification(user, obj.status):
+            results[booking_key].error = "Confirmed booking cannot be deleted"
+            del currents[booking_key]
+    if atomic and len(currents) < len(results):
+        return _bulk_write_failed(results)
     with transaction.atomic():
-        event = booking_event_service.create_booking_event(
+        events = _create_bulk_events(user, results, currents, "DELETED", {}, atomic)
+        if events is None:
+            transaction.set_rollback(True)
+            return _bulk_write_failed(results, status=409)
+        booking_capacity_service.apply_owner_capacity_deltas(
+            [
+                booking_capacity_service.OwnerCapacityDelta(
+                    owner_id=currents[event.booking_key].owner_id,
+                    starts_at=currents[event.booking_key].starts_at,
+                    ends_at=currents[event.booking_key].ends_at,
+                    applicants=-currents[event.booking_key].applicants,
+                )
+                for event in events
+            ]
+        )
+        booking_projector_service.project_deleted_events(events)
+    return _bulk_written(results, events)
+
+
+def _load_bulk_write(
+    user: User, booking_keys: typing.List[uuid.UUID]
+) -> typing.Tuple[
+    typing.Dict[uuid.UUID, BulkWriteItem],
+    typing.Dict[uuid.UUID, booking_projection_service.BookingProjection],
+]:
+    """a result per distinct booking key, and the current state of every booking
+    the user may write to"""
+    results = {
+        booking_key: BulkWriteItem(booking_key=booking_key)
+        for booking_key in booking_keys
+    }
+    currents = booking_event_service.load_booking_projections(list(results))
+    for booking_key, result in results.items():
+        obj = currents.get(booking_key)
+        if obj is None or (not user.is_staff and obj.owner_id != user.pk):
+            result.error = "Booking not found"
+            currents.pop(booking_key, None)
+    return results, currents
+
+
+def _create_bulk_events(
+    user: User,
+    results: typing.Dict[uuid.UUID, BulkWriteItem],
+    currents: typing.Dict[uuid.UUID, booking_projection_service.BookingProjection],
+    event_type: str,
+    data: dict,
+    atomic: bool,
+) -> typing.Optional[typing.List[BookingEvent]]:
+    """append one event to every current booking; bookings written concurrently
+    since they were loaded fail an `atomic` batch (None) and are otherwise
+    dropped from it"""
+    if not booking_projector_service.is_async():
+        # single writes lock the projection row before the buckets and the
+        # stream head; taking the stream heads first here would deadlock them
+        booking_projection_service.lock_booking_projections(list(currents))
+    events = [
+        BookingEvent(
             booking_key=booking_key,
             user_id=user.pk,
-            event_type="DELETED",
-            data={},
+            event_type=event_type,
+            data=dict(data),
+            version=obj.version + 1,
         )
-        booking_event_service.apply_deleted_event(event.booking_key)
-    return Result(None, error=None)
+        for booking_key, obj in currents.items()
+    ]
+    while events:
+        try:
+            return booking_event_service.create_booking_events(events)
+        except booking_event_service.VersionConflict as exc:
+            conflicts = {booking_key for booking_key, _ in exc.args}
+        for booking_key in conflicts:
+            results[booking_key].error = "Booking was modified concurrently."
+        if atomic:
+            return None
+        events = [event for event in events if event.booking_key not in conflicts]
+    return events
+
+
+def _bulk_written(
+    results: typing.Dict[uuid.UUID, BulkWriteItem],
+    events: typing.List[BookingEvent],
+) -> Result[typing.List[BulkWriteItem], str]:
+    return Result(value=list(results.values())).with_metadata(
+        "event_id", max((event.id for event in events), default=None)
+    )
 
 
-def handle_approve(user: User, booking_key: uuid.UUID) -> Result[BookingData, str]:
-    with transaction.atomic():
-        event = booking_event_service.create_booking_event(
-            booking_key=booking_key,
-            user_id=user.pk,
-            event_type="UPDATED",
-            data={"status": "APPROVED"},
-        )
-        obj = booking_event_service.apply_updated_event(event)
-    return Result(
-        value={
-            "booking_key": obj.booking_key,
-            "starts_at": obj.starts_at,
-            "ends_at": obj.ends_at,
-            "applicants": obj.applicants,
-            "status": obj.status,
-        }
+def _bulk_write_failed(
+    results: typing.Dict[uuid.UUID, BulkWriteItem], status: int = 400
+) -> Result:
+    return (
+        Result(error="No booking was written.")
+        .with_metadata("results", list(results.values()))
+        .with_metadata("status", status)
     )
 
 
-def handle_list(user: User) -> typing.List[BookingData]:
-    if user.is_staff:
-        qs = booking_projection_service.query_booking_projections()
-    else:
-        qs = booking_projection_service.query_booking_projections_by_owner(
-            owner_id=user.pk
+@dataclasses.dataclass
+class BookingPage:
+    results: typing.List[BookingData]
+    next: typing.Optional[str]
+
+
+class ListFilter(typing.TypedDict):
+    starts_at_from: NotRequired[datetime.datetime]
+    starts_at_to: NotRequired[datetime.datetime]
+    status: NotRequired[str]
+
+
+def handle_list(
+    user: User,
+    cursor: typing.Optional[str] = None,
+    limit: int = 50,
+    filters: typing.Optional[ListFilter] = None,
+) -> Result[BookingPage, str]:
+    """one page of bookings ordered by (starts_at, id); `next` is the cursor of
+    the following page, or None on the last page"""
+    after = None
+    if cursor:
+        after = _decode_cursor(cursor)
+        if after is None:
+            return Result(error="Invalid cursor.")
+    filters = filters or {}
+    read_model = booking_read_model_service.get_read_model()
+    if read_model is not None:
+        return Result(value=_read_model_page(read_model, user, after, limit, filters))
+    with db_router.replica_reads():
+        rows = booking_projection_service.query_booking_projection_page(
+            _list_queryset(user),
+            limit=limit + 1,
+            after=after,
+            starts_at_gte=filters.get("starts_at_from"),
+            starts_at_lt=filters.get("starts_at_to"),
+            status=filters.get("status"),
         )
-    return [
-        {
-            "booking_key": obj.booking_key,
-            "starts_at": obj.starts_at,
-            "ends_at": obj.ends_at,
-            "applicants": obj.applicants,
-            "status": obj.status,
-        }
-        for obj in qs
-    ]
+    return Result(value=_booking_page(rows, limit))
+
+
+async def ahandle_list(
+    user: User,
+    cursor: typing.Optional[str] = None,
+    limit: int = 50,
+    filters: typing.Optional[ListFilter] = None,
+) -> Result[BookingPage, str]:
+    after = None
+    if cursor:
+        after = _decode_cursor(cursor)
+        if after is None:
+            return Result(error="Invalid cursor.")
+    filters = filters or {}
+    read_model = booking_read_model_service.get_read_model()
+    if read_model is not None:
+        return Result(value=_read_model_page(read_model, user, after, limit, filters))
+    with db_router.replica_reads():
+        rows = await booking_projection_service.aquery_booking_projection_page(
+            _list_queryset(user),
+            limit=limit + 1,
+            after=after,
+            starts_at_gte=filters.get("starts_at_from"),
+            starts_at_lt=filters.get("starts_at_to"),
+            status=filters.get("status"),
+        )
+    return Result(value=_booking_page(rows, limit))
+
+
+def _list_queryset(user: User):
+    if user.is_staff:
+        return booking_projection_service.query_booking_projections()
+    return booking_projection_service.query_booking_projections_by_owner(
+        owner_id=user.pk
+    )
+
+
+def _read_model_page(
+    read_model: booking_read_model_service.ReadModel,
+    user: User,
+    after: typing.Optional[typing.Tuple[datetime.datetime, int]],
+    limit: int,
+    filters: ListFilter,
+) -> BookingPage:
+    rows = read_model.page(
+        None if user.is_staff else user.pk,
+        limit=limit + 1,
+        after=after,
+        starts_at_gte=filters.get("starts_at_from"),
+        starts_at_lt=filters.get("starts_at_to"),
+        status=filters.get("status"),
+    )
+    return _booking_page(rows, limit)
+
+
+def _booking_page(rows: typing.List[tuple], limit: int) -> BookingPage:
+    """page of the first `limit` rows, read with one extra row to tell whether
+    another page follows"""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(starts_at=rows[-1][1], id=rows[-1][-1])
+    return BookingPage(
+        results=[
+            dict(zip(booking_projection_service.BOOKING_LIST_COLUMNS, row))
+            for row in rows
+        ],
+        next=next_cursor,
+    )
+
+
+def handle_list_etag(user: User) -> typing.Optional[str]:
+    """strong entity tag of every page a list request by this user can return;
+    it changes whenever one of the listed bookings is written. None when the
+    page is read from a database replica, which may lag the generation counters
+    and has nothing else to tag what it holds with."""
+    owner_id = None if user.is_staff else user.pk
+    read_model = booking_read_model_service.get_read_model()
+    if read_model is not None:
+        # the replica may lag the generation counters, so it tags what it holds
+        return f'"rm-{read_model.stamp(owner_id)}"'
+    if db_router.reads_from_replica():
+        return None
+    return f'"{booking_projection_service.get_list_generation(owner_id)}"'
+
+
+async def ahandle_list_etag(user: User) -> typing.Optional[str]:
+    owner_id = None if user.is_staff else user.pk
+    read_model = booking_read_model_service.get_read_model()
+    if read_model is not None:
+        return f'"rm-{read_model.stamp(owner_id)}"'
+    if db_router.reads_from_replica():
+        return None
+    return f'"{await booking_projection_service.aget_list_generation(owner_id)}"'
+
+
+def _encode_cursor(starts_at: datetime.datetime, id: int) -> str:
+    token = f"{starts_at.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(token).decode().rstrip("=")
+
+
+def _decode_cursor(
+    cursor: str,
+) -> typing.Optional[typing.Tuple[datetime.datetime, int]]:
+    try:
+        token = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        starts_at, id = token.split("|")
+        after = datetime.datetime.fromisoformat(starts_at), int(id)
+    except ValueError:
+        return None
+    return after if timezone.is_aware(after[0]) else None
 
 
 def handle_retrieve(user: User, booking_key: uuid.UUID) -> Result[BookingData, str]:
+    read_model = booking_read_model_service.get_read_model()
+    if read_model is not None:
+        return _retrieved_from_read_model(read_model, user, booking_key)
+    try:
+        with db_router.replica_reads():
+            obj = booking_projection_service.query_by_booking_key(
+                booking_key=booking_key
+            )
+    except booking_projection_service.BookingProjection.DoesNotExist:
+        return Result(error="Booking not found").with_metadata("status", 404)
+    return _retrieved(user, obj)
+
+
+async def ahandle_retrieve(
+    user: User, booking_key: uuid.UUID
+) -> Result[BookingData, str]:
+    read_model = booking_read_model_service.get_read_model()
+    if read_model is not None:
+        return _retrieved_from_read_model(read_model, user, booking_key)
     try:
-        obj = booking_projection_service.query_by_booking_key(booking_key=booking_key)
+        with db_router.replica_reads():
+            obj = await booking_projection_service.aquery_by_booking_key(
+                booking_key=booking_key
+            )
     except booking_projection_service.BookingProjection.DoesNotExist:
         return Result(error="Booking not found").with_metadata("status", 404)
+    return _retrieved(user, obj)
+
+
+def handle_retrieve_version(user: User, booking_key: uuid.UUID) -> typing.Optional[int]:
+    """the booking's version from a per-booking stamp that is cheaper than the
+    booking itself: the read model's row or the cached projection. None when
+    neither is at hand, or when `user` may not see the booking."""
+    read_model = booking_read_model_service.get_read_model()
+    if read_model is not None:
+        obj = read_model.get(booking_key)
+        stamp = None if obj is None else (obj.owner_id, obj.version)
+    else:
+        stamp = booking_projection_service.get_cached_version(booking_key)
+    return _visible_version(user, stamp)
+
+
+async def ahandle_retrieve_version(
+    user: User, booking_key: uuid.UUID
+) -> typing.Optional[int]:
+    read_model = booking_read_model_service.get_read_model()
+    if read_model is not None:
+        obj = read_model.get(booking_key)
+        stamp = None if obj is None else (obj.owner_id, obj.version)
+    else:
+        stamp = await booking_projection_service.aget_cached_version(booking_key)
+    return _visible_version(user, stamp)
+
+
+def _visible_version(
+    user: User, stamp: typing.Optional[typing.Tuple[int, int]]
+) -> typing.Optional[int]:
+    if stamp is None or (not user.is_staff and stamp[0] != user.pk):
+        return None
+    return stamp[1]
+
+
+def _retrieved_from_read_model(
+    read_model: booking_read_model_service.ReadModel,
+    user: User,
+    booking_key: uuid.UUID,
+) -> Result[BookingData, str]:
+    obj = read_model.get(booking_key)
+    if obj is None:
+        return Result(error="Booking not found").with_metadata("status", 404)
+    return _retrieved(user, obj)
+
+
+def _retrieved(user: User, obj) -> Result[BookingData, str]:
     if not user.is_staff and obj.owner_id != user.pk:
         return Result(error="Booking not found").with_metadata("status", 404)
     return Result(
@@ -198,23 +713,137 @@ def handle_retrieve(user: User, booking_key: uuid.UUID) -> Result[BookingData, s
             "ends_at": obj.ends_at,
             "applicants": obj.applicants,
             "status": obj.status,
+            "version": obj.version,
         }
     )
 
 
+class ExportFilter(typing.TypedDict):
+    output: str
+    since: NotRequired[datetime.datetime]
+    until: NotRequired[datetime.datetime]
+
+
+def handle_export_bookings(filters: ExportFilter) -> typing.Iterator[str]:
+    """stream every booking starting in [since, until) as NDJSON or CSV text
+    chunks"""
+    rows = booking_export_service.iter_booking_rows(
+        starts_at_gte=filters.get("since"),
+        starts_at_lt=filters.get("until"),
+    )
+    return _export(booking_export_service.BOOKING_EXPORT_COLUMNS, rows, filters)
+
+
+def handle_export_events(filters: ExportFilter) -> typing.Iterator[str]:
+    """stream every booking event recorded in [since, until) as NDJSON or CSV
+    text chunks"""
+    rows = booking_export_service.iter_event_rows(
+        timestamp_gte=filters.get("since"),
+        timestamp_lt=filters.get("until"),
+    )
+    return _export(booking_export_service.EVENT_EXPORT_COLUMNS, rows, filters)
+
+
+def _export(columns, rows, filters: ExportFilter) -> typing.Iterator[str]:
+    if filters["output"] == "csv":
+        return booking_export_service.iter_csv(columns, rows)
+    return booking_export_service.iter_ndjson(columns, rows)
+
+
+def handle_wait_for_projection(event_id: int) -> bool:
+    """read-your-writes: wait until the client's last write has been projected"""
+    read_model = booking_read_model_service.get_read_model()
+    if read_model is not None:
+        return read_model.wait_until(
+            event_id, timeout=settings.BOOKING_READ_YOUR_WRITES_TIMEOUT
+        )
+    if not booking_projector_service.is_async():
+        return True
+    return booking_projector_service.wait_until_projected(
+        event_id, timeout=settings.BOOKING_READ_YOUR_WRITES_TIMEOUT
+    )
+
+
+async def ahandle_wait_for_projection(event_id: int) -> bool:
+    read_model = booking_read_model_service.get_read_model()
+    if read_model is not None:
+        deadline = time.monotonic() + settings.BOOKING_READ_YOUR_WRITES_TIMEOUT
+        while not read_model.contains(event_id):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+    if not booking_projector_service.is_async():
+        return True
+    return await booking_projector_service.await_until_projected(
+        event_id, timeout=settings.BOOKING_READ_YOUR_WRITES_TIMEOUT
+    )
+
+
 @dataclasses.dataclass
 class BookingAvailability:
     index: int
     remaining: int
 
 
+def handle_read_model_staleness() -> typing.Optional[float]:
+    """seconds the in-process replica serving reads lags the database by, or
+    None when reads go to the database"""
+    read_model = booking_read_model_service.get_read_model()
+    return None if read_model is None else read_model.staleness()
+
+
+def handle_list_availability_etag(user_id: int) -> typing.Optional[str]:
+    read_model = booking_read_model_service.get_read_model()
+    if read_model is not None:
+        return f'"rm-{read_model.stamp(user_id)}"'
+    if db_router.reads_from_replica():
+        # see handle_list_etag()
+        return None
+    return f'"{booking_capacity_service.get_availability_generation(user_id)}"'
+
+
+async def ahandle_list_availability_etag(user_id: int) -> typing.Optional[str]:
+    read_model = booking_read_model_service.get_read_model()
+    if read_model is not None:
+        return f'"rm-{read_model.stamp(user_id)}"'
+    if db_router.reads_from_replica():
+        return None
+    generation = await booking_capacity_service.aget_availability_generation(user_id)
+    return f'"{generation}"'
+
+
 def handle_list_availability(
     date: datetime.date,
     user_id: int,
 ) -> typing.List[BookingAvailability]:
-    data = booking_projection_service.query_booking_projection_applicants_by_hour(
-        date=date, user_id=user_id
-    )
+    read_model = booking_read_model_service.get_read_model()
+    if read_model is not None:
+        return _availability(read_model.applicants_by_hour(date=date, owner_id=user_id))
+    with db_router.replica_reads():
+        data = booking_capacity_service.query_applicants_by_hour(
+            date=date, owner_id=user_id
+        )
+    return _availability(data)
+
+
+async def ahandle_list_availability(
+    date: datetime.date,
+    user_id: int,
+) -> typing.List[BookingAvailability]:
+    read_model = booking_read_model_service.get_read_model()
+    if read_model is not None:
+        return _availability(read_model.applicants_by_hour(date=date, owner_id=user_id))
+    with db_router.replica_reads():
+        data = await booking_capacity_service.aquery_applicants_by_hour(
+            date=date, owner_id=user_id
+        )
+    return _availability(data)
+
+
+def _availability(
+    data: typing.List[typing.Tuple[int, int]],
+) -> typing.List[BookingAvailability]:
     return [
         BookingAvailability(
             index=row[0],
@@ -224,20 +853,87 @@ def handle_list_availability(
     ]
 
 
+def _load_booking_for_write(
+    user: User, booking_key: uuid.UUID, owned: bool
+) -> typing.Optional[booking_projection_service.BookingProjection]:
+    """current booking state to validate a write against, or None when `user`
+    may not see it. The projection row stays locked until the write commits and
+    is updated in place by the projector; while projection is asynchronous the
+    table lags behind, so the state is folded from the event log instead and
+    the stream head guards against concurrent writes."""
+    try:
+        if booking_projector_service.is_async():
+            obj = booking_event_service.load_booking_projection(booking_key=booking_key)
+        else:
+            obj = booking_projection_service.query_by_booking_key_for_update(
+                booking_key=booking_key
+            )
+    except booking_projection_service.BookingProjection.DoesNotExist:
+        return None
+    if owned and not user.is_staff and obj.owner_id != user.pk:
+        return None
+    return obj
+
+
+def _booking_not_found() -> Result:
+    return Result(error="Booking not found").with_metadata("status", 404)
+
+
+def _version_mismatch(booking_key: uuid.UUID) -> Result:
+    # a stale cached projection may be the side that is out of date
+    booking_projection_service.invalidate_cached_booking(booking_key)
+    return Result(error="Booking version does not match.").with_metadata("status", 412)
+
+
+def _version_conflict(booking_key: uuid.UUID) -> Result:
+    booking_projection_service.invalidate_cached_booking(booking_key)
+    return Result(error="Booking was modified concurrently.").with_metadata(
+        "status", 409
+    )
+
+
 # validators
-def _validate_booking_capacity(
-    starts_at: datetime.datetime,
-    ends_at: datetime.datetime,
+_OVER_CAPACITY = "Applicants must be under booking capacity per slot."
+
+
+def _create_error(data: CreateData) -> typing.Optional[str]:
+    if not _validate_applicants(data["applicants"]):
+        return "Applicants must be a positive integer."
+    if not _validate_starts_at(data["starts_at"]):
+        return "Booking must be made at least 3 days in advance."
+    return _period_error(data["starts_at"], data["ends_at"])
+
+
+def _period_error(
+    starts_at: datetime.datetime, ends_at: datetime.datetime
+) -> typing.Optional[str]:
+    if ends_at <= starts_at:
+        return "Booking must end after it starts."
+    if ends_at - starts_at > timezone.timedelta(
+        hours=settings.BOOKING_MAX_DURATION_HOURS
+    ):
+        return (
+            f"Booking must not be longer than {settings.BOOKING_MAX_DURATION_HOURS} "
+            "hours."
+        )
+    return None
+
+
+def _reserve_booking_capacity(
     user_id: int,
-    applicants: int,
+    deltas: typing.List[booking_capacity_service.CapacityDelta],
 ) -> bool:
-    return applicants <= booking_projection_service.query_remaining_capacity(
-        starts_at=starts_at,
-        ends_at=ends_at,
-        user_id=user_id,
+    return booking_capacity_service.reserve_capacity(
+        owner_id=user_id,
+        deltas=deltas,
+        capacity=booking_projection_service.get_booking_capacity(),
     )
 
 
+def _validate_version(version: int, expected_version: typing.Optional[int]):
+    return expected_version is None or version == expected_version
+
+
 def _validate_applicants(value: int):
     return value > 0
 
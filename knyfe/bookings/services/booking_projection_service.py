@@ -1,19 +1,238 @@
+import collections
 import datetime
 import typing
 import uuid
 
+from django.core.cache import cache
 from django.db import connection, models
 from django.utils import timezone
+from utils import async_db, db_router
 
 from ..models import BookingProjection
+from . import booking_cache_service
 
 
 def get_booking_capacity() -> int:
     return 50_000
 
 
+CACHE_TIMEOUT = 300
+_CACHE_KEY_PREFIX = "bookings:projection:"
+_CACHE_GENERATION_KEY = f"{_CACHE_KEY_PREFIX}generation"
+_CACHED_FIELDS = (
+    "id",
+    "owner_id",
+    "starts_at",
+    "ends_at",
+    "applicants",
+    "status",
+    "version",
+)
+
+# process-local read-through cache counters
+cache_stats: typing.Counter[str] = collections.Counter()
+
+
 def query_by_booking_key(booking_key: uuid.UUID) -> BookingProjection:
-    return BookingProjection.objects.get(booking_key=booking_key)
+    """read-through: committed projections are cached as a compact tuple per
+    booking_key under the booking's generation, which writers bump on commit.
+    The generation is read before the row, so a row read before a commit is
+    cached under the generation that commit replaced, and never served."""
+    key, generation, obj = _query_cached_booking(booking_key)
+    if obj is not None:
+        return obj
+    obj = BookingProjection.objects.get(booking_key=booking_key)
+    # a row read inside a transaction may be uncommitted or rolled back later
+    if not connection.in_atomic_block:
+        cache.set(
+            key,
+            (generation, tuple(getattr(obj, field) for field in _CACHED_FIELDS)),
+            db_router.cache_timeout(CACHE_TIMEOUT),
+        )
+    return obj
+
+
+def query_by_booking_key_for_update(booking_key: uuid.UUID) -> BookingProjection:
+    """the committed projection, locked against concurrent writers until the
+    surrounding transaction ends; never cached"""
+    return BookingProjection.objects.select_for_update().get(booking_key=booking_key)
+
+
+def lock_booking_projections(booking_keys: typing.List[uuid.UUID]) -> None:
+    """query_by_booking_key_for_update() for many bookings, locked in
+    booking_key order so concurrent batches take them in the same order"""
+    list(
+        BookingProjection.objects.select_for_update()
+        .filter(booking_key__in=booking_keys)
+        .order_by("booking_key")
+        .values_list("pk", flat=True)
+    )
+
+
+async def aquery_by_booking_key(booking_key: uuid.UUID) -> BookingProjection:
+    """query_by_booking_key() reading through the async connection pool and the
+    async cache API"""
+    key, generation, obj = await _aquery_cached_booking(booking_key)
+    if obj is not None:
+        return obj
+    row = await async_db.fetch_one(
+        BookingProjection.objects.filter(booking_key=booking_key).values_list(
+            *_CACHED_FIELDS
+        )
+    )
+    if row is None:
+        raise BookingProjection.DoesNotExist
+    # pooled connections autocommit, so the row is always committed
+    await cache.aset(key, (generation, row), db_router.cache_timeout(CACHE_TIMEOUT))
+    return _cached_projection(booking_key, row)
+
+
+_Generation = typing.Tuple[int, int]
+
+
+def _query_cached_booking(
+    booking_key: uuid.UUID,
+) -> typing.Tuple[str, _Generation, typing.Optional[BookingProjection]]:
+    """cache key and generation to fill on a miss, and the cached projection"""
+    key = _booking_cache_key(booking_key)
+    generation_key = _booking_generation_key(booking_key)
+    cached = cache.get_many([key, _CACHE_GENERATION_KEY, generation_key])
+    for stamp_key, timeout in (
+        (_CACHE_GENERATION_KEY, None),
+        (generation_key, CACHE_TIMEOUT),
+    ):
+        if stamp_key not in cached:
+            cached[stamp_key] = booking_cache_service.reset_generation(
+                stamp_key, timeout
+            )
+    generation = (cached[_CACHE_GENERATION_KEY], cached[generation_key])
+    return (key, generation, _cached_booking(booking_key, generation, cached.get(key)))
+
+
+async def _aquery_cached_booking(
+    booking_key: uuid.UUID,
+) -> typing.Tuple[str, _Generation, typing.Optional[BookingProjection]]:
+    key = _booking_cache_key(booking_key)
+    generation_key = _booking_generation_key(booking_key)
+    cached = await cache.aget_many([key, _CACHE_GENERATION_KEY, generation_key])
+    for stamp_key, timeout in (
+        (_CACHE_GENERATION_KEY, None),
+        (generation_key, CACHE_TIMEOUT),
+    ):
+        if stamp_key not in cached:
+            cached[stamp_key] = await booking_cache_service.areset_generation(
+                stamp_key, timeout
+            )
+    generation = (cached[_CACHE_GENERATION_KEY], cached[generation_key])
+    return (key, generation, _cached_booking(booking_key, generation, cached.get(key)))
+
+
+def get_cached_version(
+    booking_key: uuid.UUID,
+) -> typing.Optional[typing.Tuple[int, int]]:
+    """owner and version of the cached projection, or None on a miss; a stamp
+    to revalidate a booking against without reading it"""
+    key = _booking_cache_key(booking_key)
+    generation_key = _booking_generation_key(booking_key)
+    cached = cache.get_many([key, _CACHE_GENERATION_KEY, generation_key])
+    return _cached_version(cached, key, generation_key)
+
+
+async def aget_cached_version(
+    booking_key: uuid.UUID,
+) -> typing.Optional[typing.Tuple[int, int]]:
+    key = _booking_cache_key(booking_key)
+    generation_key = _booking_generation_key(booking_key)
+    cached = await cache.aget_many([key, _CACHE_GENERATION_KEY, generation_key])
+    return _cached_version(cached, key, generation_key)
+
+
+def _cached_version(
+    cached: dict, key: str, generation_key: str
+) -> typing.Optional[typing.Tuple[int, int]]:
+    entry = cached.get(key)
+    generation = (cached.get(_CACHE_GENERATION_KEY), cached.get(generation_key))
+    if entry is None or entry[0] != generation:
+        return None
+    row = dict(zip(_CACHED_FIELDS, entry[1]))
+    return row["owner_id"], row["version"]
+
+
+def _cached_booking(
+    booking_key: uuid.UUID, generation: _Generation, entry: typing.Optional[tuple]
+) -> typing.Optional[BookingProjection]:
+    # entries cached before the last invalidate_booking_cache(), or before the
+    # booking's last write, are misses
+    if entry is not None and entry[0] == generation:
+        cache_stats["hits"] += 1
+        return _cached_projection(booking_key, entry[1])
+    cache_stats["misses"] += 1
+    return None
+
+
+def _cached_projection(booking_key: uuid.UUID, row: tuple) -> BookingProjection:
+    obj = BookingProjection(booking_key=booking_key, **dict(zip(_CACHED_FIELDS, row)))
+    obj._state.adding = False
+    return obj
+
+
+def invalidate_cached_booking(booking_key: uuid.UUID) -> None:
+    invalidate_cached_bookings([booking_key])
+
+
+def invalidate_cached_bookings(booking_keys: typing.List[uuid.UUID]) -> None:
+    # bumping the generation rather than deleting the entry also turns away a
+    # reader that read the row before the write and caches it afterwards; the
+    # stamp only has to outlive the entries written under it
+    booking_cache_service.reset_generations(
+        [_booking_generation_key(booking_key) for booking_key in booking_keys],
+        CACHE_TIMEOUT,
+    )
+
+
+def invalidate_booking_cache() -> None:
+    """drop every cached projection at once, e.g. after a rebuild"""
+    booking_cache_service.reset_generation(_CACHE_GENERATION_KEY)
+
+
+def get_cache_stats() -> typing.Dict[str, int]:
+    return {"hits": cache_stats["hits"], "misses": cache_stats["misses"]}
+
+
+def get_list_generation(owner_id: typing.Optional[int]) -> str:
+    """change stamp of one owner's bookings, or of every booking when `owner_id`
+    is None; it differs whenever a listing of those bookings could"""
+    scope_key = _list_generation_key(owner_id)
+    generations = booking_cache_service.get_generations(
+        [_CACHE_GENERATION_KEY, scope_key]
+    )
+    return f"{generations[_CACHE_GENERATION_KEY]}-{generations[scope_key]}"
+
+
+async def aget_list_generation(owner_id: typing.Optional[int]) -> str:
+    scope_key = _list_generation_key(owner_id)
+    generations = await booking_cache_service.aget_generations(
+        [_CACHE_GENERATION_KEY, scope_key]
+    )
+    return f"{generations[_CACHE_GENERATION_KEY]}-{generations[scope_key]}"
+
+
+def bump_list_generation(owner_id: int) -> None:
+    booking_cache_service.reset_generation(_list_generation_key(owner_id))
+    booking_cache_service.reset_generation(_list_generation_key(None))
+
+
+def _list_generation_key(owner_id: typing.Optional[int]) -> str:
+    scope = "all" if owner_id is None else owner_id
+    return f"{_CACHE_KEY_PREFIX}list-generation:{scope}"
+
+
+def _booking_cache_key(booking_key: uuid.UUID) -> str:
+    return f"{_CACHE_KEY_PREFIX}{booking_key}"
+
+
+def _booking_generation_key(booking_key: uuid.UUID) -> str:
+    return f"{_CACHE_KEY_PREFIX}{booking_key}:generation"
 
 
 def query_booking_projections_by_owner(owner_id: int):
@@ -26,18 +245,77 @@ def query_booking_projections():
     return BookingProjection.objects.filter()
 
 
+BOOKING_LIST_COLUMNS = (
+    "booking_key",
+    "starts_at",
+    "ends_at",
+    "applicants",
+    "status",
+    "version",
+)
+
+
+def query_booking_projection_page(
+    qs: "models.QuerySet[BookingProjection]",
+    limit: int,
+    after: typing.Optional[typing.Tuple[datetime.datetime, int]] = None,
+    starts_at_gte: typing.Optional[datetime.datetime] = None,
+    starts_at_lt: typing.Optional[datetime.datetime] = None,
+    status: typing.Optional[str] = None,
+) -> typing.List[tuple]:
+    """up to `limit` rows of BOOKING_LIST_COLUMNS followed by the row id, ordered
+    by (starts_at, id) and starting after the `after` keyset position"""
+    return list(
+        _booking_projection_page(qs, limit, after, starts_at_gte, starts_at_lt, status)
+    )
+
+
+async def aquery_booking_projection_page(
+    qs: "models.QuerySet[BookingProjection]",
+    limit: int,
+    after: typing.Optional[typing.Tuple[datetime.datetime, int]] = None,
+    starts_at_gte: typing.Optional[datetime.datetime] = None,
+    starts_at_lt: typing.Optional[datetime.datetime] = None,
+    status: typing.Optional[str] = None,
+) -> typing.List[tuple]:
+    return await async_db.fetch_all(
+        _booking_projection_page(qs, limit, after, starts_at_gte, starts_at_lt, status)
+    )
+
+
+def _booking_projection_page(
+    qs, limit, after, starts_at_gte, starts_at_lt, status
+) -> "models.QuerySet[BookingProjection]":
+    if starts_at_gte is not None:
+        qs = qs.filter(starts_at__gte=starts_at_gte)
+    if starts_at_lt is not None:
+        qs = qs.filter(starts_at__lt=starts_at_lt)
+    if status is not None:
+        qs = qs.filter(status=status)
+    if after is not None:
+        after_starts_at, after_id = after
+        # the leading range condition lets the (starts_at, id) index bound the scan
+        qs = qs.filter(starts_at__gte=after_starts_at).filter(
+            models.Q(starts_at__gt=after_starts_at) | models.Q(id__gt=after_id)
+        )
+    return qs.order_by("starts_at", "id").values_list(*BOOKING_LIST_COLUMNS, "id")[
+        :limit
+    ]
+
+
 def query_remaining_capacity(
     starts_at: datetime.datetime,
     ends_at: datetime.datetime,
     user_id: int,
 ) -> int:
+    """capacity left after every approved booking overlapping [starts_at, ends_at)"""
     return get_booking_capacity() - (
         (
             BookingProjection.objects.filter(
                 status=BookingProjection.Status.APPROVED,
                 owner_id=user_id,
-                starts_at__gte=starts_at,
-                ends_at__lt=ends_at,
+                starts_at__lt=ends_at,
+                ends_at__gt=starts_at,
             ).aggregate(total_applicants=models.Sum("applicants"))["total_applicants"]
         )
         or 0
@@ -69,10 +347,8 @@ bookings_with_intervals AS (
     LEFT JOIN bookings_bookingprojection b
     ON b.owner_id = %s
        AND b.status = 'APPROVED'
-       AND (
-           b.starts_at BETWEEN i.start_time AND i.start_time + interval '1 hour' OR
-           b.ends_at BETWEEN i.start_time AND i.start_time + interval '1 hour'
-       )
+       AND b.starts_at < i.start_time + interval '1 hour'
+       AND b.ends_at > i.start_time
 )
 SELECT
     EXTRACT(HOUR FROM start_time)::INT AS hour_index,
@@ -82,6 +358,6 @@ GROUP BY hour_index
 ORDER BY hour_index;
 """
     params = [starts_at, starts_at + timezone.timedelta(hours=23), user_id]
-    with connection.cursor() as cursor:
+    with db_router.read_connection().cursor() as cursor:
         cursor.execute(query, params)
         return cursor.fetchall()
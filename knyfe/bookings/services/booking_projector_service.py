@@ -0,0 +1,215 @@
+import asyncio
+import select
+import time
+import typing
+
+from django.conf import settings
+from django.db import connection, transaction
+from utils import async_db
+
+from ..models import (
+    BookingEvent,
+    BookingOutbox,
+    BookingProjection,
+    BookingProjectorCheckpoint,
+)
+from . import booking_event_service
+
+CHANNEL = "bookings_outbox"
+
+
+def is_async() -> bool:
+    return settings.BOOKING_PROJECTION_MODE == "async"
+
+
+def apply_event(
+    event: BookingEvent, current: typing.Optional[BookingProjection] = None
+) -> typing.Optional[BookingProjection]:
+    if event.event_type == BookingEvent.EventType.CREATED:
+        return booking_event_service.apply_created_event(event)
+    if event.event_type == BookingEvent.EventType.UPDATED:
+        return booking_event_service.apply_updated_event(event, current=current)
+    booking_event_service.apply_deleted_event(event.booking_key, current=current)
+    return None
+
+
+def enqueue_event(event: BookingEvent) -> None:
+    """hand the event to the projector once the surrounding transaction commits"""
+    enqueue_events([event])
+
+
+def enqueue_events(events: typing.List[BookingEvent]) -> None:
+    if not events:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+WITH outbox AS (
+    INSERT INTO {BookingOutbox._meta.db_table} (event_id, booking_key)
+    SELECT * FROM unnest(%s::bigint[], %s::uuid[])
+    RETURNING event_id
+)
+SELECT pg_notify(%s, max(event_id)::text) FROM outbox;
+""",
+            [
+                [event.id for event in events],
+                [event.booking_key for event in events],
+                CHANNEL,
+            ],
+        )
+
+
+def project_event(
+    event: BookingEvent,
+    current: typing.Optional[BookingProjection] = None,
+) -> typing.Optional[BookingProjection]:
+    """apply the event to the projection now, or enqueue it for the projector and
+    return the projection it will produce. `current` is the booking before the
+    event; applied now, it must be the projection row the caller locked."""
+    if not is_async():
+        return apply_event(event, current=current)
+    enqueue_event(event)
+    state = booking_event_service.fold_booking_event(
+        None
+        if current is None
+        else booking_event_service.BookingState(
+            owner_id=current.owner_id,
+            starts_at=current.starts_at.isoformat(),
+            ends_at=current.ends_at.isoformat(),
+            applicants=current.applicants,
+            status=current.status,
+            version=current.version,
+        ),
+        event_type=event.event_type,
+        data=event.data,
+        version=event.version,
+    )
+    if state is None:
+        return None
+    return booking_event_service.to_booking_projection(event.booking_key, state)
+
+
+def project_created_events(
+    events: typing.List[BookingEvent],
+) -> typing.List[BookingProjection]:
+    """project_event() for many CREATED events at once"""
+    if not is_async():
+        return booking_event_service.apply_created_events(events)
+    enqueue_events(events)
+    return [
+        booking_event_service.to_booking_projection(
+            event.booking_key,
+            booking_event_service.fold_booking_event(
+                None, event.event_type, event.data, event.version
+            ),
+        )
+        for event in events
+    ]
+
+
+def project_approved_events(
+    events: typing.List[BookingEvent],
+    currents: typing.List[BookingProjection],
+) -> typing.List[BookingProjection]:
+    """project_event() for many approvals at once"""
+    if not is_async():
+        return booking_event_service.apply_approved_events(events, currents)
+    enqueue_events(events)
+    for event, obj in zip(events, currents):
+        obj.status = event.data["status"]
+        obj.version = event.version
+    return currents
+
+
+def project_deleted_events(events: typing.List[BookingEvent]) -> None:
+    """project_event() for many deletions at once"""
+    if not is_async():
+        booking_event_service.apply_deleted_events(events)
+        return
+    enqueue_events(events)
+
+
+def project_batch(name: str = "default", batch_size: int = 500) -> int:
+    """apply the oldest pending events in one transaction; returns how many were
+    applied, or 0 if another projector with the same name holds the checkpoint"""
+    with transaction.atomic():
+        checkpoint = (
+            BookingProjectorCheckpoint.objects.select_for_update(skip_locked=True)
+            .filter(name=name)
+            .first()
+        )
+        if checkpoint is None:
+            return 0
+        pending = list(
+            BookingOutbox.objects.order_by("event_id").values_list("id", "event_id")[
+                :batch_size
+            ]
+        )
+        if not pending:
+            return 0
+        for event in BookingEvent.objects.filter(
+            id__in=[event_id for _, event_id in pending]
+        ).order_by("id"):
+            apply_event(event)
+        BookingOutbox.objects.filter(id__in=[id for id, _ in pending]).delete()
+        checkpoint.event_id = pending[-1][1]
+        checkpoint.save(update_fields=["event_id", "updated_at"])
+    return len(pending)
+
+
+def run(
+    name: str = "default",
+    batch_size: int = 500,
+    poll_interval: float = 5.0,
+    once: bool = False,
+    on_batch: typing.Optional[typing.Callable[[int], None]] = None,
+) -> None:
+    """apply pending events until stopped, sleeping on LISTEN/NOTIFY wakeups (or
+    `poll_interval` at most) whenever the outbox is drained"""
+    BookingProjectorCheckpoint.objects.get_or_create(name=name)
+    if not once:
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL};")
+    while True:
+        applied = project_batch(name=name, batch_size=batch_size)
+        if applied and on_batch:
+            on_batch(applied)
+        if applied:
+            continue
+        if once:
+            return
+        _wait_for_notify(poll_interval)
+
+
+def _wait_for_notify(timeout: float) -> None:
+    raw_connection = connection.connection
+    readable, _, _ = select.select([raw_connection.fileno()], [], [], timeout)
+    if readable:
+        # consume the pending notifications; their payloads are not needed
+        raw_connection.execute("SELECT 1")
+
+
+def is_projected(event_id: int) -> bool:
+    """whether every event up to `event_id` has been applied"""
+    return not BookingOutbox.objects.filter(event_id__lte=event_id).exists()
+
+
+def wait_until_projected(event_id: int, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not is_projected(event_id):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+async def await_until_projected(event_id: int, timeout: float) -> bool:
+    """wait_until_projected() polling through the async connection pool"""
+    deadline = time.monotonic() + timeout
+    while await async_db.fetch_one(
+        BookingOutbox.objects.filter(event_id__lte=event_id).values_list("pk")[:1]
+    ):
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
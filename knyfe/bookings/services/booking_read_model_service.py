@@ -0,0 +1,517 @@
+"""process-local replica of the booking projections
+
+Each process bootstraps the replica from the projection table and then tails
+the event log by id. Reads served from it cost no database round trip, but lag
+the database by up to one poll interval; `staleness()` reports how far.
+"""
+
+import bisect
+import collections
+import datetime
+import logging
+import os
+import threading
+import time
+import typing
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+from ..models import BookingEvent, BookingOutbox, BookingProjection
+
+logger = logging.getLogger(__name__)
+
+POLL_BATCH_SIZE = 5_000
+# how long an event id skipped by the tail, or a transaction in flight when the
+# bootstrap snapshot was taken, is waited for before it is taken for rolled back
+GAP_TIMEOUT = 30.0
+
+_PENDING = BookingProjection.Status.PENDING.value
+_ETAG_MASK = (1 << 64) - 1
+
+
+class BookingRow:
+    """one replicated projection row; never changed once indexed, so readers
+    outside the lock see a whole version of it. Events replace it instead."""
+
+    __slots__ = (
+        "id",
+        "booking_key",
+        "owner_id",
+        "starts_at",
+        "ends_at",
+        "applicants",
+        "status",
+        "version",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        booking_key: uuid.UUID,
+        owner_id: int,
+        starts_at: datetime.datetime,
+        ends_at: datetime.datetime,
+        applicants: int,
+        status: str,
+        version: int,
+    ):
+        self.id = id
+        self.booking_key = booking_key
+        self.owner_id = owner_id
+        self.starts_at = starts_at
+        self.ends_at = ends_at
+        self.applicants = applicants
+        self.status = status
+        self.version = version
+
+    def list_row(self) -> tuple:
+        """BOOKING_LIST_COLUMNS followed by the row id, as the table query returns"""
+        return (
+            self.booking_key,
+            self.starts_at,
+            self.ends_at,
+            self.applicants,
+            self.status,
+            self.version,
+            self.id,
+        )
+
+    def hours(self) -> typing.Iterator[datetime.datetime]:
+        """every hour bucket the half-open [starts_at, ends_at) interval overlaps"""
+        hour = self.starts_at.replace(minute=0, second=0, microsecond=0)
+        while hour < self.ends_at:
+            yield hour
+            hour += datetime.timedelta(hours=1)
+
+
+class _Index:
+    """rows ordered by (starts_at, id), the keyset order of list pages"""
+
+    __slots__ = ("keys", "rows")
+
+    def __init__(self):
+        self.keys: typing.List[typing.Tuple[datetime.datetime, int]] = []
+        self.rows: typing.List[BookingRow] = []
+
+    def append(self, row: BookingRow) -> None:
+        self.keys.append((row.starts_at, row.id))
+        self.rows.append(row)
+
+    def add(self, row: BookingRow) -> None:
+        key = (row.starts_at, row.id)
+        index = bisect.bisect_right(self.keys, key)
+        self.keys.insert(index, key)
+        self.rows.insert(index, row)
+
+    def remove(self, row: BookingRow) -> None:
+        index = bisect.bisect_left(self.keys, (row.starts_at, row.id))
+        del self.keys[index]
+        del self.rows[index]
+
+    def page(
+        self,
+        limit: int,
+        after: typing.Optional[typing.Tuple[datetime.datetime, int]],
+        starts_at_gte: typing.Optional[datetime.datetime],
+        starts_at_lt: typing.Optional[datetime.datetime],
+        status: typing.Optional[str],
+    ) -> typing.List[tuple]:
+        start = 0
+        if starts_at_gte is not None:
+            start = bisect.bisect_left(self.keys, (starts_at_gte,))
+        if after is not None:
+            start = max(start, bisect.bisect_right(self.keys, after))
+        page = []
+        for index in range(start, len(self.rows)):
+            row = self.rows[index]
+            if starts_at_lt is not None and row.starts_at >= starts_at_lt:
+                break
+            if status is not None and row.status != status:
+                continue
+            page.append(row.list_row())
+            if len(page) == limit:
+                break
+        return page
+
+
+class _InFlight(typing.NamedTuple):
+    """what the bootstrap snapshot could not see"""
+
+    # the oldest transaction id the bootstrap snapshot saw running
+    xmin: int
+    horizon: int
+    # every transaction below this id started before the bootstrap finished
+    next_xid: int
+    since: float
+
+
+class ReadModel:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._rows: typing.Dict[uuid.UUID, BookingRow] = {}
+        self._all = _Index()
+        self._by_owner: typing.Dict[int, _Index] = collections.defaultdict(_Index)
+        # reserved applicants, pending or approved, per owner and hour bucket
+        self._buckets: typing.Dict[int, typing.Counter[datetime.datetime]] = (
+            collections.defaultdict(collections.Counter)
+        )
+        # order-independent digests of the (booking_key, version) pairs listed
+        self._stamp = 0
+        self._owner_stamps: typing.Dict[int, int] = collections.defaultdict(int)
+        self.watermark = 0
+        # event ids skipped by the tail, with when they were first seen missing
+        self._gaps: typing.Dict[int, float] = {}
+        self._in_flight: typing.Optional[_InFlight] = None
+        self._synced_at: typing.Optional[float] = None
+        self._stopped = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self._synced_at is not None
+
+    def staleness(self) -> float:
+        """seconds since the database state the replica last caught up with"""
+        return time.monotonic() - self._synced_at
+
+    def contains(self, event_id: int) -> bool:
+        """whether the event has been applied to the replica"""
+        return event_id <= self.watermark and event_id not in self._gaps
+
+    def wait_until(self, event_id: int, timeout: float) -> bool:
+        with self._changed:
+            return self._changed.wait_for(lambda: self.contains(event_id), timeout)
+
+    def get(self, booking_key: uuid.UUID) -> typing.Optional[BookingRow]:
+        return self._rows.get(booking_key)
+
+    def page(
+        self,
+        owner_id: typing.Optional[int],
+        limit: int,
+        after: typing.Optional[typing.Tuple[datetime.datetime, int]] = None,
+        starts_at_gte: typing.Optional[datetime.datetime] = None,
+        starts_at_lt: typing.Optional[datetime.datetime] = None,
+        status: typing.Optional[str] = None,
+    ) -> typing.List[tuple]:
+        """query_booking_projection_page() over every booking (owner_id None) or
+        one owner's"""
+        with self._lock:
+            index = self._all if owner_id is None else self._by_owner.get(owner_id)
+            if index is None:
+                return []
+            return index.page(limit, after, starts_at_gte, starts_at_lt, status)
+
+    def stamp(self, owner_id: typing.Optional[int]) -> str:
+        """changes whenever a booking of the owner (of anyone, for None) does"""
+        with self._lock:
+            stamp = (
+                self._stamp if owner_id is None else self._owner_stamps.get(owner_id, 0)
+            )
+        return f"{stamp & _ETAG_MASK:016x}"
+
+    def applicants_by_hour(
+        self, date: datetime.date, owner_id: int
+    ) -> typing.List[typing.Tuple[int, int]]:
+        starts_at = datetime.datetime.combine(
+            date, datetime.time.min, datetime.timezone.utc
+        )
+        with self._lock:
+            buckets = self._buckets.get(owner_id, {})
+            return [
+                (hour, buckets.get(starts_at + datetime.timedelta(hours=hour), 0))
+                for hour in range(24)
+            ]
+
+    def bootstrap(self) -> None:
+        """load the projection table and the event id it reflects from one
+        snapshot"""
+        rows = {}
+        all_ = _Index()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+            horizon = _horizon()
+            xmin = _snapshot_xmin()
+            for values in (
+                BookingProjection.objects.order_by("starts_at", "id")
+                .values_list(
+                    "id",
+                    "booking_key",
+                    "owner_id",
+                    "starts_at",
+                    "ends_at",
+                    "applicants",
+                    "status",
+                    "version",
+                )
+                .iterator(chunk_size=POLL_BATCH_SIZE)
+            ):
+                row = BookingRow(*values)
+                rows[row.booking_key] = row
+                all_.append(row)
+        in_flight = _InFlight(xmin, horizon, _next_xid(), time.monotonic())
+        with self._lock:
+            self._rows = rows
+            self._all = all_
+            self._by_owner.clear()
+            self._buckets.clear()
+            self._stamp = 0
+            self._owner_stamps.clear()
+            for row in all_.rows:
+                self._by_owner[row.owner_id].append(row)
+                self._count(row, 1)
+            self.watermark = horizon
+            self._gaps.clear()
+            self._in_flight = in_flight
+
+    def poll(self) -> int:
+        """apply the events committed since the last poll; returns how many"""
+        started_at = time.monotonic()
+        applied = 0
+        if self._in_flight is not None:
+            # events of a transaction the bootstrap snapshot saw running may
+            # lie below the horizon; they are applied before anything after it
+            if _snapshot_xmin() < self._in_flight.next_xid and (
+                started_at - self._in_flight.since <= GAP_TIMEOUT
+            ):
+                return 0
+            applied += self._apply_in_flight(started_at)
+        horizon = _horizon()
+        if self._gaps:
+            applied += self._apply(
+                _events(Q(id__in=list(self._gaps), id__lte=horizon)), started_at
+            )
+            with self._lock:
+                for event_id, missing_since in list(self._gaps.items()):
+                    if started_at - missing_since > GAP_TIMEOUT:
+                        del self._gaps[event_id]
+        while True:
+            events = _events(Q(id__gt=self.watermark, id__lte=horizon))
+            applied += self._apply(events, started_at)
+            if len(events) < POLL_BATCH_SIZE:
+                break
+        with self._changed:
+            self._synced_at = started_at
+            self._changed.notify_all()
+        return applied
+
+    def run(self) -> None:
+        """bootstrap, then poll until stop()"""
+        interval = settings.BOOKING_READ_MODEL_POLL_INTERVAL
+        try:
+            while not self._stopped.is_set():
+                close_old_connections()
+                try:
+                    if not self.ready and self._in_flight is None:
+                        self.bootstrap()
+                    self.poll()
+                except Exception:
+                    logger.exception("booking read model poll failed")
+                self._stopped.wait(interval)
+        finally:
+            connection.close()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _apply_in_flight(self, started_at: float) -> int:
+        in_flight = self._in_flight
+        applied = 0
+        after = 0
+        while True:
+            events = _events(
+                Q(id__gt=after, id__lte=in_flight.horizon)
+                & Q(_written_since(in_flight.xmin))
+            )
+            applied += self._apply(events, started_at)
+            if len(events) < POLL_BATCH_SIZE:
+                break
+            after = events[-1][0]
+        self._in_flight = None
+        return applied
+
+    def _apply(self, events: typing.List[tuple], started_at: float) -> int:
+        created = [
+            booking_key
+            for _, booking_key, event_type, _, _ in events
+            if event_type == BookingEvent.EventType.CREATED
+        ]
+        ids = dict(
+            BookingProjection.objects.filter(booking_key__in=created).values_list(
+                "booking_key", "id"
+            )
+        )
+        with self._changed:
+            for event_id, booking_key, event_type, version, data in events:
+                if event_id > self.watermark:
+                    for missing in range(self.watermark + 1, event_id):
+                        self._gaps[missing] = started_at
+                    self.watermark = event_id
+                else:
+                    self._gaps.pop(event_id, None)
+                self._apply_event(booking_key, event_type, version, data, ids)
+            self._changed.notify_all()
+        return len(events)
+
+    def _apply_event(self, booking_key, event_type, version, data, ids) -> None:
+        row = self._rows.get(booking_key)
+        if row is not None and row.version >= version:
+            return
+        if event_type == BookingEvent.EventType.CREATED:
+            # no projection left: a later event deletes the booking again
+            if booking_key in ids:
+                self._add(
+                    BookingRow(
+                        id=ids[booking_key],
+                        booking_key=booking_key,
+                        owner_id=data["owner_id"],
+                        starts_at=_to_utc(data["starts_at"]),
+                        ends_at=_to_utc(data["ends_at"]),
+                        applicants=data["applicants"],
+                        status=_PENDING,
+                        version=version,
+                    )
+                )
+            return
+        if row is None:
+            return
+        self._remove(row)
+        if event_type == BookingEvent.EventType.DELETED:
+            return
+        self._add(
+            BookingRow(
+                id=row.id,
+                booking_key=booking_key,
+                owner_id=row.owner_id,
+                starts_at=_to_utc(data["starts_at"])
+                if "starts_at" in data
+                else row.starts_at,
+                ends_at=_to_utc(data["ends_at"]) if "ends_at" in data else row.ends_at,
+                applicants=data.get("applicants", row.applicants),
+                status=data.get("status", row.status),
+                version=version,
+            )
+        )
+
+    def _add(self, row: BookingRow) -> None:
+        self._rows[row.booking_key] = row
+        self._all.add(row)
+        self._by_owner[row.owner_id].add(row)
+        self._count(row, 1)
+
+    def _remove(self, row: BookingRow) -> None:
+        del self._rows[row.booking_key]
+        self._all.remove(row)
+        self._by_owner[row.owner_id].remove(row)
+        self._count(row, -1)
+
+    def _count(self, row: BookingRow, sign: int) -> None:
+        digest = hash((row.booking_key, row.version))
+        self._stamp ^= digest
+        self._owner_stamps[row.owner_id] ^= digest
+        buckets = self._buckets[row.owner_id]
+        for hour in row.hours():
+            buckets[hour] += sign * row.applicants
+            if not buckets[hour]:
+                del buckets[hour]
+
+
+def _horizon() -> int:
+    """the last event id every event up to which has been projected"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+SELECT COALESCE(
+    (SELECT min(event_id) - 1 FROM {BookingOutbox._meta.db_table}),
+    (SELECT max(id) FROM {BookingEvent._meta.db_table}),
+    0
+);
+"""
+        )
+        return cursor.fetchone()[0]
+
+
+def _snapshot_xmin() -> int:
+    """the oldest transaction id still running"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text;")
+        return int(cursor.fetchone()[0])
+
+
+def _next_xid() -> int:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_snapshot_xmax(pg_current_snapshot())::text;")
+        return int(cursor.fetchone()[0])
+
+
+def _written_since(xid: int) -> RawSQL:
+    """rows written by transaction `xid` or a later one, or by one of their
+    subtransactions, which no snapshot lists. xmin holds the low 32 bits of the
+    transaction id, so ids are compared modulo 2^32."""
+    return RawSQL(
+        "(xmin::text::bigint - %s + 4294967296) %% 4294967296 < 2147483648",
+        (xid % 2**32,),
+        output_field=BooleanField(),
+    )
+
+
+def _events(condition: Q) -> typing.List[tuple]:
+    return list(
+        BookingEvent.objects.filter(condition)
+        .order_by("id")
+        .values_list("id", "booking_key", "event_type", "version", "data")[
+            :POLL_BATCH_SIZE
+        ]
+    )
+
+
+def _to_utc(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value).astimezone(datetime.timezone.utc)
+
+
+_read_model: typing.Optional[ReadModel] = None
+_thread: typing.Optional[threading.Thread] = None
+_pid: typing.Optional[int] = None
+_start_lock = threading.Lock()
+
+
+def get_read_model() -> typing.Optional[ReadModel]:
+    """the process's replica once it has caught up, or None while it is off or
+    still bootstrapping; the first call starts it"""
+    if not settings.BOOKING_READ_MODEL:
+        return None
+    model = _read_model
+    if model is None or _pid != os.getpid():
+        model = _start()
+    return model if model.ready else None
+
+
+def _start() -> ReadModel:
+    global _read_model, _thread, _pid
+    with _start_lock:
+        # a forked worker inherits the object but not the thread tailing for it
+        if _read_model is None or _pid != os.getpid():
+            _read_model = ReadModel()
+            _pid = os.getpid()
+            _thread = threading.Thread(
+                target=_read_model.run, name="booking-read-model", daemon=True
+            )
+            _thread.start()
+        return _read_model
+
+
+def stop() -> None:
+    """stop this process's replica; the next get_read_model() starts afresh"""
+    global _read_model, _thread, _pid
+    with _start_lock:
+        if _read_model is not None and _pid == os.getpid():
+            _read_model.stop()
+            _thread.join()
+        _read_model = None
+        _thread = None
+        _pid = None
@@ -0,0 +1,164 @@
+import typing
+import uuid
+
+from django.db import connection, models, transaction
+
+from ..models import (
+    BookingEvent,
+    BookingEventArchive,
+    BookingOutbox,
+    BookingProjection,
+)
+from . import (
+    booking_capacity_service,
+    booking_event_partition_service,
+    booking_event_service,
+    booking_projection_service,
+)
+
+STAGING_TABLE = "bookings_bookingprojection_rebuild"
+
+_PROJECTION_COLUMNS = (
+    "booking_key",
+    "owner_id",
+    "starts_at",
+    "ends_at",
+    "applicants",
+    "status",
+    "version",
+)
+
+
+class PendingEvents(Exception):
+    """the outbox holds events the asynchronous projector has not applied"""
+
+
+class ReplayedEvent(typing.NamedTuple):
+    booking_key: uuid.UUID
+    event_type: str
+    version: int
+    data: dict
+
+
+def iter_events(
+    partition: int = 0,
+    partitions: int = 1,
+    chunk_size: int = 10_000,
+) -> typing.Iterator[ReplayedEvent]:
+    """stream archived events, then the event table's in id order through a
+    server-side cursor, restricted to the booking keys whose hash falls into
+    `partition`"""
+    for archive in BookingEventArchive.objects.order_by("starts_at"):
+        for event in booking_event_partition_service.iter_archived_events(archive):
+            if partitions == 1 or _hash_partition(event.booking_key, partitions) == (
+                partition
+            ):
+                yield ReplayedEvent(
+                    event.booking_key, event.event_type, event.version, event.data
+                )
+    qs = BookingEvent.objects.order_by("id")
+    if partitions > 1:
+        # the last two bytes of the key, as _hash_partition() reads them
+        qs = qs.annotate(
+            partition=models.expressions.RawSQL(
+                "(get_byte(uuid_send(booking_key), 14) * 256 "
+                "+ get_byte(uuid_send(booking_key), 15)) %% %s",
+                (partitions,),
+            )
+        ).filter(partition=partition)
+    # without a transaction the cursor is declared WITH HOLD and the whole log
+    # is materialized before the first fetch, as booking_export_service notes
+    with transaction.atomic():
+        for row in qs.values_list(
+            "booking_key", "event_type", "version", "data"
+        ).iterator(chunk_size=chunk_size):
+            yield ReplayedEvent(*row)
+
+
+def _hash_partition(booking_key: uuid.UUID, partitions: int) -> int:
+    return int.from_bytes(booking_key.bytes[14:], "big") % partitions
+
+
+def fold_events(
+    events: typing.Iterable[ReplayedEvent],
+    progress: typing.Optional[typing.Callable[[int], None]] = None,
+    progress_every: int = 100_000,
+) -> typing.Dict[uuid.UUID, booking_event_service.BookingState]:
+    """fold events into the final state of every live booking; only one compact
+    state per booking is held in memory, never the events themselves"""
+    states: typing.Dict[uuid.UUID, booking_event_service.BookingState] = {}
+    count = 0
+    for event in events:
+        state = booking_event_service.fold_booking_event(
+            states.get(event.booking_key),
+            event_type=event.event_type,
+            data=event.data,
+            version=event.version,
+        )
+        if state is None:
+            states.pop(event.booking_key, None)
+        else:
+            states[event.booking_key] = state
+        count += 1
+        if progress and count % progress_every == 0:
+            progress(count)
+    if progress:
+        progress(count)
+    return states
+
+
+def create_staging_table() -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE};")
+        cursor.execute(
+            f"CREATE UNLOGGED TABLE {STAGING_TABLE} AS "
+            f"SELECT {', '.join(_PROJECTION_COLUMNS)} "
+            f"FROM {BookingProjection._meta.db_table} WITH NO DATA;"
+        )
+
+
+def drop_staging_table() -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE};")
+
+
+def copy_states_to_staging(
+    states: typing.Dict[uuid.UUID, booking_event_service.BookingState],
+) -> int:
+    columns = ", ".join(_PROJECTION_COLUMNS)
+    with connection.cursor() as cursor:
+        with cursor.copy(f"COPY {STAGING_TABLE} ({columns}) FROM STDIN") as copy:
+            for booking_key, state in states.items():
+                copy.write_row(
+                    (
+                        booking_key,
+                        state.owner_id,
+                        state.starts_at,
+                        state.ends_at,
+                        state.applicants,
+                        state.status,
+                        state.version,
+                    )
+                )
+    return len(states)
+
+
+def swap_staging_table() -> int:
+    """replace every projection and capacity bucket with the staged rebuild;
+    call inside a transaction. Refuses while events wait in the outbox: the
+    replay already folded them in, and the projector would apply them again."""
+    table = BookingProjection._meta.db_table
+    columns = ", ".join(_PROJECTION_COLUMNS)
+    with connection.cursor() as cursor:
+        # the projector goes on draining; new events, if any come, wait
+        cursor.execute(f"LOCK TABLE {BookingOutbox._meta.db_table} IN SHARE MODE;")
+        if BookingOutbox.objects.exists():
+            raise PendingEvents()
+        cursor.execute(f"DELETE FROM {table};")
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {STAGING_TABLE};"
+        )
+        count = cursor.rowcount
+    booking_capacity_service.rebuild_capacity_buckets()
+    transaction.on_commit(booking_projection_service.invalidate_booking_cache)
+    return count
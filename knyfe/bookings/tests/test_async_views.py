@@ -0,0 +1,169 @@
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from utils import async_db
+
+from ..models import User
+from ..services import booking_handler
+
+BASE_URL = "http://localhost:8000/api/bookings/"
+AVAILABILITY_URL = "http://localhost:8000/api/availability/segments/"
+ASYNC_BASE_URL = "http://localhost:8000/api/async/bookings/"
+ASYNC_AVAILABILITY_URL = "http://localhost:8000/api/async/availability/segments/"
+
+
+def closing_pool(test):
+    """close the test's event loop pool before the loop goes away"""
+
+    @functools.wraps(test)
+    async def wrapped(self):
+        try:
+            await test(self)
+        finally:
+            await async_db.close_pool()
+
+    return wrapped
+
+
+class AsyncReadViewTests(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        self.admin_user = User.objects.create_user(
+            username="admin", password="password", is_staff=True
+        )
+        self.user = User.objects.create_user(username="nonadmin1", password="password")
+        User.objects.create_user(username="nonadmin2", password="password")
+        starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            minute=0, second=0, microsecond=0
+        )
+        self.date = starts_at.date().isoformat()
+        self.booking_keys = []
+        for hours in range(3):
+            result = booking_handler.handle_create(
+                user=self.user,
+                data={
+                    "starts_at": starts_at + timezone.timedelta(hours=hours),
+                    "ends_at": starts_at + timezone.timedelta(hours=hours + 1),
+                    "applicants": hours + 1,
+                },
+            )
+            self.booking_keys.append(result.unwrap()["booking_key"])
+        booking_handler.handle_approve(
+            user=self.admin_user, booking_key=self.booking_keys[0]
+        )
+        self.client.login(username="nonadmin1", password="password")
+        self.async_client.login(username="nonadmin1", password="password")
+
+    async def _assert_same_response(self, url, async_url, **query):
+        expected = await sync_to_async(self.client.get)(url, query)
+        response = await self.async_client.get(async_url, query)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response.get("ETag"), expected.get("ETag"))
+        self.assertEqual(response.content, expected.content)
+
+    @closing_pool
+    async def test_list_matches_sync_api(self):
+        await self._assert_same_response(BASE_URL, ASYNC_BASE_URL)
+        await self._assert_same_response(BASE_URL, ASYNC_BASE_URL, limit=2)
+        await self._assert_same_response(BASE_URL, ASYNC_BASE_URL, status="APPROVED")
+
+    @closing_pool
+    async def test_list_follows_cursor(self):
+        response = await self.async_client.get(ASYNC_BASE_URL, {"limit": 2})
+        page = response.json()
+        self.assertEqual(len(page["results"]), 2)
+        response = await self.async_client.get(
+            ASYNC_BASE_URL, {"limit": 2, "cursor": page["next"]}
+        )
+        self.assertEqual(
+            [row["booking_key"] for row in response.json()["results"]],
+            [str(self.booking_keys[2])],
+        )
+        self.assertIsNone(response.json()["next"])
+
+    @closing_pool
+    async def test_list_rejects_invalid_input(self):
+        response = await self.async_client.get(ASYNC_BASE_URL, {"cursor": "nope"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Invalid cursor."})
+        response = await self.async_client.get(ASYNC_BASE_URL, {"limit": 0})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("limit", response.json())
+
+    @closing_pool
+    async def test_retrieve_matches_sync_api(self):
+        for booking_key in self.booking_keys:
+            await self._assert_same_response(
+                f"{BASE_URL}{booking_key}/", f"{ASYNC_BASE_URL}{booking_key}/"
+            )
+
+    @closing_pool
+    async def test_retrieve_hides_other_owners_bookings(self):
+        await sync_to_async(self.async_client.login)(
+            username="nonadmin2", password="password"
+        )
+        response = await self.async_client.get(
+            f"{ASYNC_BASE_URL}{self.booking_keys[0]}/"
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"error": "Booking not found"})
+
+    @closing_pool
+    async def test_availability_matches_sync_api(self):
+        await self._assert_same_response(
+            AVAILABILITY_URL, ASYNC_AVAILABILITY_URL, date_utc=self.date
+        )
+
+    @closing_pool
+    async def test_not_modified(self):
+        url = f"{ASYNC_BASE_URL}{self.booking_keys[0]}/"
+        etag = (await self.async_client.get(url))["ETag"]
+        response = await self.async_client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        response = await self.async_client.get(
+            ASYNC_AVAILABILITY_URL,
+            {"date_utc": self.date},
+            headers={"If-None-Match": '"stale"'},
+        )
+        self.assertEqual(response.status_code, 200)
+
+    @closing_pool
+    async def test_requires_authentication_and_get(self):
+        response = await self.async_client.post(ASYNC_BASE_URL)
+        self.assertEqual(response.status_code, 405)
+        await sync_to_async(self.async_client.logout)()
+        response = await self.async_client.get(ASYNC_BASE_URL)
+        self.assertEqual(response.status_code, 403)
+
+    @closing_pool
+    async def test_password_change_ends_session(self):
+        self.assertEqual((await self.async_client.get(ASYNC_BASE_URL)).status_code, 200)
+        self.user.set_password("changed")
+        await sync_to_async(self.user.save)()
+        response = await self.async_client.get(ASYNC_BASE_URL)
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(ASYNC_DB_POOL_SIZE=2)
+    @closing_pool
+    async def test_requests_beyond_pool_size_wait_for_a_connection(self):
+        responses = await asyncio.gather(
+            *(
+                self.async_client.get(
+                    ASYNC_AVAILABILITY_URL,
+                    # distinct dates, so every request misses the cache
+                    {"date_utc": f"2030-01-{day:02d}"},
+                )
+                for day in range(1, 31)
+            )
+        )
+        self.assertEqual({response.status_code for response in responses}, {200})
+        pool = await async_db.get_pool()
+        self.assertEqual(pool.get_stats()["pool_max"], 2)
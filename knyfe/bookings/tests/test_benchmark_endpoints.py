@@ -0,0 +1,39 @@
+import io
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TransactionTestCase
+
+from ..models import BookingEvent, BookingProjection, User
+
+
+class BenchmarkEndpointsTests(TransactionTestCase):
+    databases = "__all__"
+
+    def test_reports_every_benchmark_and_deletes_seeded_rows(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "benchmark.json")
+            call_command(
+                "benchmark_endpoints",
+                "--users=2",
+                "--bookings-per-user=10",
+                "--iterations=3",
+                f"--output={output}",
+                stdout=io.StringIO(),
+            )
+            with open(output) as f:
+                report = json.load(f)
+
+        self.assertEqual(report["users"], 2)
+        self.assertIn("api.availability", report["results"])
+        self.assertIn("service.handle_create", report["results"])
+        for result in report["results"].values():
+            self.assertEqual(result["calls"], 3)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+        # django session, user, and booking queries
+        self.assertEqual(report["results"]["api.list.owner"]["queries_per_call"], 3)
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(BookingProjection.objects.exists())
+        self.assertFalse(BookingEvent.objects.exists())
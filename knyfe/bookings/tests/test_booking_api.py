@@ -1,8 +1,9 @@
+from django.db import transaction
 from django.utils import timezone
 from rest_framework.test import APITestCase
 
 from ..models import User
-from ..services import booking_handler
+from ..services import booking_event_service, booking_handler
 
 BASE_URL = "http://localhost:8000/api/bookings/"
 
@@ -24,14 +25,16 @@ class BookingTests(APITestCase):
             username="nonadmin2",
             password="password",
         )
+        cls.starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        cls.ends_at = cls.starts_at + timezone.timedelta(hours=1)
         # create pending booking
         result = booking_handler.handle_create(
             user=cls.non_admin_user1,
             data={
-                "starts_at": timezone.datetime(
-                    2026, 1, 1, 0, 0, 0, tzinfo=timezone.utc
-                ),
-                "ends_at": timezone.datetime(2026, 1, 1, 1, 0, 0, tzinfo=timezone.utc),
+                "starts_at": cls.starts_at,
+                "ends_at": cls.ends_at,
                 "applicants": 1,
             },
         )
@@ -42,10 +45,8 @@ class BookingTests(APITestCase):
         result = booking_handler.handle_create(
             user=cls.non_admin_user2,
             data={
-                "starts_at": timezone.datetime(
-                    2026, 1, 1, 0, 0, 0, tzinfo=timezone.utc
-                ),
-                "ends_at": timezone.datetime(2026, 1, 1, 1, 0, 0, tzinfo=timezone.utc),
+                "starts_at": cls.starts_at,
+                "ends_at": cls.ends_at,
                 "applicants": 1,
             },
         )
@@ -78,6 +79,54 @@ class BookingTests(APITestCase):
         response = self.client.get(BASE_URL)
         self.assertEqual(response.status_code, 200)
 
+    def test_list_bookings_by_non_admin_only_returns_own(self):
+        self.client.login(username="nonadmin1", password="password")
+        response = self.client.get(BASE_URL)
+        self.assertEqual(
+            [booking["booking_key"] for booking in response.json()["results"]],
+            [str(self.pending_booking_key)],
+        )
+        self.assertIsNone(response.json()["next"])
+
+    def test_list_bookings_pages_with_cursor(self):
+        self.client.login(username="admin", password="password")
+        response = self.client.get(BASE_URL, {"limit": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 1)
+        first_page = response.json()["results"]
+
+        response = self.client.get(
+            BASE_URL, {"limit": 1, "cursor": response.json()["next"]}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()["next"])
+        # both bookings start together, so the id breaks the tie
+        self.assertEqual(
+            [
+                booking["booking_key"]
+                for booking in first_page + response.json()["results"]
+            ],
+            [str(self.pending_booking_key), str(self.approved_booking_key)],
+        )
+
+    def test_list_bookings_filters(self):
+        self.client.login(username="admin", password="password")
+        response = self.client.get(BASE_URL, {"status": "APPROVED"})
+        self.assertEqual(
+            [booking["booking_key"] for booking in response.json()["results"]],
+            [str(self.approved_booking_key)],
+        )
+        after_start = self.starts_at + timezone.timedelta(seconds=1)
+        response = self.client.get(BASE_URL, {"starts_at_from": after_start})
+        self.assertEqual(response.json()["results"], [])
+        response = self.client.get(BASE_URL, {"starts_at_to": after_start})
+        self.assertEqual(len(response.json()["results"]), 2)
+
+    def test_list_bookings_with_invalid_cursor(self):
+        self.client.login(username="admin", password="password")
+        response = self.client.get(BASE_URL, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
     def test_retrieve_booking_by_non_logged_in(self):
         response = self.client.get(f"{BASE_URL}1/")
         self.assertEqual(response.status_code, 403)
@@ -105,8 +154,8 @@ class BookingTests(APITestCase):
     def test_create_approved_booking_by_non_admin(self):
         self.client.login(username="nonadmin1", password="password")
         data = {
-            "starts_at": "2026-01-01T00:00:00Z",
-            "ends_at": "2026-01-01T01:00:00Z",
+            "starts_at": self.starts_at.isoformat(),
+            "ends_at": self.ends_at.isoformat(),
             "applicants": 1,
             "status": "APPROVED",
         }
@@ -128,8 +177,8 @@ class BookingTests(APITestCase):
     def test_create_booking_over_capacity_by_non_admin(self):
         self.client.login(username="nonadmin1", password="password")
         data = {
-            "starts_at": "2026-01-01T00:00:00Z",
-            "ends_at": "2026-01-01T01:00:00Z",
+            "starts_at": self.starts_at.isoformat(),
+            "ends_at": self.ends_at.isoformat(),
             "applicants": 50_000 + 1,
         }
         response = self.client.post(BASE_URL, data)
@@ -138,8 +187,8 @@ class BookingTests(APITestCase):
     def test_create_booking_within_capacity_by_non_admin(self):
         self.client.login(username="nonadmin1", password="password")
         data = {
-            "starts_at": "2026-01-01T00:00:00Z",
-            "ends_at": "2026-01-01T01:00:00Z",
+            "starts_at": self.starts_at.isoformat(),
+            "ends_at": self.ends_at.isoformat(),
             "applicants": 2,
         }
         response = self.client.post(BASE_URL, data)
@@ -148,8 +197,8 @@ class BookingTests(APITestCase):
     def test_create_booking_by_non_admin(self):
         self.client.login(username="nonadmin1", password="password")
         data = {
-            "starts_at": "2026-01-01T00:00:00Z",
-            "ends_at": "2026-01-01T01:00:00Z",
+            "starts_at": self.starts_at.isoformat(),
+            "ends_at": self.ends_at.isoformat(),
             "applicants": 1,
         }
         response = self.client.post(BASE_URL, data)
@@ -159,8 +208,8 @@ class BookingTests(APITestCase):
         # create by nonadmin1
         self.client.login(username="nonadmin1", password="password")
         data = {
-            "starts_at": "2026-01-01T00:00:00Z",
-            "ends_at": "2026-01-01T01:00:00Z",
+            "starts_at": self.starts_at.isoformat(),
+            "ends_at": self.ends_at.isoformat(),
             "applicants": 1,
         }
         response = self.client.post(BASE_URL, data)
@@ -174,8 +223,8 @@ class BookingTests(APITestCase):
     def test_partial_update_pending_booking_by_owner(self):
         self.client.login(username="nonadmin1", password="password")
         data = {
-            "starts_at": "2026-01-01T00:00:00Z",
-            "ends_at": "2026-01-01T01:00:00Z",
+            "starts_at": self.starts_at.isoformat(),
+            "ends_at": self.ends_at.isoformat(),
             "applicants": 1,
         }
         response = self.client.post(BASE_URL, data)
@@ -190,8 +239,8 @@ class BookingTests(APITestCase):
     def test_partial_update_confirmed_booking_by_non_owner(self):
         self.client.login(username="nonadmin1", password="password")
         data = {
-            "starts_at": "2026-01-01T00:00:00Z",
-            "ends_at": "2026-01-01T01:00:00Z",
+            "starts_at": self.starts_at.isoformat(),
+            "ends_at": self.ends_at.isoformat(),
             "applicants": 1,
         }
         response = self.client.patch(
@@ -202,8 +251,8 @@ class BookingTests(APITestCase):
     def test_partial_update_confirmed_booking_by_owner(self):
         self.client.login(username="nonadmin2", password="password")
         data = {
-            "starts_at": "2026-01-01T00:00:00Z",
-            "ends_at": "2026-01-01T01:00:00Z",
+            "starts_at": self.starts_at.isoformat(),
+            "ends_at": self.ends_at.isoformat(),
             "applicants": 1,
         }
         response = self.client.patch(f"{BASE_URL}{self.approved_booking_key}/", data)
@@ -260,3 +309,87 @@ class BookingTests(APITestCase):
         self.client.login(username="admin", password="password")
         response = self.client.delete(f"{BASE_URL}{self.approved_booking_key}/")
         self.assertEqual(response.status_code, 204)
+
+    # versioning
+    def test_retrieve_booking_etag(self):
+        self.client.login(username="nonadmin1", password="password")
+        response = self.client.get(f"{BASE_URL}{self.pending_booking_key}/")
+        self.assertEqual(response["ETag"], f'"{response.data["version"]}"')
+
+    def test_partial_update_with_matching_if_match(self):
+        self.client.login(username="nonadmin1", password="password")
+        etag = self.client.get(f"{BASE_URL}{self.pending_booking_key}/")["ETag"]
+        response = self.client.patch(
+            f"{BASE_URL}{self.pending_booking_key}/",
+            {"applicants": 2},
+            HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_partial_update_with_stale_if_match(self):
+        self.client.login(username="nonadmin1", password="password")
+        etag = self.client.get(f"{BASE_URL}{self.pending_booking_key}/")["ETag"]
+        self.client.patch(f"{BASE_URL}{self.pending_booking_key}/", {"applicants": 2})
+        response = self.client.patch(
+            f"{BASE_URL}{self.pending_booking_key}/",
+            {"applicants": 3},
+            HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 412)
+
+    def test_approve_booking_with_stale_if_match(self):
+        self.client.login(username="admin", password="password")
+        response = self.client.patch(
+            f"{BASE_URL}{self.pending_booking_key}/approve/",
+            HTTP_IF_MATCH='"0"',
+        )
+        self.assertEqual(response.status_code, 412)
+
+    def test_append_event_with_taken_version(self):
+        with self.assertRaises(booking_event_service.VersionConflict):
+            with transaction.atomic():
+                booking_event_service.create_booking_event(
+                    booking_key=self.pending_booking_key,
+                    user_id=self.non_admin_user1.pk,
+                    event_type="UPDATED",
+                    data={"applicants": 2},
+                    version=1,
+                )
+
+    def test_update_booking_performance(self):
+        with self.assertNumQueries(7):
+            # savepoint, locked booking, capacity, stream, event, changed
+            # columns and release
+            result = booking_handler.handle_update(
+                user=self.non_admin_user1,
+                booking_key=self.pending_booking_key,
+                data={"applicants": 2},
+            )
+        self.assertEqual(result.unwrap()["applicants"], 2)
+
+    def test_approve_booking_performance(self):
+        with self.assertNumQueries(6):
+            # savepoint, locked booking, stream, event, status and release
+            result = booking_handler.handle_approve(
+                user=self.admin_user, booking_key=self.pending_booking_key
+            )
+        self.assertEqual(result.unwrap()["status"], "APPROVED")
+
+    def test_delete_booking_performance(self):
+        with self.assertNumQueries(7):
+            # savepoint, locked booking, capacity, stream, event, deletion and
+            # release
+            result = booking_handler.handle_delete(
+                user=self.admin_user, booking_key=self.approved_booking_key
+            )
+        self.assertTrue(result.is_ok())
+
+    def test_update_missing_booking_performance(self):
+        with self.assertNumQueries(3):
+            result = booking_handler.handle_update(
+                user=self.admin_user,
+                booking_key=booking_event_service.generate_key(),
+                data={"applicants": 2},
+            )
+        self.assertEqual(result.get_metadata("status"), 404)
@@ -23,14 +23,15 @@ class BookingAvailabilityTests(APITestCase):
             username="nonadmin2",
             password="password",
         )
+        cls.starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
         # create pending booking
         result = booking_handler.handle_create(
             user=cls.non_admin_user1,
             data={
-                "starts_at": timezone.datetime(
-                    2026, 1, 1, 0, 0, 0, tzinfo=timezone.utc
-                ),
-                "ends_at": timezone.datetime(2026, 1, 1, 1, 0, 0, tzinfo=timezone.utc),
+                "starts_at": cls.starts_at,
+                "ends_at": cls.starts_at + timezone.timedelta(hours=1),
                 "applicants": 1,
             },
         )
@@ -41,10 +42,8 @@ class BookingAvailabilityTests(APITestCase):
         result = booking_handler.handle_create(
             user=cls.non_admin_user2,
             data={
-                "starts_at": timezone.datetime(
-                    2026, 1, 1, 0, 0, 0, tzinfo=timezone.utc
-                ),
-                "ends_at": timezone.datetime(2026, 1, 1, 1, 0, 0, tzinfo=timezone.utc),
+                "starts_at": cls.starts_at,
+                "ends_at": cls.starts_at + timezone.timedelta(hours=1),
                 "applicants": 20_000,
             },
         )
@@ -63,7 +62,7 @@ class BookingAvailabilityTests(APITestCase):
     def test_list_availability_segments_by_non_admin(self):
         self.client.login(username="nonadmin2", password="password")
         params = {
-            "date_utc": "2026-01-01",
+            "date_utc": self.starts_at.date().isoformat(),
         }
         response = self.client.get(self.endpoint, params)
         self.assertEqual(response.status_code, 200)
@@ -73,6 +72,6 @@ class BookingAvailabilityTests(APITestCase):
         self.client.login(username="nonadmin1", password="password")
         with self.assertNumQueries(3):
             params = {
-                "date_utc": "2026-01-01",
+                "date_utc": self.starts_at.date().isoformat(),
             }
             self.client.get(self.endpoint, params)
@@ -0,0 +1,89 @@
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from ..models import User
+from ..services import booking_capacity_service, booking_handler
+
+
+class BookingAvailabilityCacheTests(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        booking_capacity_service.cache_stats.clear()
+        self.admin_user = User.objects.create_user(
+            username="admin",
+            password="password",
+            is_staff=True,
+        )
+        self.user = User.objects.create_user(
+            username="nonadmin1",
+            password="password",
+        )
+        self.starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            minute=0, second=0, microsecond=0
+        )
+
+    def _create(self, applicants):
+        return booking_handler.handle_create(
+            user=self.user,
+            data={
+                "starts_at": self.starts_at,
+                "ends_at": self.starts_at + timezone.timedelta(hours=1),
+                "applicants": applicants,
+            },
+        ).unwrap()["booking_key"]
+
+    def _remaining(self):
+        data = booking_handler.handle_list_availability(
+            date=self.starts_at.date(), user_id=self.user.pk
+        )
+        return data[self.starts_at.hour].remaining
+
+    def test_repeated_reads_are_cached(self):
+        capacity = self._remaining()
+        with self.assertNumQueries(0):
+            self.assertEqual(self._remaining(), capacity)
+        self.assertEqual(
+            booking_capacity_service.get_cache_stats(), {"hits": 1, "misses": 1}
+        )
+
+    def test_approval_keeps_cache(self):
+        capacity = self._remaining()
+        booking_key = self._create(applicants=10)
+        self.assertEqual(self._remaining(), capacity - 10)
+        # approving does not change what is reserved
+        booking_handler.handle_approve(user=self.admin_user, booking_key=booking_key)
+        self.assertEqual(self._remaining(), capacity - 10)
+        self.assertEqual(
+            booking_capacity_service.get_cache_stats(), {"hits": 1, "misses": 2}
+        )
+
+    def test_create_and_delete_invalidate_cache(self):
+        capacity = self._remaining()
+        booking_key = self._create(applicants=10)
+        self.assertEqual(self._remaining(), capacity - 10)
+
+        booking_handler.handle_delete(user=self.admin_user, booking_key=booking_key)
+        self.assertEqual(self._remaining(), capacity)
+        self.assertEqual(
+            booking_capacity_service.get_cache_stats(), {"hits": 0, "misses": 3}
+        )
+
+    def test_other_owner_changes_keep_cache(self):
+        other_user = User.objects.create_user(username="nonadmin2")
+        self._remaining()
+        result = booking_handler.handle_create(
+            user=other_user,
+            data={
+                "starts_at": self.starts_at,
+                "ends_at": self.starts_at + timezone.timedelta(hours=1),
+                "applicants": 10,
+            },
+        )
+        booking_handler.handle_approve(
+            user=self.admin_user, booking_key=result.unwrap()["booking_key"]
+        )
+        self._remaining()
+        self.assertEqual(booking_capacity_service.get_cache_stats()["hits"], 1)
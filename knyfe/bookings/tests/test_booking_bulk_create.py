@@ -0,0 +1,161 @@
+import io
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from ..models import (
+    BookingEvent,
+    BookingOutbox,
+    BookingProjection,
+    BookingStream,
+    User,
+)
+from ..services import booking_capacity_service, booking_projection_service
+
+BASE_URL = "http://localhost:8000/api/bookings/"
+BULK_URL = f"{BASE_URL}bulk/"
+
+
+class BookingBulkCreateTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="nonadmin1", password="password")
+        cls.starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            minute=0, second=0, microsecond=0
+        )
+
+    def setUp(self):
+        self.client.login(username="nonadmin1", password="password")
+
+    def _booking(self, hour, applicants=1, days=0):
+        starts_at = self.starts_at + timezone.timedelta(days=days, hours=hour)
+        return {
+            "starts_at": starts_at.isoformat(),
+            "ends_at": (starts_at + timezone.timedelta(minutes=90)).isoformat(),
+            "applicants": applicants,
+        }
+
+    def _post(self, bookings, atomic=True):
+        return self.client.post(
+            BULK_URL, {"bookings": bookings, "atomic": atomic}, format="json"
+        )
+
+    def assertNothingCreated(self):
+        self.assertFalse(BookingEvent.objects.exists())
+        self.assertFalse(BookingProjection.objects.exists())
+        self.assertFalse(BookingStream.objects.exists())
+
+    def test_bulk_create(self):
+        response = self._post([self._booking(hour) for hour in range(3)])
+        self.assertEqual(response.status_code, 201)
+        results = response.json()["results"]
+        self.assertEqual([item["index"] for item in results], [0, 1, 2])
+        self.assertEqual({item["error"] for item in results}, {None})
+        projections = BookingProjection.objects.filter(owner=self.user)
+        self.assertEqual(
+            {item["booking"]["booking_key"] for item in results},
+            {
+                str(booking_key)
+                for booking_key in projections.values_list("booking_key", flat=True)
+            },
+        )
+        self.assertEqual(
+            int(response["X-Booking-Event-Id"]),
+            BookingEvent.objects.order_by("id").last().id,
+        )
+        self.assertEqual(
+            set(BookingStream.objects.values_list("version", flat=True)), {1}
+        )
+        self.assertEqual(
+            booking_capacity_service.query_capacity_bucket_mismatches(), []
+        )
+
+        response = self.client.get(BASE_URL)
+        self.assertEqual(len(response.json()["results"]), 3)
+
+    def test_atomic_batch_fails_as_a_whole(self):
+        capacity = booking_projection_service.get_booking_capacity()
+        response = self._post([self._booking(0), self._booking(1, applicants=0)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [item["error"] for item in response.json()["results"]],
+            [None, "Applicants must be a positive integer."],
+        )
+        self.assertNothingCreated()
+
+        # over capacity only together, in the hour both bookings overlap
+        response = self._post(
+            [self._booking(0, applicants=capacity), self._booking(1, applicants=1)]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [item["error"] for item in response.json()["results"]],
+            [None, "Applicants must be under booking capacity per slot."],
+        )
+        self.assertNothingCreated()
+        self.assertEqual(
+            booking_capacity_service.query_capacity_bucket_mismatches(), []
+        )
+
+    def test_partial_batch_skips_failing_items(self):
+        capacity = booking_projection_service.get_booking_capacity()
+        response = self._post(
+            [
+                self._booking(0, applicants=capacity),
+                self._booking(1, applicants=1),
+                self._booking(3, applicants=2, days=-9),
+                self._booking(3, applicants=2),
+            ],
+            atomic=False,
+        )
+        self.assertEqual(response.status_code, 207)
+        results = response.json()["results"]
+        self.assertEqual(
+            [item["error"] for item in results],
+            [
+                None,
+                "Applicants must be under booking capacity per slot.",
+                "Booking must be made at least 3 days in advance.",
+                None,
+            ],
+        )
+        self.assertEqual(
+            [item["booking"] is None for item in results], [False, True, True, False]
+        )
+        self.assertEqual(
+            sorted(BookingProjection.objects.values_list("applicants", flat=True)),
+            [2, capacity],
+        )
+        self.assertEqual(
+            booking_capacity_service.query_capacity_bucket_mismatches(), []
+        )
+
+    def test_rejects_malformed_batches(self):
+        self.assertEqual(self._post([]).status_code, 400)
+        response = self._post([self._booking(0), {"starts_at": "nope"}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("bookings", response.json())
+        self.assertNothingCreated()
+
+    @override_settings(BOOKING_PROJECTION_MODE="async")
+    def test_async_projection(self):
+        response = self._post([self._booking(hour) for hour in range(3)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(BookingOutbox.objects.count(), 3)
+        self.assertFalse(BookingProjection.objects.exists())
+
+        call_command("run_projector", "--once", stdout=io.StringIO())
+        self.assertEqual(
+            {
+                str(booking_key)
+                for booking_key in BookingProjection.objects.values_list(
+                    "booking_key", flat=True
+                )
+            },
+            {item["booking"]["booking_key"] for item in response.json()["results"]},
+        )
+        self.assertEqual(
+            booking_capacity_service.query_capacity_bucket_mismatches(), []
+        )
@@ -0,0 +1,166 @@
+import io
+import uuid
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from ..models import BookingEvent, BookingProjection, User
+from ..services import (
+    booking_capacity_service,
+    booking_event_service,
+    booking_handler,
+)
+
+BASE_URL = "http://localhost:8000/api/bookings/"
+APPROVE_URL = f"{BASE_URL}bulk/approve/"
+DELETE_URL = f"{BASE_URL}bulk/delete/"
+
+
+class BookingBulkWriteTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_user(
+            username="admin", password="password", is_staff=True
+        )
+        cls.user = User.objects.create_user(username="nonadmin1", password="password")
+        cls.starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            minute=0, second=0, microsecond=0
+        )
+
+    def setUp(self):
+        self.client.login(username="admin", password="password")
+
+    def _create_bookings(self, count, applicants=1):
+        result = booking_handler.handle_bulk_create(
+            user=self.user,
+            items=[
+                {
+                    "starts_at": self.starts_at + timezone.timedelta(hours=hour),
+                    "ends_at": self.starts_at
+                    + timezone.timedelta(hours=hour, minutes=90),
+                    "applicants": applicants,
+                }
+                for hour in range(count)
+            ],
+        )
+        return [item.booking["booking_key"] for item in result.unwrap()]
+
+    def _post(self, url, booking_keys, atomic=True):
+        return self.client.post(
+            url,
+            {"booking_keys": [str(key) for key in booking_keys], "atomic": atomic},
+            format="json",
+        )
+
+    def _statuses(self):
+        return dict(BookingProjection.objects.values_list("booking_key", "status"))
+
+    def assertBucketsMatchProjections(self):
+        self.assertEqual(
+            booking_capacity_service.query_capacity_bucket_mismatches(), []
+        )
+
+    def test_bulk_approve(self):
+        booking_keys = self._create_bookings(3)
+        missing = uuid.uuid4()
+
+        response = self._post(APPROVE_URL, [*booking_keys, missing])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [item["error"] for item in response.json()["results"]],
+            [None, None, None, "Booking not found"],
+        )
+        self.assertEqual(set(self._statuses().values()), {"PENDING"})
+
+        response = self._post(APPROVE_URL, [*booking_keys, missing], atomic=False)
+        self.assertEqual(response.status_code, 207)
+        results = response.json()["results"]
+        self.assertEqual(
+            [(item["booking"] or {}).get("status") for item in results],
+            ["APPROVED", "APPROVED", "APPROVED", None],
+        )
+        self.assertEqual(BookingEvent.objects.filter(event_type="UPDATED").count(), 3)
+        self.assertEqual(set(self._statuses().values()), {"APPROVED"})
+        self.assertEqual(
+            set(BookingProjection.objects.values_list("version", flat=True)), {2}
+        )
+        self.assertEqual(
+            int(response["X-Booking-Event-Id"]),
+            BookingEvent.objects.order_by("id").last().id,
+        )
+        self.assertBucketsMatchProjections()
+
+        # approving again moves no applicants
+        self.assertEqual(self._post(APPROVE_URL, booking_keys).status_code, 200)
+        self.assertBucketsMatchProjections()
+
+    def test_bulk_delete(self):
+        booking_keys = self._create_bookings(4, applicants=2)
+        booking_handler.handle_approve(
+            user=self.admin_user, booking_key=booking_keys[0]
+        )
+
+        response = self._post(DELETE_URL, booking_keys)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item["booking_key"] for item in response.json()["results"]],
+            [str(key) for key in booking_keys],
+        )
+        self.assertFalse(BookingProjection.objects.exists())
+        self.assertEqual(BookingEvent.objects.filter(event_type="DELETED").count(), 4)
+        self.assertBucketsMatchProjections()
+        for booking_key in booking_keys:
+            self.assertIsNone(booking_event_service.load_booking_state(booking_key))
+
+    def test_requires_staff(self):
+        (booking_key,) = self._create_bookings(1)
+        self.client.login(username="nonadmin1", password="password")
+        self.assertEqual(self._post(APPROVE_URL, [booking_key]).status_code, 403)
+        self.assertEqual(self._post(DELETE_URL, [booking_key]).status_code, 403)
+
+    def test_concurrently_written_bookings(self):
+        booking_keys = self._create_bookings(2)
+        results, currents = booking_handler._load_bulk_write(
+            self.admin_user, booking_keys
+        )
+        booking_handler.handle_approve(
+            user=self.admin_user, booking_key=booking_keys[0]
+        )
+
+        self.assertIsNone(
+            booking_handler._create_bulk_events(
+                self.admin_user, results, currents, "DELETED", {}, atomic=True
+            )
+        )
+        events = booking_handler._create_bulk_events(
+            self.admin_user, results, currents, "DELETED", {}, atomic=False
+        )
+        self.assertEqual([event.booking_key for event in events], booking_keys[1:])
+        self.assertEqual(
+            results[booking_keys[0]].error, "Booking was modified concurrently."
+        )
+
+    @override_settings(BOOKING_PROJECTION_MODE="async")
+    def test_async_projection(self):
+        booking_keys = self._create_bookings(3)
+        self.assertFalse(BookingProjection.objects.exists())
+
+        response = self._post(APPROVE_URL, booking_keys)
+        self.assertEqual(response.status_code, 200)
+        call_command("run_projector", "--once", stdout=io.StringIO())
+        self.assertEqual(set(self._statuses().values()), {"APPROVED"})
+        self.assertBucketsMatchProjections()
+
+        # the first deletion is still pending when the batch loads it
+        booking_handler.handle_delete(user=self.admin_user, booking_key=booking_keys[0])
+        response = self._post(DELETE_URL, booking_keys, atomic=False)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(
+            [item["error"] for item in response.json()["results"]],
+            ["Booking not found", None, None],
+        )
+        call_command("run_projector", "--once", stdout=io.StringIO())
+        self.assertFalse(BookingProjection.objects.exists())
+        self.assertBucketsMatchProjections()
@@ -0,0 +1,125 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ..models import BookingProjection, User
+from ..services import booking_handler, booking_projection_service
+
+
+class BookingCacheTests(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        booking_projection_service.cache_stats.clear()
+        self.user = User.objects.create_user(
+            username="nonadmin1",
+            password="password",
+        )
+        starts_at = timezone.now() + timezone.timedelta(days=10)
+        result = booking_handler.handle_create(
+            user=self.user,
+            data={
+                "starts_at": starts_at,
+                "ends_at": starts_at + timezone.timedelta(hours=1),
+                "applicants": 1,
+            },
+        )
+        self.booking_key = result.unwrap()["booking_key"]
+
+    def _retrieve(self):
+        return booking_handler.handle_retrieve(
+            user=self.user, booking_key=self.booking_key
+        )
+
+    def test_retrieve_is_served_from_cache(self):
+        self._retrieve()
+        with self.assertNumQueries(0):
+            result = self._retrieve()
+        self.assertEqual(result.unwrap()["applicants"], 1)
+        self.assertEqual(
+            booking_projection_service.get_cache_stats(), {"hits": 1, "misses": 1}
+        )
+
+    def test_update_invalidates_on_commit(self):
+        self._retrieve()
+        result = booking_handler.handle_update(
+            user=self.user, booking_key=self.booking_key, data={"applicants": 3}
+        )
+        self.assertTrue(result.is_ok())
+        self.assertEqual(self._retrieve().unwrap()["applicants"], 3)
+        # the update validated against the locked row, not the cached one
+        self.assertEqual(
+            booking_projection_service.get_cache_stats(), {"hits": 0, "misses": 2}
+        )
+
+    def test_delete_invalidates_on_commit(self):
+        self._retrieve()
+        result = booking_handler.handle_delete(
+            user=self.user, booking_key=self.booking_key
+        )
+        self.assertTrue(result.is_ok())
+        self.assertEqual(self._retrieve().get_metadata("status"), 404)
+
+    def test_invalidate_booking_cache_drops_every_entry(self):
+        self._retrieve()
+        booking_projection_service.invalidate_booking_cache()
+        self._retrieve()
+        self.assertEqual(
+            booking_projection_service.get_cache_stats(), {"hits": 0, "misses": 2}
+        )
+
+    def test_row_read_before_a_write_is_not_cached_after_it(self):
+        self._retrieve()
+        booking_projection_service.invalidate_cached_booking(self.booking_key)
+        cache_set = cache.set
+        writes = [
+            lambda: booking_handler.handle_update(
+                user=self.user, booking_key=self.booking_key, data={"applicants": 3}
+            )
+        ]
+
+        def set_after_write(*args, **kwargs):
+            # the write commits between the reader's query and its cache fill
+            while writes:
+                self.assertTrue(writes.pop()().is_ok())
+            return cache_set(*args, **kwargs)
+
+        with mock.patch.object(cache, "set", side_effect=set_after_write):
+            self.assertEqual(self._retrieve().unwrap()["applicants"], 1)
+        self.assertEqual(writes, [])
+        self.assertEqual(self._retrieve().unwrap()["applicants"], 3)
+
+    def test_retrieve_not_modified_skips_projection_query(self):
+        url = f"http://localhost:8000/api/bookings/{self.booking_key}/"
+        client = APIClient()
+        client.login(username="nonadmin1", password="password")
+        etag = client.get(url)["ETag"]
+        with self.assertNumQueries(2):
+            # django session and user queries; the version comes from the cache
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        # another user's booking is not found, even by its entity tag
+        User.objects.create_user(username="nonadmin2", password="password")
+        client.login(username="nonadmin2", password="password")
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+    def test_writes_ignore_stale_entry(self):
+        self._retrieve()
+        # changed behind the cache's back, e.g. by a write racing the read
+        BookingProjection.objects.filter(booking_key=self.booking_key).update(
+            applicants=2, version=2
+        )
+        result = booking_handler.handle_update(
+            user=self.user,
+            booking_key=self.booking_key,
+            data={"applicants": 3},
+            expected_version=2,
+        )
+        self.assertEqual(result.unwrap()["version"], 3)
+        self.assertEqual(self._retrieve().unwrap()["applicants"], 3)
@@ -0,0 +1,196 @@
+import io
+
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from ..models import BookingCapacityBucket, User
+from ..services import (
+    booking_capacity_service,
+    booking_handler,
+    booking_projection_service,
+)
+
+
+class BookingCapacityBucketTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_user(
+            username="admin",
+            password="password",
+            is_staff=True,
+        )
+        cls.user = User.objects.create_user(
+            username="nonadmin1",
+            password="password",
+        )
+        cls.date = (timezone.now() + timezone.timedelta(days=10)).date()
+        cls.midnight = timezone.datetime.combine(
+            cls.date, timezone.datetime.min.time(), timezone.get_current_timezone()
+        )
+
+    def _create(self, starts_at, ends_at, applicants):
+        result = booking_handler.handle_create(
+            user=self.user,
+            data={
+                "starts_at": starts_at,
+                "ends_at": ends_at,
+                "applicants": applicants,
+            },
+        )
+        assert result.is_ok()
+        return result.unwrap()["booking_key"]
+
+    def _approve(self, booking_key):
+        result = booking_handler.handle_approve(
+            user=self.admin_user, booking_key=booking_key
+        )
+        assert result.is_ok()
+
+    def assertBucketsMatchProjections(self):
+        self.assertEqual(
+            booking_capacity_service.query_capacity_bucket_mismatches(), []
+        )
+
+    def test_pending_booking_only_reserves_buckets(self):
+        self._create(
+            self.midnight,
+            self.midnight + timezone.timedelta(hours=1),
+            10,
+        )
+        bucket = BookingCapacityBucket.objects.get()
+        self.assertEqual(bucket.reserved_applicants, 10)
+        self.assertBucketsMatchProjections()
+
+    def test_availability_counts_pending_bookings(self):
+        self._create(
+            self.midnight,
+            self.midnight + timezone.timedelta(hours=1),
+            10,
+        )
+        availability = booking_handler.handle_list_availability(
+            date=self.date, user_id=self.user.pk
+        )
+        self.assertEqual(
+            availability[0].remaining,
+            booking_projection_service.get_booking_capacity() - 10,
+        )
+
+    def test_rejects_inverted_and_overlong_periods(self):
+        for ends_at, error in (
+            (self.midnight, "Booking must end after it starts."),
+            (
+                self.midnight + timezone.timedelta(days=365),
+                "Booking must not be longer than 24 hours.",
+            ),
+        ):
+            result = booking_handler.handle_create(
+                user=self.user,
+                data={"starts_at": self.midnight, "ends_at": ends_at, "applicants": 1},
+            )
+            self.assertEqual(result.error, error)
+        booking_key = self._create(
+            self.midnight, self.midnight + timezone.timedelta(hours=1), 1
+        )
+        result = booking_handler.handle_update(
+            user=self.user,
+            booking_key=booking_key,
+            data={"ends_at": self.midnight - timezone.timedelta(hours=1)},
+        )
+        self.assertEqual(result.error, "Booking must end after it starts.")
+        self.assertEqual(BookingCapacityBucket.objects.count(), 1)
+
+    def test_approved_booking_fills_overlapping_hours(self):
+        booking_key = self._create(
+            self.midnight + timezone.timedelta(hours=1, minutes=30),
+            self.midnight + timezone.timedelta(hours=3),
+            10,
+        )
+        self._approve(booking_key)
+        applicants = dict(
+            booking_capacity_service.query_applicants_by_hour(
+                date=self.date, owner_id=self.user.pk
+            )
+        )
+        self.assertEqual(applicants[0], 0)
+        self.assertEqual(applicants[1], 10)
+        self.assertEqual(applicants[2], 10)
+        self.assertEqual(applicants[3], 0)
+        self.assertBucketsMatchProjections()
+
+    def test_update_and_delete_move_applicants(self):
+        booking_key = self._create(
+            self.midnight,
+            self.midnight + timezone.timedelta(hours=2),
+            10,
+        )
+        self._approve(booking_key)
+        result = booking_handler.handle_update(
+            user=self.admin_user,
+            booking_key=booking_key,
+            data={
+                "starts_at": self.midnight + timezone.timedelta(hours=1),
+                "ends_at": self.midnight + timezone.timedelta(hours=4),
+                "applicants": 5,
+            },
+        )
+        self.assertTrue(result.is_ok())
+        self.assertBucketsMatchProjections()
+
+        result = booking_handler.handle_delete(
+            user=self.admin_user, booking_key=booking_key
+        )
+        self.assertTrue(result.is_ok())
+        self.assertEqual(
+            sum(
+                applicants
+                for _, applicants in booking_capacity_service.query_applicants_by_hour(
+                    date=self.date, owner_id=self.user.pk
+                )
+            ),
+            0,
+        )
+        self.assertBucketsMatchProjections()
+
+    def test_projection_queries_count_overlapping_approved_bookings(self):
+        self._approve(
+            self._create(
+                self.midnight + timezone.timedelta(hours=1, minutes=30),
+                self.midnight + timezone.timedelta(hours=3),
+                10,
+            )
+        )
+        self._create(self.midnight, self.midnight + timezone.timedelta(hours=4), 5)
+        capacity = booking_projection_service.get_booking_capacity()
+        self.assertEqual(
+            booking_projection_service.query_remaining_capacity(
+                starts_at=self.midnight + timezone.timedelta(hours=2),
+                ends_at=self.midnight + timezone.timedelta(hours=4),
+                user_id=self.user.pk,
+            ),
+            capacity - 10,
+        )
+        applicants = (
+            booking_projection_service.query_booking_projection_applicants_by_hour(
+                date=self.date, user_id=self.user.pk
+            )
+        )
+        self.assertEqual(applicants[:4], [(0, 0), (1, 10), (2, 10), (3, 0)])
+
+    def test_backfill_command_repairs_buckets(self):
+        booking_key = self._create(
+            self.midnight,
+            self.midnight + timezone.timedelta(hours=1),
+            10,
+        )
+        self._approve(booking_key)
+        BookingCapacityBucket.objects.all().delete()
+        self.assertEqual(
+            [
+                (mismatch.expected, mismatch.actual)
+                for mismatch in booking_capacity_service.query_capacity_bucket_mismatches()
+            ],
+            [(10, 0)],
+        )
+        call_command("backfill_capacity_buckets", stdout=io.StringIO())
+        self.assertBucketsMatchProjections()
@@ -0,0 +1,223 @@
+import threading
+import time
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from ..models import BookingCapacityBucket, BookingProjection, User
+from ..services import (
+    booking_capacity_service,
+    booking_event_service,
+    booking_handler,
+    booking_projection_service,
+)
+
+
+class BookingCapacityConcurrencyTests(TransactionTestCase):
+    workers = 16
+    requests = 200
+    applicants = 400
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="nonadmin1",
+            password="password",
+        )
+        self.starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            minute=0, second=0, microsecond=0
+        )
+
+    def _run_in_threads(self, target, count):
+        threads = [threading.Thread(target=target) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_parallel_creates_never_overbook_slot(self):
+        capacity = booking_projection_service.get_booking_capacity()
+        remaining = list(range(self.requests))
+        accepted = []
+        rejected = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        if not remaining:
+                            return
+                        remaining.pop()
+                    result = booking_handler.handle_create(
+                        user=self.user,
+                        data={
+                            "starts_at": self.starts_at,
+                            "ends_at": self.starts_at + timezone.timedelta(hours=1),
+                            "applicants": self.applicants,
+                        },
+                    )
+                    with lock:
+                        (rejected if result.is_error() else accepted).append(result)
+            except Exception as e:  # pragma: no cover - reported below
+                with lock:
+                    errors.append(e)
+            finally:
+                connection.close()
+
+        self._run_in_threads(worker, self.workers)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(accepted), capacity // self.applicants)
+        self.assertEqual(len(accepted) + len(rejected), self.requests)
+        self.assertEqual(
+            BookingProjection.objects.filter(owner=self.user).count(), len(accepted)
+        )
+        bucket = BookingCapacityBucket.objects.get(
+            owner=self.user, starts_at=self.starts_at
+        )
+        self.assertLessEqual(bucket.reserved_applicants, capacity)
+        self.assertEqual(bucket.reserved_applicants, len(accepted) * self.applicants)
+
+    def test_reservation_does_not_block_other_slots(self):
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_first_slot():
+            try:
+                with transaction.atomic():
+                    booking_capacity_service.reserve_capacity(
+                        owner_id=self.user.pk,
+                        deltas=[
+                            booking_capacity_service.CapacityDelta(
+                                starts_at=self.starts_at,
+                                ends_at=self.starts_at + timezone.timedelta(hours=1),
+                                applicants=1,
+                            )
+                        ],
+                        capacity=1,
+                    )
+                    locked.set()
+                    release.wait(timeout=10)
+            finally:
+                connection.close()
+
+        holder = threading.Thread(target=hold_first_slot)
+        holder.start()
+        try:
+            self.assertTrue(locked.wait(timeout=10))
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL lock_timeout = '1s'")
+                self.assertTrue(
+                    booking_capacity_service.reserve_capacity(
+                        owner_id=self.user.pk,
+                        deltas=[
+                            booking_capacity_service.CapacityDelta(
+                                starts_at=self.starts_at + timezone.timedelta(hours=1),
+                                ends_at=self.starts_at + timezone.timedelta(hours=2),
+                                applicants=1,
+                            )
+                        ],
+                        capacity=1,
+                    )
+                )
+        finally:
+            release.set()
+            holder.join()
+
+
+class BookingWriteLockOrderTests(TransactionTestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin", password="password", is_staff=True
+        )
+        self.user = User.objects.create_user(username="nonadmin1", password="password")
+        self.starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            minute=0, second=0, microsecond=0
+        )
+        self.booking_key = booking_handler.handle_create(
+            user=self.user,
+            data={
+                "starts_at": self.starts_at,
+                "ends_at": self.starts_at + timezone.timedelta(hours=1),
+                "applicants": 1,
+            },
+        ).unwrap()["booking_key"]
+
+    def _wait_for_lock_waiter(self):
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT COUNT(*) FROM pg_stat_activity "
+                    "WHERE datname = current_database() AND wait_event_type = 'Lock'"
+                )
+                if cursor.fetchone()[0]:
+                    return
+            time.sleep(0.01)
+        self.fail("the bulk write never waited for a lock")
+
+    def test_single_and_bulk_writes_lock_in_the_same_order(self):
+        create_booking_event = booking_event_service.create_booking_event
+        locked = threading.Event()
+        release = threading.Event()
+        results = {}
+        errors = []
+
+        def create_after_release(**kwargs):
+            # the update holds the projection row and the buckets here, and has
+            # yet to advance the stream head
+            locked.set()
+            release.wait(timeout=10)
+            return create_booking_event(**kwargs)
+
+        def run(name, write):
+            try:
+                results[name] = write()
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        single = threading.Thread(
+            target=run,
+            args=(
+                "single",
+                lambda: booking_handler.handle_update(
+                    user=self.user,
+                    booking_key=self.booking_key,
+                    data={"applicants": 2},
+                ),
+            ),
+        )
+        bulk = threading.Thread(
+            target=run,
+            args=(
+                "bulk",
+                lambda: booking_handler.handle_bulk_delete(
+                    user=self.admin_user, booking_keys=[self.booking_key]
+                ),
+            ),
+        )
+        with mock.patch.object(
+            booking_event_service, "create_booking_event", create_after_release
+        ):
+            single.start()
+            try:
+                self.assertTrue(locked.wait(timeout=10))
+                bulk.start()
+                self._wait_for_lock_waiter()
+            finally:
+                release.set()
+                single.join()
+        bulk.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(results["single"].unwrap()["applicants"], 2)
+        self.assertEqual(results["bulk"].get_metadata("status"), 409)
+        self.assertEqual(
+            booking_capacity_service.query_capacity_bucket_mismatches(), []
+        )
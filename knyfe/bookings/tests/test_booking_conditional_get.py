@@ -0,0 +1,102 @@
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from ..models import User
+from ..services import booking_handler
+
+BASE_URL = "http://localhost:8000/api/bookings/"
+AVAILABILITY_URL = "http://localhost:8000/api/availability/segments/"
+
+
+class BookingConditionalGetTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_user(
+            username="admin",
+            password="password",
+            is_staff=True,
+        )
+        cls.non_admin_user1 = User.objects.create_user(
+            username="nonadmin1",
+            password="password",
+        )
+        cls.non_admin_user2 = User.objects.create_user(
+            username="nonadmin2",
+            password="password",
+        )
+        cls.starts_at = timezone.now() + timezone.timedelta(days=10)
+
+    def setUp(self):
+        cache.clear()
+        self.booking_key = self._create(self.non_admin_user1)
+        self.client.login(username="nonadmin1", password="password")
+
+    def _create(self, user):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = booking_handler.handle_create(
+                user=user,
+                data={
+                    "starts_at": self.starts_at,
+                    "ends_at": self.starts_at + timezone.timedelta(hours=1),
+                    "applicants": 1,
+                },
+            )
+        return result.unwrap()["booking_key"]
+
+    def _approve(self, booking_key):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking_handler.handle_approve(
+                user=self.admin_user, booking_key=booking_key
+            )
+
+    def test_list_not_modified_skips_projection_query(self):
+        etag = self.client.get(BASE_URL)["ETag"]
+        with self.assertNumQueries(2):
+            # django session and user queries
+            response = self.client.get(BASE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_list_etag_changes_with_own_bookings_only(self):
+        etag = self.client.get(BASE_URL)["ETag"]
+        self._create(self.non_admin_user2)
+        response = self.client.get(BASE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self._create(self.non_admin_user1)
+        response = self.client.get(BASE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_staff_list_etag_changes_with_any_booking(self):
+        self.client.login(username="admin", password="password")
+        etag = self.client.get(BASE_URL)["ETag"]
+        self._create(self.non_admin_user2)
+        response = self.client.get(BASE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_retrieve_not_modified_until_updated(self):
+        url = f"{BASE_URL}{self.booking_key}/"
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=f"W/{etag}")
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {"applicants": 2})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["applicants"], 2)
+
+    def test_availability_not_modified_until_reserved(self):
+        params = {"date_utc": self.starts_at.date().isoformat()}
+        etag = self.client.get(AVAILABILITY_URL, params)["ETag"]
+        # approving leaves the reserved capacity as it was
+        self._create(self.non_admin_user2)
+        self._approve(self.booking_key)
+        response = self.client.get(AVAILABILITY_URL, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self._create(self.non_admin_user1)
+        response = self.client.get(AVAILABILITY_URL, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
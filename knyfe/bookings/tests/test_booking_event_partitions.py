@@ -0,0 +1,264 @@
+import datetime
+import hashlib
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from ..models import BookingEvent, BookingEventArchive, BookingProjection, User
+from ..services import (
+    booking_event_partition_service,
+    booking_event_service,
+    booking_handler,
+    booking_replay_service,
+)
+
+PROJECTION_COLUMNS = (
+    "booking_key",
+    "owner_id",
+    "starts_at",
+    "ends_at",
+    "applicants",
+    "status",
+    "version",
+)
+ARCHIVED_MONTH = datetime.datetime(2001, 3, 1, tzinfo=datetime.timezone.utc)
+
+
+def _partition_of(event_id):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT tableoid::regclass::text FROM bookings_bookingevent WHERE id = %s;",
+            [event_id],
+        )
+        return cursor.fetchone()[0]
+
+
+class BookingEventPartitionTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin", password="password", is_staff=True
+        )
+        self.user = User.objects.create_user(username="nonadmin1", password="password")
+        self.starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            minute=0, second=0, microsecond=0
+        )
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        settings_override = override_settings(
+            BOOKING_EVENT_ARCHIVE_DIR=archive_dir.name
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _create_booking(self, hour, applicants=1):
+        result = booking_handler.handle_create(
+            user=self.user,
+            data={
+                "starts_at": self.starts_at + timezone.timedelta(hours=hour),
+                "ends_at": self.starts_at + timezone.timedelta(hours=hour + 1),
+                "applicants": applicants,
+            },
+        )
+        return result.unwrap()["booking_key"]
+
+    def _move_to_archived_month(self, booking_keys):
+        """backdate the bookings' events so far they get a partition of their own"""
+        for index, event in enumerate(
+            BookingEvent.objects.filter(booking_key__in=booking_keys).order_by("id")
+        ):
+            BookingEvent.objects.filter(id=event.id).update(
+                timestamp=ARCHIVED_MONTH + timezone.timedelta(minutes=index)
+            )
+        booking_event_partition_service.ensure_partitions()
+
+    def test_events_are_stored_in_their_month_partition(self):
+        self._create_booking(0)
+        event = BookingEvent.objects.get()
+        self.assertEqual(
+            _partition_of(event.id),
+            booking_event_partition_service.partition_for(event.timestamp).name,
+        )
+
+    def test_ensure_partitions_moves_events_out_of_default_partition(self):
+        booking_key = self._create_booking(0)
+        BookingEvent.objects.filter(booking_key=booking_key).update(
+            timestamp=ARCHIVED_MONTH
+        )
+        event = BookingEvent.objects.get()
+        self.assertEqual(
+            _partition_of(event.id), booking_event_partition_service.DEFAULT_PARTITION
+        )
+
+        created = booking_event_partition_service.ensure_partitions(months_ahead=14)
+        partition = booking_event_partition_service.partition_for(ARCHIVED_MONTH)
+        self.assertIn(partition, created)
+        self.assertEqual(_partition_of(event.id), partition.name)
+        ahead = booking_event_partition_service.partition_for(
+            booking_event_partition_service.add_months(timezone.now(), 14)
+        )
+        self.assertIn(ahead, booking_event_partition_service.list_partitions())
+        self.assertEqual(
+            booking_event_partition_service.ensure_partitions(months_ahead=14), []
+        )
+
+    def test_append_rejects_taken_version(self):
+        booking_key = self._create_booking(0)
+
+        def append(version):
+            return booking_event_service.create_booking_event(
+                booking_key=booking_key,
+                user_id=self.user.pk,
+                event_type="UPDATED",
+                data={"applicants": 2},
+                version=version,
+            )
+
+        with self.assertRaises(booking_event_service.VersionConflict):
+            append(1)
+        append(2)
+        with self.assertRaises(booking_event_service.VersionConflict):
+            append(2)
+
+    def test_archive_partition(self):
+        approved = self._create_booking(0)
+        booking_handler.handle_approve(user=self.admin_user, booking_key=approved)
+        deleted = self._create_booking(1)
+        booking_handler.handle_delete(user=self.user, booking_key=deleted)
+        untouched = self._create_booking(2, applicants=3)
+        self._move_to_archived_month([approved, deleted, untouched])
+        # continues after the archived month
+        booking_handler.handle_update(
+            user=self.admin_user,
+            booking_key=approved,
+            data={"applicants": 5},
+        )
+        states = {
+            booking_key: booking_event_service.load_booking_state(booking_key)
+            for booking_key in (approved, deleted, untouched)
+        }
+        projections = set(BookingProjection.objects.values_list(*PROJECTION_COLUMNS))
+
+        partition = booking_event_partition_service.partition_for(ARCHIVED_MONTH)
+        self.assertIn(
+            partition,
+            booking_event_partition_service.archivable_partitions(older_than_months=1),
+        )
+        archive = booking_event_partition_service.archive_partition(partition)
+
+        self.assertEqual(archive.events, 5)
+        with open(booking_event_partition_service.archive_path(archive), "rb") as f:
+            self.assertEqual(hashlib.sha256(f.read()).hexdigest(), archive.sha256)
+        self.assertNotIn(partition, booking_event_partition_service.list_partitions())
+        self.assertEqual(BookingEvent.objects.count(), 1)
+        self.assertEqual(
+            [
+                (event.booking_key, event.version)
+                for event in booking_event_partition_service.iter_archived_events(
+                    archive, booking_key=approved
+                )
+            ],
+            [(approved, 1), (approved, 2)],
+        )
+        for booking_key, state in states.items():
+            self.assertEqual(
+                booking_event_service.load_booking_state(booking_key), state
+            )
+            self.assertEqual(
+                booking_event_service.load_booking_state(
+                    booking_key, use_snapshots=False
+                ),
+                state,
+            )
+        self.assertEqual(
+            booking_event_service.load_booking_state(
+                approved, as_of=ARCHIVED_MONTH + timezone.timedelta(minutes=30)
+            ).status,
+            BookingProjection.Status.APPROVED,
+        )
+        self.assertEqual(
+            booking_replay_service.fold_events(booking_replay_service.iter_events()),
+            {approved: states[approved], untouched: states[untouched]},
+        )
+        self.assertEqual(
+            {
+                booking_key
+                for partition in range(3)
+                for booking_key in booking_replay_service.fold_events(
+                    booking_replay_service.iter_events(partition, partitions=3)
+                )
+            },
+            {approved, untouched},
+        )
+        call_command("rebuild_projections", stdout=io.StringIO())
+        self.assertEqual(
+            set(BookingProjection.objects.values_list(*PROJECTION_COLUMNS)), projections
+        )
+
+        # the month is not recreated for events that have been archived
+        booking_event_partition_service.ensure_partitions()
+        self.assertNotIn(partition, booking_event_partition_service.list_partitions())
+        self.assertEqual(BookingEventArchive.objects.get().partition, partition.name)
+
+    def test_archive_snapshots_streams_continued_from_an_earlier_archive(self):
+        booking_keys = [self._create_booking(hour) for hour in range(3)]
+        self._move_to_archived_month(booking_keys)
+        booking_event_partition_service.archive_partition(
+            booking_event_partition_service.partition_for(ARCHIVED_MONTH)
+        )
+        next_month = booking_event_partition_service.add_months(ARCHIVED_MONTH, 1)
+        for booking_key in booking_keys[:2]:
+            event = booking_handler.handle_approve(
+                user=self.admin_user, booking_key=booking_key
+            ).get_metadata("event_id")
+            BookingEvent.objects.filter(id=event).update(timestamp=next_month)
+        booking_event_partition_service.ensure_partitions()
+        states = {
+            booking_key: booking_event_service.load_booking_state(
+                booking_key, use_snapshots=False
+            )
+            for booking_key in booking_keys
+        }
+
+        with self.assertNumQueries(3):
+            # the streams, the states they continue, and the snapshots
+            booking_event_partition_service._snapshot_streams(
+                booking_event_partition_service.partition_for(next_month)
+            )
+        for booking_key, state in states.items():
+            self.assertEqual(
+                booking_event_service.load_booking_state(booking_key), state
+            )
+
+    def test_corrupt_archive_is_not_read(self):
+        booking_key = self._create_booking(0)
+        self._move_to_archived_month([booking_key])
+        archive = booking_event_partition_service.archive_partition(
+            booking_event_partition_service.partition_for(ARCHIVED_MONTH)
+        )
+        with open(booking_event_partition_service.archive_path(archive), "ab") as f:
+            f.write(b"\0")
+        with self.assertRaises(booking_event_partition_service.CorruptArchive):
+            next(booking_event_partition_service.iter_archived_events(archive))
+        with self.assertRaises(booking_event_partition_service.CorruptArchive):
+            booking_event_service.load_booking_state(booking_key, use_snapshots=False)
+
+    @override_settings(BOOKING_PROJECTION_MODE="async")
+    def test_archive_skips_pending_events(self):
+        booking_key = self._create_booking(0)
+        self._move_to_archived_month([booking_key])
+        out = io.StringIO()
+        err = io.StringIO()
+        call_command(
+            "archive_event_partitions", "--older-than-months=1", stdout=out, stderr=err
+        )
+        partition = booking_event_partition_service.partition_for(ARCHIVED_MONTH)
+        self.assertIn(f"Skipped {partition.name}", err.getvalue())
+        self.assertIn(partition, booking_event_partition_service.list_partitions())
+        self.assertFalse(os.listdir(settings.BOOKING_EVENT_ARCHIVE_DIR))
@@ -0,0 +1,84 @@
+import csv
+import io
+import json
+
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from ..models import User
+from ..services import booking_handler
+
+BASE_URL = "http://localhost:8000/api/exports/"
+
+
+class BookingExportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_user(
+            username="admin",
+            password="password",
+            is_staff=True,
+        )
+        cls.non_admin_user = User.objects.create_user(
+            username="nonadmin1",
+            password="password",
+        )
+        cls.starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        cls.booking_keys = []
+        for day in range(3):
+            result = booking_handler.handle_create(
+                user=cls.non_admin_user,
+                data={
+                    "starts_at": cls.starts_at + timezone.timedelta(days=day),
+                    "ends_at": cls.starts_at + timezone.timedelta(days=day, hours=1),
+                    "applicants": day + 1,
+                },
+            )
+            cls.booking_keys.append(str(result.unwrap()["booking_key"]))
+
+    def setUp(self):
+        self.client.login(username="admin", password="password")
+
+    def _content(self, response):
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_requires_staff(self):
+        self.client.login(username="nonadmin1", password="password")
+        response = self.client.get(f"{BASE_URL}bookings/")
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_bookings_as_ndjson(self):
+        response = self.client.get(f"{BASE_URL}bookings/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual([row["booking_key"] for row in rows], self.booking_keys)
+        self.assertEqual([row["applicants"] for row in rows], [1, 2, 3])
+
+    def test_export_bookings_in_date_range_as_csv(self):
+        response = self.client.get(
+            f"{BASE_URL}bookings/",
+            {
+                "output": "csv",
+                "since": (self.starts_at + timezone.timedelta(days=1)).isoformat(),
+                "until": (self.starts_at + timezone.timedelta(days=2)).isoformat(),
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(io.StringIO(self._content(response))))
+        self.assertEqual([row["booking_key"] for row in rows], self.booking_keys[1:2])
+
+    def test_export_events_as_csv(self):
+        response = self.client.get(f"{BASE_URL}events/", {"output": "csv"})
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.DictReader(io.StringIO(self._content(response))))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(json.loads(rows[0]["data"])["applicants"], 1)
+
+    def test_export_with_invalid_output(self):
+        response = self.client.get(f"{BASE_URL}events/", {"output": "xml"})
+        self.assertEqual(response.status_code, 400)
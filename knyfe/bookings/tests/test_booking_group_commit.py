@@ -0,0 +1,207 @@
+import concurrent.futures
+import threading
+from unittest import mock
+
+import psycopg
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from ..models import BookingEvent, BookingProjection, User
+from ..services import (
+    booking_capacity_service,
+    booking_group_commit_service,
+    booking_handler,
+    booking_projection_service,
+)
+
+
+@override_settings(BOOKING_GROUP_COMMIT=True, BOOKING_GROUP_COMMIT_WINDOW=0.5)
+class BookingGroupCommitTests(TransactionTestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin", password="password", is_staff=True
+        )
+        self.user = User.objects.create_user(username="nonadmin1", password="password")
+        self.starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            minute=0, second=0, microsecond=0
+        )
+        self.addCleanup(booking_group_commit_service.stop)
+
+    def _data(self, hour, applicants=1):
+        return {
+            "starts_at": self.starts_at + timezone.timedelta(hours=hour),
+            "ends_at": self.starts_at + timezone.timedelta(hours=hour, minutes=30),
+            "applicants": applicants,
+        }
+
+    def _concurrently(self, *calls):
+        """results of `calls`, each made from a thread of its own"""
+        results = [None] * len(calls)
+
+        def run(index, call):
+            try:
+                results[index] = call()
+            except Exception as e:
+                results[index] = e
+
+        threads = [
+            threading.Thread(target=run, args=(index, call))
+            for index, call in enumerate(calls)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_commits_concurrent_writes_together(self):
+        capacity = booking_projection_service.get_booking_capacity()
+        with mock.patch.object(
+            booking_group_commit_service.GroupCommitter,
+            "_flush",
+            autospec=True,
+            side_effect=booking_group_commit_service.GroupCommitter._flush,
+        ) as flush:
+            results = self._concurrently(
+                lambda: booking_handler.handle_create(self.user, self._data(0)),
+                lambda: booking_handler.handle_create(self.user, self._data(1)),
+                lambda: booking_handler.handle_create(
+                    self.user, self._data(0, applicants=capacity + 1)
+                ),
+                lambda: booking_handler.handle_create(self.user, self._data(2)),
+            )
+        self.assertEqual(flush.call_count, 1)
+        self.assertEqual(
+            [result.error for result in results],
+            [None, None, "Applicants must be under booking capacity per slot.", None],
+        )
+        self.assertEqual(
+            {result.value["booking_key"] for result in results if result.is_ok()},
+            set(BookingProjection.objects.values_list("booking_key", flat=True)),
+        )
+        self.assertEqual(
+            {result.get_metadata("event_id") for result in results if result.is_ok()},
+            set(BookingEvent.objects.values_list("id", flat=True)),
+        )
+        self.assertEqual(
+            booking_capacity_service.query_capacity_bucket_mismatches(), []
+        )
+
+    def test_concurrent_writes_to_one_booking(self):
+        booking_key = booking_handler.handle_create(self.user, self._data(0)).unwrap()[
+            "booking_key"
+        ]
+        results = self._concurrently(
+            *(
+                lambda: booking_handler.handle_update(
+                    self.user, booking_key, {"applicants": 2}, expected_version=1
+                )
+                for _ in range(2)
+            )
+        )
+        # the second write in the batch reads the first one's row
+        self.assertEqual(
+            sorted(result.get_metadata("status") or 200 for result in results),
+            [200, 412],
+        )
+        self.assertEqual(BookingEvent.objects.count(), 2)
+        self.assertEqual(
+            booking_capacity_service.query_capacity_bucket_mismatches(), []
+        )
+
+    def test_failed_commit_fails_every_write(self):
+        def write_for_missing_owner():
+            # the foreign key is deferred, so only the commit notices
+            with transaction.atomic():
+                booking_capacity_service.apply_owner_capacity_deltas(
+                    [
+                        booking_capacity_service.OwnerCapacityDelta(
+                            owner_id=0,
+                            starts_at=self.starts_at,
+                            ends_at=self.starts_at + timezone.timedelta(hours=1),
+                            applicants=1,
+                        )
+                    ]
+                )
+
+        results = self._concurrently(
+            lambda: booking_handler.handle_create(self.user, self._data(0)),
+            lambda: booking_group_commit_service.run_write(write_for_missing_owner),
+        )
+        self.assertEqual([type(result) for result in results], [IntegrityError] * 2)
+        self.assertFalse(BookingEvent.objects.exists())
+        # the next batch commits on a new connection
+        self.assertTrue(booking_handler.handle_create(self.user, self._data(0)).is_ok())
+
+    def test_writes_inside_a_transaction_run_in_place(self):
+        with transaction.atomic():
+            result = booking_handler.handle_create(self.user, self._data(0))
+            self.assertTrue(
+                BookingProjection.objects.filter(
+                    booking_key=result.unwrap()["booking_key"]
+                ).exists()
+            )
+        self.assertIsNone(booking_group_commit_service._committer)
+
+    def _write(self, write, lock_key=""):
+        return booking_group_commit_service._Write(
+            write, lock_key, concurrent.futures.Future()
+        )
+
+    def test_runs_batches_in_lock_key_order(self):
+        calls = []
+        batch = [
+            self._write(lambda key=key: calls.append(key) or key, lock_key=key)
+            for key in ("owner:2", "booking:b", "owner:1", "booking:a")
+        ]
+        booking_group_commit_service.GroupCommitter()._flush(batch)
+        self.assertEqual(calls, ["booking:a", "booking:b", "owner:1", "owner:2"])
+        self.assertEqual(
+            [item.future.result() for item in batch],
+            ["owner:2", "booking:b", "owner:1", "booking:a"],
+        )
+
+    def test_retries_deadlock_victims_alone(self):
+        in_batch = []
+
+        def deadlocked_once():
+            in_batch.append(connection.in_atomic_block)
+            if len(in_batch) == 1:
+                try:
+                    raise psycopg.errors.DeadlockDetected("deadlock detected")
+                except psycopg.Error as exc:
+                    raise OperationalError(str(exc)) from exc
+            return "retried"
+
+        def failed():
+            raise OperationalError("connection lost")
+
+        batch = [self._write(deadlocked_once), self._write(failed)]
+        booking_group_commit_service.GroupCommitter()._flush(batch)
+        self.assertEqual(batch[0].future.result(), "retried")
+        self.assertEqual(in_batch, [True, False])
+        with self.assertRaises(OperationalError):
+            batch[1].future.result()
+
+    @override_settings(BOOKING_GROUP_COMMIT_TIMEOUT=0.01)
+    def test_submit_times_out_when_nothing_flushes(self):
+        committer = booking_group_commit_service.GroupCommitter()
+        write = mock.Mock()
+        with self.assertRaises(TimeoutError):
+            committer.submit(write)
+        # the caller gave up, so the write no longer runs
+        committer._flush(committer._next_batch())
+        write.assert_not_called()
+
+    def test_dead_flusher_fails_its_writes(self):
+        with mock.patch.object(
+            booking_group_commit_service.GroupCommitter,
+            "_flush",
+            side_effect=ValueError("bug"),
+        ), self.assertLogs(booking_group_commit_service.logger):
+            with self.assertRaisesMessage(RuntimeError, "flusher died"):
+                booking_handler.handle_create(self.user, self._data(0))
+            booking_group_commit_service._thread.join()
+        # the next write starts another flusher
+        self.assertTrue(booking_handler.handle_create(self.user, self._data(0)).is_ok())
@@ -0,0 +1,149 @@
+import io
+import threading
+import time
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from ..models import (
+    BookingOutbox,
+    BookingProjection,
+    BookingProjectorCheckpoint,
+    User,
+)
+from ..services import booking_handler, booking_projector_service
+
+BASE_URL = "http://localhost:8000/api/bookings/"
+
+
+@override_settings(BOOKING_PROJECTION_MODE="async")
+class BookingProjectorTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="nonadmin1",
+            password="password",
+        )
+        cls.starts_at = timezone.now() + timezone.timedelta(days=10)
+
+    def setUp(self):
+        self.client.login(username="nonadmin1", password="password")
+        response = self.client.post(
+            BASE_URL,
+            {
+                "starts_at": self.starts_at.isoformat(),
+                "ends_at": (self.starts_at + timezone.timedelta(hours=1)).isoformat(),
+                "applicants": 1,
+            },
+        )
+        self.assertEqual(response.status_code, 201)
+        self.booking_key = response.data["booking_key"]
+        self.event_id = response["X-Booking-Event-Id"]
+
+    def _run_projector(self):
+        call_command("run_projector", "--once", stdout=io.StringIO())
+
+    def test_write_only_appends_event(self):
+        self.assertFalse(
+            BookingProjection.objects.filter(booking_key=self.booking_key).exists()
+        )
+        self.assertTrue(BookingOutbox.objects.filter(event_id=self.event_id).exists())
+
+    def test_update_before_projection_uses_event_log(self):
+        response = self.client.patch(
+            f"{BASE_URL}{self.booking_key}/",
+            {"applicants": 5},
+            HTTP_IF_MATCH='"1"',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["applicants"], 5)
+        self.assertEqual(response.data["version"], 2)
+
+        self._run_projector()
+
+        obj = BookingProjection.objects.get(booking_key=self.booking_key)
+        self.assertEqual(obj.applicants, 5)
+        self.assertEqual(obj.version, 2)
+        self.assertFalse(BookingOutbox.objects.exists())
+        self.assertEqual(
+            BookingProjectorCheckpoint.objects.get(name="default").event_id,
+            int(response["X-Booking-Event-Id"]),
+        )
+
+    @override_settings(BOOKING_READ_YOUR_WRITES_TIMEOUT=0)
+    def test_read_your_writes_reports_pending_projection(self):
+        response = self.client.get(
+            f"{BASE_URL}{self.booking_key}/", HTTP_X_BOOKING_EVENT_ID=self.event_id
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response["X-Booking-Projection-Pending"], "true")
+
+    def test_read_your_writes_after_projection(self):
+        self._run_projector()
+        response = self.client.get(
+            f"{BASE_URL}{self.booking_key}/", HTTP_X_BOOKING_EVENT_ID=self.event_id
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("X-Booking-Projection-Pending"))
+
+
+class _Stop(Exception):
+    pass
+
+
+@override_settings(BOOKING_PROJECTION_MODE="async")
+class BookingProjectorNotifyTests(TransactionTestCase):
+    def test_projector_wakes_up_on_notify(self):
+        user = User.objects.create_user(username="nonadmin1", password="password")
+        listening = threading.Event()
+        errors = []
+
+        def on_batch(applied):
+            raise _Stop
+
+        def project():
+            try:
+                booking_projector_service.run(poll_interval=30, on_batch=on_batch)
+            except _Stop:
+                pass
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        original_wait = booking_projector_service._wait_for_notify
+
+        def wait_for_notify(timeout):
+            listening.set()
+            original_wait(timeout)
+
+        booking_projector_service._wait_for_notify = wait_for_notify
+        self.addCleanup(
+            setattr, booking_projector_service, "_wait_for_notify", original_wait
+        )
+        projector = threading.Thread(target=project)
+        projector.start()
+        self.assertTrue(listening.wait(timeout=10))
+
+        started_at = time.monotonic()
+        result = booking_handler.handle_create(
+            user=user,
+            data={
+                "starts_at": timezone.now() + timezone.timedelta(days=10),
+                "ends_at": timezone.now() + timezone.timedelta(days=10, hours=1),
+                "applicants": 1,
+            },
+        )
+        projector.join(timeout=10)
+
+        self.assertEqual(errors, [])
+        self.assertFalse(projector.is_alive())
+        self.assertLess(time.monotonic() - started_at, 5)
+        self.assertTrue(
+            BookingProjection.objects.filter(
+                booking_key=result.unwrap()["booking_key"]
+            ).exists()
+        )
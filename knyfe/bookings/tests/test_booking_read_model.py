@@ -0,0 +1,246 @@
+import threading
+import time
+
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ..models import BookingProjection, User
+from ..services import booking_handler, booking_read_model_service
+
+BASE_URL = "http://localhost:8000/api/bookings/"
+
+
+@override_settings(BOOKING_READ_MODEL=True, BOOKING_READ_MODEL_POLL_INTERVAL=0.01)
+class BookingReadModelTests(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin", password="password", is_staff=True
+        )
+        self.user = User.objects.create_user(username="nonadmin1", password="password")
+        self.other_user = User.objects.create_user(
+            username="nonadmin2", password="password"
+        )
+        self.starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            minute=30, second=0, microsecond=0
+        )
+        self.addCleanup(booking_read_model_service.stop)
+
+    def _create_booking(self, user, hour, applicants=1):
+        result = booking_handler.handle_create(
+            user=user,
+            data={
+                "starts_at": self.starts_at + timezone.timedelta(hours=hour),
+                "ends_at": self.starts_at + timezone.timedelta(hours=hour, minutes=90),
+                "applicants": applicants,
+            },
+        )
+        return result.unwrap()["booking_key"], result.get_metadata("event_id")
+
+    def _read_model(self, event_id):
+        """the replica once it has applied `event_id`"""
+        deadline = time.monotonic() + 10
+        while (read_model := booking_read_model_service.get_read_model()) is None:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertTrue(read_model.wait_until(event_id, timeout=10))
+        return read_model
+
+    def _reads(self):
+        """everything the replica serves, read through the handlers"""
+        first_page = booking_handler.handle_list(user=self.admin_user, limit=2)
+        return {
+            "staff": booking_handler.handle_list(user=self.admin_user).unwrap(),
+            "owner": booking_handler.handle_list(user=self.user).unwrap(),
+            "other": booking_handler.handle_list(user=self.other_user).unwrap(),
+            "first_page": first_page.unwrap(),
+            "next_page": booking_handler.handle_list(
+                user=self.admin_user, cursor=first_page.unwrap().next, limit=2
+            ).unwrap(),
+            "filtered": booking_handler.handle_list(
+                user=self.admin_user,
+                filters={
+                    "starts_at_from": self.starts_at + timezone.timedelta(hours=1),
+                    "starts_at_to": self.starts_at + timezone.timedelta(hours=4),
+                    "status": BookingProjection.Status.PENDING.value,
+                },
+            ).unwrap(),
+            "retrieved": [
+                booking_handler.handle_retrieve(
+                    user=self.user, booking_key=booking_key
+                ).value
+                for booking_key in BookingProjection.objects.values_list(
+                    "booking_key", flat=True
+                )
+            ],
+            "availability": booking_handler.handle_list_availability(
+                date=self.starts_at.date(), user_id=self.user.pk
+            ),
+        }
+
+    def test_serves_what_the_database_does(self):
+        approved, _ = self._create_booking(self.user, 0, applicants=3)
+        booking_handler.handle_approve(user=self.admin_user, booking_key=approved)
+        # bootstraps from the table, then tails the events that follow
+        read_model = self._read_model(
+            self._create_booking(self.user, 1, applicants=2)[1]
+        )
+        self._create_booking(self.other_user, 2)
+        deleted, _ = self._create_booking(self.user, 3)
+        moved, _ = self._create_booking(self.user, 4)
+        booking_handler.handle_delete(user=self.user, booking_key=deleted)
+        booking_handler.handle_approve(user=self.admin_user, booking_key=moved)
+        result = booking_handler.handle_update(
+            user=self.admin_user,
+            booking_key=moved,
+            data={
+                "starts_at": self.starts_at - timezone.timedelta(hours=1),
+                "ends_at": self.starts_at + timezone.timedelta(hours=2),
+                "applicants": 4,
+            },
+        )
+        read_model = self._read_model(result.get_metadata("event_id"))
+        self.assertGreaterEqual(read_model.staleness(), 0)
+        self.assertIsNone(
+            booking_handler.handle_retrieve(user=self.user, booking_key=deleted).value
+        )
+        availability = booking_handler.handle_list_availability(
+            date=self.starts_at.date(), user_id=self.user.pk
+        )
+        self.assertNotEqual(
+            availability[self.starts_at.hour].remaining,
+            availability[(self.starts_at.hour + 12) % 24].remaining,
+        )
+
+        reads = self._reads()
+        with override_settings(BOOKING_READ_MODEL=False):
+            self.assertIsNone(booking_handler.handle_read_model_staleness())
+            self.assertEqual(self._reads(), reads)
+
+    def test_api_reports_staleness_and_reads_own_writes(self):
+        client = APIClient()
+        client.login(username="nonadmin1", password="password")
+        self._read_model(self._create_booking(self.user, 0)[1])
+        response = client.get(BASE_URL)
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertGreaterEqual(float(response["X-Booking-Read-Model-Staleness"]), 0.0)
+        etag = response["ETag"]
+        self.assertEqual(client.get(BASE_URL, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        response = client.post(
+            BASE_URL,
+            {
+                "starts_at": (self.starts_at + timezone.timedelta(hours=5)).isoformat(),
+                "ends_at": (self.starts_at + timezone.timedelta(hours=6)).isoformat(),
+                "applicants": 1,
+            },
+        )
+        self.assertEqual(response.status_code, 201)
+        response = client.get(
+            BASE_URL,
+            HTTP_IF_NONE_MATCH=etag,
+            HTTP_X_BOOKING_EVENT_ID=response["X-Booking-Event-Id"],
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 2)
+        self.assertNotIn("X-Booking-Projection-Pending", response)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_picks_up_events_committed_out_of_order(self):
+        read_model = booking_read_model_service.ReadModel()
+        read_model.bootstrap()
+        read_model.poll()
+        created = threading.Event()
+        commit = threading.Event()
+        late = {}
+
+        def create_in_long_transaction():
+            try:
+                with transaction.atomic():
+                    late["booking_key"], late["event_id"] = self._create_booking(
+                        self.user, 0
+                    )
+                    created.set()
+                    commit.wait(10)
+            finally:
+                connection.close()
+
+        writer = threading.Thread(target=create_in_long_transaction)
+        writer.start()
+        self.assertTrue(created.wait(10))
+        booking_key, event_id = self._create_booking(self.user, 2)
+        read_model.poll()
+        self.assertTrue(read_model.contains(event_id))
+        self.assertFalse(read_model.contains(late["event_id"]))
+        self.assertIsNotNone(read_model.get(booking_key))
+
+        commit.set()
+        writer.join()
+        read_model.poll()
+        self.assertTrue(read_model.contains(late["event_id"]))
+        self.assertEqual(
+            [row[0] for row in read_model.page(self.user.pk, limit=10)],
+            [late["booking_key"], booking_key],
+        )
+
+    def test_waits_for_transactions_in_flight_at_bootstrap(self):
+        created = threading.Event()
+        commit = threading.Event()
+        late = {}
+
+        def create_in_long_transaction():
+            try:
+                with transaction.atomic():
+                    late["booking_key"], late["event_id"] = self._create_booking(
+                        self.user, 0
+                    )
+                    created.set()
+                    commit.wait(10)
+            finally:
+                connection.close()
+
+        writer = threading.Thread(target=create_in_long_transaction)
+        writer.start()
+        self.assertTrue(created.wait(10))
+        booking_key, event_id = self._create_booking(self.user, 2)
+        read_model = booking_read_model_service.ReadModel()
+        read_model.bootstrap()
+        # the late event lies below the bootstrap horizon
+        self.assertLess(late["event_id"], read_model.watermark)
+        self.assertEqual(read_model.poll(), 0)
+        self.assertFalse(read_model.ready)
+
+        commit.set()
+        writer.join()
+        read_model.poll()
+        self.assertTrue(read_model.ready)
+        self.assertTrue(read_model.contains(late["event_id"]))
+        self.assertEqual(
+            [row[0] for row in read_model.page(self.user.pk, limit=10)],
+            [late["booking_key"], booking_key],
+        )
+
+    def test_replaces_rows_instead_of_changing_them(self):
+        booking_key, _ = self._create_booking(self.user, 0)
+        read_model = booking_read_model_service.ReadModel()
+        read_model.bootstrap()
+        read_model.poll()
+        row = read_model.get(booking_key)
+        booking_handler.handle_approve(user=self.admin_user, booking_key=booking_key)
+        read_model.poll()
+        self.assertEqual(row.status, BookingProjection.Status.PENDING.value)
+        self.assertEqual(
+            read_model.get(booking_key).status,
+            BookingProjection.Status.APPROVED.value,
+        )
+
+    @override_settings(BOOKING_READ_MODEL=False)
+    def test_disabled(self):
+        self._create_booking(self.user, 0)
+        self.assertIsNone(booking_read_model_service.get_read_model())
+        client = APIClient()
+        client.login(username="nonadmin1", password="password")
+        self.assertNotIn("X-Booking-Read-Model-Staleness", client.get(BASE_URL))
@@ -0,0 +1,152 @@
+import contextlib
+import unittest
+
+from django.conf import settings
+from django.db import connections, router
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
+from utils import db_router
+
+from ..models import BookingProjection, User
+
+BASE_URL = "http://localhost:8000/api/bookings/"
+AVAILABILITY_URL = "http://localhost:8000/api/availability/segments/"
+
+
+@contextlib.contextmanager
+def _outside_transaction():
+    """let reads leave the primary although the test runs in a transaction"""
+    connection = connections["default"]
+    in_atomic_block = connection.in_atomic_block
+    connection.in_atomic_block = False
+    try:
+        yield
+    finally:
+        connection.in_atomic_block = in_atomic_block
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"])
+class BookingReplicaRoutingTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="nonadmin1", password="password")
+
+    def setUp(self):
+        self.client.login(username="nonadmin1", password="password")
+
+    def test_routes_reads_in_replica_reads_only(self):
+        self.assertEqual(BookingProjection.objects.all().db, "default")
+        # on the primary while a transaction is open, as in every TestCase
+        with db_router.replica_reads() as alias:
+            self.assertEqual(alias, "default")
+        with _outside_transaction():
+            with db_router.replica_reads() as alias:
+                self.assertEqual(alias, "replica1")
+                self.assertEqual(BookingProjection.objects.all().db, "replica1")
+                self.assertEqual(db_router.read_alias(), "replica1")
+                self.assertEqual(db_router.cache_timeout(300), 5)
+                # writes stay on the primary
+                self.assertEqual(router.db_for_write(BookingProjection), "default")
+            self.assertEqual(BookingProjection.objects.all().db, "default")
+
+    def test_write_pins_client_to_primary(self):
+        starts_at = timezone.now() + timezone.timedelta(days=10)
+        response = self.client.post(
+            BASE_URL,
+            {
+                "starts_at": starts_at.isoformat(),
+                "ends_at": (starts_at + timezone.timedelta(hours=1)).isoformat(),
+                "applicants": 1,
+            },
+        )
+        self.assertEqual(response.status_code, 201)
+        cookie = response.cookies[db_router.PIN_COOKIE]
+        self.assertEqual(cookie["max-age"], settings.DATABASE_PRIMARY_PIN_SECONDS)
+        self.assertTrue(cookie["httponly"])
+
+        with _outside_transaction():
+            response = self.client.get(BASE_URL)
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertIn("ETag", response)
+        self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+
+    def test_failed_write_does_not_pin(self):
+        response = self.client.post(BASE_URL, {"applicants": 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+
+
+@unittest.skipUnless(
+    settings.DATABASE_REPLICAS, "set DB_REPLICAS to read through replica aliases"
+)
+class BookingReplicaReadTests(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="nonadmin1", password="password")
+        self.client = APIClient()
+        self.client.login(username="nonadmin1", password="password")
+        self.starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            minute=0, second=0, microsecond=0
+        )
+        self.booking_key = self._create(self.client)
+
+    def _create(self, client):
+        response = client.post(
+            BASE_URL,
+            {
+                "starts_at": self.starts_at.isoformat(),
+                "ends_at": (self.starts_at + timezone.timedelta(hours=1)).isoformat(),
+                "applicants": 1,
+            },
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()["booking_key"]
+
+    def _queries(self, client, url):
+        """response to a GET of `url` and the statements each alias ran for it"""
+        contexts = {
+            alias: CaptureQueriesContext(connections[alias]) for alias in connections
+        }
+        for context in contexts.values():
+            context.__enter__()
+        try:
+            response = client.get(url)
+        finally:
+            for context in contexts.values():
+                context.__exit__(None, None, None)
+        return response, {
+            alias: [query["sql"] for query in context.captured_queries]
+            for alias, context in contexts.items()
+        }
+
+    def test_reads_go_to_replicas(self):
+        client = APIClient()
+        client.login(username="nonadmin1", password="password")
+        for url in (
+            BASE_URL,
+            f"{BASE_URL}{self.booking_key}/",
+            f"{AVAILABILITY_URL}?date_utc={self.starts_at.date().isoformat()}",
+        ):
+            response, queries = self._queries(client, url)
+            self.assertEqual(response.status_code, 200)
+            replica_queries = [
+                sql for alias in settings.DATABASE_REPLICAS for sql in queries[alias]
+            ]
+            self.assertTrue(replica_queries, url)
+            # sessions and users are read from the primary
+            self.assertTrue(
+                all("bookings_booking" not in sql for sql in queries["default"]),
+                url,
+            )
+        self.assertNotIn("ETag", client.get(BASE_URL))
+
+    def test_writer_reads_from_primary(self):
+        # the client that created the booking is pinned
+        response, queries = self._queries(self.client, BASE_URL)
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertIn("ETag", response)
+        for alias in settings.DATABASE_REPLICAS:
+            self.assertEqual(queries[alias], [])
@@ -0,0 +1,71 @@
+from unittest import mock
+
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from ..models import BookingEvent, BookingSnapshot, User
+from ..services import booking_event_service, booking_handler
+
+
+class BookingSnapshotTests(APITestCase):
+    def setUp(self):
+        patcher = mock.patch.object(
+            booking_event_service, "get_snapshot_interval", return_value=3
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(
+            username="nonadmin1",
+            password="password",
+        )
+        result = booking_handler.handle_create(
+            user=self.user,
+            data={
+                "starts_at": timezone.now() + timezone.timedelta(days=10),
+                "ends_at": timezone.now() + timezone.timedelta(days=10, hours=1),
+                "applicants": 1,
+            },
+        )
+        self.booking_key = result.unwrap()["booking_key"]
+        for applicants in range(2, 9):
+            booking_handler.handle_update(
+                user=self.user,
+                booking_key=self.booking_key,
+                data={"applicants": applicants},
+            )
+
+    def test_snapshots_written_every_interval(self):
+        self.assertEqual(
+            list(
+                BookingSnapshot.objects.filter(booking_key=self.booking_key)
+                .order_by("version")
+                .values_list("version", flat=True)
+            ),
+            [3, 6],
+        )
+
+    def test_load_booking_state_folds_tail_after_snapshot(self):
+        with self.assertNumQueries(2):
+            state = booking_event_service.load_booking_state(self.booking_key)
+        self.assertEqual(state.applicants, 8)
+        self.assertEqual(state.version, 8)
+        self.assertEqual(
+            state,
+            booking_event_service.load_booking_state(
+                self.booking_key, use_snapshots=False
+            ),
+        )
+
+    def test_load_booking_state_as_of(self):
+        as_of = (
+            BookingEvent.objects.filter(booking_key=self.booking_key, version=4)
+            .get()
+            .timestamp
+        )
+        state = booking_event_service.load_booking_state(self.booking_key, as_of=as_of)
+        self.assertEqual(state.applicants, 4)
+        self.assertEqual(state.version, 4)
+
+    def test_load_deleted_booking_state(self):
+        booking_handler.handle_delete(user=self.user, booking_key=self.booking_key)
+        self.assertIsNone(booking_event_service.load_booking_state(self.booking_key))
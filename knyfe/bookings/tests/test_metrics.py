@@ -0,0 +1,73 @@
+from django.test import override_settings
+from rest_framework.test import APITestCase
+from utils import metrics
+
+from ..models import User
+
+BASE_URL = "http://localhost:8000/api/bookings/"
+METRICS_URL = "http://localhost:8000/metrics"
+
+
+@override_settings(METRICS_ENABLED=True)
+class RequestMetricsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="nonadmin1",
+            password="password",
+        )
+        cls.admin_user = User.objects.create_user(
+            username="admin",
+            password="password",
+            is_staff=True,
+        )
+
+    def setUp(self):
+        metrics.registry.clear()
+        self.client.login(username="nonadmin1", password="password")
+
+    def test_server_timing_header(self):
+        response = self.client.get(BASE_URL)
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^db;dur=[\d.]+;desc="3 queries", app;dur=[\d.]+, total;dur=[\d.]+$',
+        )
+
+    def test_metrics_endpoint_reports_per_route_histograms(self):
+        self.client.get(BASE_URL)
+        self.client.get(BASE_URL)
+        self.client.login(username="admin", password="password")
+        response = self.client.get(METRICS_URL)
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        labels = 'method="GET",route="api/bookings/$"'
+        self.assertIn(f'http_requests_total{{{labels},status="200"}} 2', body)
+        self.assertIn(f"http_request_duration_seconds_count{{{labels}}} 2", body)
+        self.assertIn(f'http_request_db_queries_bucket{{{labels},le="2"}} 0', body)
+        self.assertIn(f'http_request_db_queries_bucket{{{labels},le="5"}} 2', body)
+        self.assertIn(f"http_request_db_queries_sum{{{labels}}} 6.0", body)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_endpoint_requires_staff_or_token(self):
+        self.assertEqual(self.client.get(METRICS_URL).status_code, 403)
+        self.client.logout()
+        for authorization, status in (
+            (None, 403),
+            ("Bearer wrong", 403),
+            ("Bearer secret", 200),
+        ):
+            headers = {"HTTP_AUTHORIZATION": authorization} if authorization else {}
+            response = self.client.get(METRICS_URL, **headers)
+            self.assertEqual(response.status_code, status, authorization)
+
+    def test_metrics_token_is_off_by_default(self):
+        self.client.logout()
+        response = self.client.get(METRICS_URL, HTTP_AUTHORIZATION="Bearer ")
+        self.assertEqual(response.status_code, 403)
+
+
+class RequestMetricsDisabledTests(APITestCase):
+    def test_metrics_endpoint_is_hidden(self):
+        response = self.client.get(METRICS_URL)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header("Server-Timing"))
@@ -0,0 +1,48 @@
+import importlib
+import os
+from unittest import mock
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+
+
+class ProductionSettingsTests(SimpleTestCase):
+    def _load(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            return importlib.reload(
+                importlib.import_module("knyfe.production_settings")
+            )
+
+    def test_debug_off_and_persistent_connections(self):
+        production = self._load()
+        self.assertFalse(production.DEBUG)
+        self.assertEqual(production.ALLOWED_HOSTS, ["localhost"])
+        self.assertEqual(production.DATABASES["default"]["CONN_MAX_AGE"], 600)
+        self.assertTrue(production.DATABASES["default"]["CONN_HEALTH_CHECKS"])
+        self.assertEqual(
+            production.DATABASES["default"]["NAME"],
+            importlib.import_module("knyfe.settings").DATABASES["default"]["NAME"],
+        )
+
+    def test_environment_overrides(self):
+        production = self._load(
+            DJANGO_ALLOWED_HOSTS="api.example.com, .example.org",
+            DB_CONN_MAX_AGE="0",
+        )
+        self.assertEqual(production.ALLOWED_HOSTS, ["api.example.com", ".example.org"])
+        self.assertEqual(production.DATABASES["default"]["CONN_MAX_AGE"], 0)
+
+    def test_cache_is_shared_between_workers(self):
+        production = self._load()
+        self.assertEqual(
+            production.CACHES["default"]["BACKEND"],
+            "django.core.cache.backends.redis.RedisCache",
+        )
+        with self.assertRaises(ImproperlyConfigured):
+            self._load(CACHE_BACKEND="django.core.cache.backends.locmem.LocMemCache")
+
+    def test_base_settings_are_untouched(self):
+        self._load()
+        self.assertFalse(settings.DATABASES["default"].get("CONN_HEALTH_CHECKS"))
+        self.assertEqual(settings.DATABASES["default"].get("CONN_MAX_AGE"), 0)
@@ -0,0 +1,80 @@
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from rest_framework.test import APITestCase
+from utils import profiling
+
+from ..models import User
+
+BASE_URL = "http://localhost:8000/api/bookings/"
+AVAILABILITY_URL = "http://localhost:8000/api/availability/segments/"
+
+
+class RequestProfilingTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="nonadmin1", password="password")
+        cls.admin = User.objects.create_user(
+            username="admin1", password="password", is_staff=True
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        profiling_dir = override_settings(PROFILING_DIR=directory.name)
+        profiling_dir.enable()
+        self.addCleanup(profiling_dir.disable)
+
+    def test_staff_header_profiles_request(self):
+        self.client.login(username="admin1", password="password")
+        response = self.client.get(BASE_URL, HTTP_X_PROFILE="1")
+        self.assertEqual(response.status_code, 200)
+        [info] = profiling.list_profiles()
+        self.assertEqual(response[profiling.PROFILE_ID_HEADER], info.name)
+        self.assertEqual(info.method, "GET")
+        self.assertEqual(info.route, "api_bookings")
+        self.assertEqual(info.status, 200)
+
+    def test_header_is_ignored_for_non_staff(self):
+        self.client.login(username="nonadmin1", password="password")
+        response = self.client.get(BASE_URL, HTTP_X_PROFILE="1")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header(profiling.PROFILE_ID_HEADER))
+        self.assertEqual(profiling.list_profiles(), [])
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    def test_sampled_requests_are_profiled(self):
+        self.client.login(username="nonadmin1", password="password")
+        self.client.get(BASE_URL)
+        self.client.get(AVAILABILITY_URL, {"date_utc": "2030-01-01"})
+        self.assertEqual(
+            [info.route for info in profiling.list_profiles()],
+            ["api_availability_segments", "api_bookings"],
+        )
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_MAX_FILES=2)
+    def test_keeps_newest_profiles(self):
+        self.client.login(username="nonadmin1", password="password")
+        names = [self.client.get(BASE_URL)[profiling.PROFILE_ID_HEADER] for _ in "abc"]
+        self.assertEqual(
+            [info.name for info in profiling.list_profiles()], names[:0:-1]
+        )
+        self.assertEqual(len(os.listdir(settings.PROFILING_DIR)), 2)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    def test_profiles_command_summarizes_hot_functions(self):
+        self.client.login(username="nonadmin1", password="password")
+        self.client.get(BASE_URL)
+        stdout = io.StringIO()
+        call_command("profiles", sort="cumulative", top=50, stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn("GET    200", output)
+        self.assertIn("handle_list", output)
+
+    def test_profiles_command_without_profiles(self):
+        with self.assertRaisesMessage(CommandError, "No profiles captured."):
+            call_command("profiles", stdout=io.StringIO())
@@ -0,0 +1,118 @@
+import io
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from ..models import BookingCapacityBucket, BookingOutbox, BookingProjection, User
+from ..services import (
+    booking_capacity_service,
+    booking_handler,
+    booking_replay_service,
+)
+
+
+class RebuildProjectionsMixin:
+    def _seed_bookings(self):
+        self.admin_user = User.objects.create_user(
+            username="admin",
+            password="password",
+            is_staff=True,
+        )
+        self.user = User.objects.create_user(
+            username="nonadmin1",
+            password="password",
+        )
+        starts_at = (timezone.now() + timezone.timedelta(days=10)).replace(
+            minute=0, second=0, microsecond=0
+        )
+        booking_keys = []
+        for hour in range(6):
+            result = booking_handler.handle_create(
+                user=self.user,
+                data={
+                    "starts_at": starts_at + timezone.timedelta(hours=hour),
+                    "ends_at": starts_at + timezone.timedelta(hours=hour + 2),
+                    "applicants": hour + 1,
+                },
+            )
+            booking_keys.append(result.unwrap()["booking_key"])
+        for booking_key in booking_keys[:3]:
+            booking_handler.handle_approve(
+                user=self.admin_user, booking_key=booking_key
+            )
+        booking_handler.handle_update(
+            user=self.admin_user,
+            booking_key=booking_keys[0],
+            data={"applicants": 10},
+        )
+        booking_handler.handle_delete(user=self.admin_user, booking_key=booking_keys[1])
+
+    def _projections(self):
+        return set(
+            BookingProjection.objects.values_list(
+                "booking_key",
+                "owner_id",
+                "starts_at",
+                "ends_at",
+                "applicants",
+                "status",
+                "version",
+            )
+        )
+
+    def assertRebuildRestoresProjections(self, *args):
+        expected = self._projections()
+        BookingProjection.objects.filter(status="APPROVED").update(applicants=0)
+        BookingProjection.objects.filter(status="PENDING").delete()
+        BookingCapacityBucket.objects.all().delete()
+
+        call_command("rebuild_projections", *args, stdout=io.StringIO())
+
+        self.assertEqual(self._projections(), expected)
+        self.assertEqual(
+            booking_capacity_service.query_capacity_bucket_mismatches(), []
+        )
+
+
+class RebuildProjectionsTests(RebuildProjectionsMixin, APITestCase):
+    def setUp(self):
+        self._seed_bookings()
+
+    def test_rebuild_projections(self):
+        self.assertRebuildRestoresProjections("--chunk-size", "2")
+
+    @override_settings(BOOKING_PROJECTION_MODE="async")
+    def test_refuses_while_events_wait_for_the_projector(self):
+        booking_key = BookingProjection.objects.values_list(
+            "booking_key", flat=True
+        ).first()
+        booking_handler.handle_delete(user=self.admin_user, booking_key=booking_key)
+        self.assertTrue(BookingOutbox.objects.exists())
+        expected = self._projections()
+
+        with self.assertRaisesMessage(CommandError, "still waiting for the projector"):
+            call_command("rebuild_projections", stdout=io.StringIO())
+
+        self.assertEqual(self._projections(), expected)
+        call_command("run_projector", "--once", stdout=io.StringIO())
+        self.assertRebuildRestoresProjections()
+
+
+class RebuildProjectionsWorkersTests(RebuildProjectionsMixin, TransactionTestCase):
+    def setUp(self):
+        self._seed_bookings()
+
+    def test_rebuild_projections_with_workers(self):
+        self.assertRebuildRestoresProjections("--workers", "3")
+
+    def test_replay_streams_events_through_a_transaction(self):
+        events = booking_replay_service.iter_events(chunk_size=2)
+        next(events)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT is_holdable FROM pg_cursors;")
+            self.assertEqual(cursor.fetchall(), [(False,)])
+        events.close()
+        self.assertFalse(connection.in_atomic_block)
@@ -0,0 +1,119 @@
+import datetime
+import io
+import json
+import uuid
+
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from utils.renderers import ORJSONParser, ORJSONRenderer
+
+from .. import views
+from ..models import User
+from ..services import booking_handler
+
+BASE_URL = "http://localhost:8000/api/bookings/"
+
+
+class ORJSONRendererTests(APITestCase):
+    def setUp(self):
+        starts_at = datetime.datetime(
+            2030, 1, 2, 3, 0, 0, 123456, datetime.timezone.utc
+        )
+        self.booking = {
+            "booking_key": uuid.uuid4(),
+            "starts_at": starts_at,
+            "ends_at": starts_at + datetime.timedelta(hours=1),
+            "applicants": 3,
+            "status": "PENDING",
+            "version": 2,
+        }
+
+    def test_renders_handler_results_like_their_serializers(self):
+        page = booking_handler.BookingPage(results=[self.booking], next="abc")
+        availability = [
+            booking_handler.BookingAvailability(index=0, remaining=50_000),
+            booking_handler.BookingAvailability(index=1, remaining=0),
+        ]
+        for data, serializer in (
+            (self.booking, views.BookingSerializer(self.booking)),
+            (page, views.BookingPageSerializer(page)),
+            (
+                availability,
+                views.BookingAvailabilitySerializer(availability, many=True),
+            ),
+        ):
+            expected = JSONRenderer().render(serializer.data)
+            self.assertEqual(ORJSONRenderer().render(serializer.data), expected)
+            # the same JSON, with the keys in the order the handler builds them
+            self.assertEqual(
+                json.loads(ORJSONRenderer().render(data)), json.loads(expected)
+            )
+            self.assertEqual(
+                json.loads(ORJSONRenderer().render(data, "application/json; indent=4")),
+                json.loads(expected),
+            )
+
+    def test_renders_like_json_renderer(self):
+        data = {
+            "detail": gettext_lazy("Not found."),
+            "text": "line separator 예약",
+            "empty": [],
+            "none": None,
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render(None), b"")
+
+    def test_renders_datetimes_in_utc(self):
+        kst = datetime.timezone(datetime.timedelta(hours=9))
+        data = {
+            "starts_at": self.booking["starts_at"].astimezone(kst),
+            "ends_at": self.booking["ends_at"].replace(microsecond=0),
+        }
+        expected = JSONRenderer().render(
+            views.BookingSerializer({**self.booking, **data}).data
+        )
+        self.assertEqual(
+            json.loads(ORJSONRenderer().render({**self.booking, **data})),
+            json.loads(expected),
+        )
+        self.assertEqual(
+            ORJSONRenderer().render(data),
+            b'{"starts_at":"2030-01-02T03:00:00.123456Z",'
+            b'"ends_at":"2030-01-02T04:00:00Z"}',
+        )
+
+    def test_parser(self):
+        self.assertEqual(
+            ORJSONParser().parse(io.BytesIO('{"applicants": 2, "a": "예"}'.encode())),
+            {"applicants": 2, "a": "예"},
+        )
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b'{"applicants": '))
+
+    def test_api_renders_json_and_browsable_api(self):
+        user = User.objects.create_user(username="nonadmin1", password="password")
+        booking_handler.handle_create(
+            user=user,
+            data={
+                "starts_at": timezone.now() + timezone.timedelta(days=10),
+                "ends_at": timezone.now() + timezone.timedelta(days=10, hours=1),
+                "applicants": 1,
+            },
+        )
+        self.client.login(username="nonadmin1", password="password")
+        response = self.client.get(BASE_URL)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(len(response.json()["results"]), 1)
+        response = self.client.get(BASE_URL, HTTP_ACCEPT="text/html")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"&quot;results&quot;", response.content)
+        response = self.client.post(
+            BASE_URL,
+            {"starts_at": "nope", "ends_at": "nope", "applicants": 1},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("starts_at", response.json())
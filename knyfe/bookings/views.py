@@ -1,4 +1,11 @@
-from drf_spectacular.utils import extend_schema
+import re
+import typing
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 from rest_framework import (
     permissions,
     response,
@@ -7,6 +14,7 @@ from rest_framework import (
     viewsets,
 )
 from rest_framework.decorators import action, api_view, permission_classes
+from utils import profiling
 
 from .models import BookingProjection
 from .services import booking_handler
@@ -18,9 +26,128 @@ class BookingSerializer(serializers.Serializer):
     starts_at = serializers.DateTimeField()
     ends_at = serializers.DateTimeField()
     applicants = serializers.IntegerField()
+    version = serializers.IntegerField(read_only=True)
 
     class Meta:
-        read_only_fields = ["booking_key", "status"]
+        read_only_fields = ["booking_key", "status", "version"]
+
+
+EVENT_ID_HEADER = "X-Booking-Event-Id"
+# seconds the in-process replica serving the read lagged the database by
+READ_MODEL_STALENESS_HEADER = "X-Booking-Read-Model-Staleness"
+EVENT_ID_PARAMETER = OpenApiParameter(
+    name=EVENT_ID_HEADER,
+    location=OpenApiParameter.HEADER,
+    required=False,
+    description="Event id returned by a previous write; the read waits until "
+    "that write is visible.",
+)
+IF_MATCH_PARAMETER = OpenApiParameter(
+    name="If-Match",
+    location=OpenApiParameter.HEADER,
+    required=False,
+    description="Booking version from a previous `ETag`; "
+    "the request fails with 412 if the booking has changed since.",
+)
+IF_NONE_MATCH_PARAMETER = OpenApiParameter(
+    name="If-None-Match",
+    location=OpenApiParameter.HEADER,
+    required=False,
+    description="`ETag` of a previous response; "
+    "the request returns 304 without a body if nothing has changed since.",
+)
+
+
+def _booking_etag(data) -> str:
+    return _version_etag(data["version"])
+
+
+def _version_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def _if_match_version(request):
+    """expected booking version from an `If-Match: "<version>"` header"""
+    header = request.headers.get("If-Match")
+    if header is None or header.strip() == "*":
+        return None
+    match = re.fullmatch(r'\s*"(\d+)"\s*', header)
+    # versions start at 1, so an unparsable entity tag never matches
+    return int(match.group(1)) if match else 0
+
+
+def _etag_headers(etag: typing.Optional[str]) -> dict:
+    return {} if etag is None else {"ETag": etag}
+
+
+def _not_modified(request, etag: typing.Optional[str], headers: dict):
+    """304 response when `If-None-Match` already names `etag`, otherwise None"""
+    if not _none_match(request, etag):
+        return None
+    return response.Response(
+        status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, **headers}
+    )
+
+
+def _none_match(request, etag: typing.Optional[str]) -> bool:
+    header = request.headers.get("If-None-Match")
+    # without an entity tag nothing can be known to be unchanged
+    if header is None or etag is None:
+        return False
+    # If-None-Match uses the weak comparison
+    etags = [tag.removeprefix("W/") for tag in parse_etags(header)]
+    return "*" in etags or etag in etags
+
+
+def _page_data(page: booking_handler.BookingPage) -> dict:
+    return {"next": page.next, "results": page.results}
+
+
+def _availability_data(rows: typing.List[booking_handler.BookingAvailability]):
+    return [{"index": row.index, "remaining": row.remaining} for row in rows]
+
+
+def _bulk_response(result, success_status: int) -> response.Response:
+    """per-item results of a bulk write; 207 when only some items succeeded"""
+    if result.is_error():
+        return response.Response(
+            {"error": result.unwrap_error(), "results": result.get_metadata("results")},
+            status=result.get_metadata("status", status.HTTP_400_BAD_REQUEST),
+        )
+    results = result.unwrap()
+    # rendered straight from the handler's dataclasses (see utils.renderers)
+    return response.Response(
+        {"results": results},
+        status=(
+            success_status
+            if all(item.error is None for item in results)
+            else status.HTTP_207_MULTI_STATUS
+        ),
+        headers=(
+            {} if result.get_metadata("event_id") is None else _event_headers(result)
+        ),
+    )
+
+
+def _event_headers(result) -> dict:
+    return {EVENT_ID_HEADER: str(result.get_metadata("event_id"))}
+
+
+def _wait_for_projection(request) -> dict:
+    """hold a read until the event id the client last wrote has been projected"""
+    event_id = request.headers.get(EVENT_ID_HEADER, "")
+    if not event_id.isdigit() or booking_handler.handle_wait_for_projection(
+        int(event_id)
+    ):
+        return _read_model_headers()
+    return {"X-Booking-Projection-Pending": "true", **_read_model_headers()}
+
+
+def _read_model_headers() -> dict:
+    staleness = booking_handler.handle_read_model_staleness()
+    if staleness is None:
+        return {}
+    return {READ_MODEL_STALENESS_HEADER: f"{staleness:.3f}"}
 
 
 class BookingCreateSerializer(serializers.Serializer):
@@ -29,30 +156,125 @@ class BookingCreateSerializer(serializers.Serializer):
     applicants = serializers.IntegerField(required=True)
 
 
+class BookingBulkCreateSerializer(serializers.Serializer):
+    bookings = BookingCreateSerializer(
+        many=True, allow_empty=False, max_length=settings.BOOKING_BULK_CREATE_LIMIT
+    )
+    # all or nothing; when false the valid bookings are created regardless
+    atomic = serializers.BooleanField(default=True)
+
+
+class BookingBulkCreateItemSerializer(serializers.Serializer):
+    index = serializers.IntegerField()
+    booking = BookingSerializer(allow_null=True)
+    error = serializers.CharField(allow_null=True)
+
+
+class BookingBulkCreateResponseSerializer(serializers.Serializer):
+    error = serializers.CharField(required=False)
+    results = BookingBulkCreateItemSerializer(many=True)
+
+
+class BookingBulkWriteSerializer(serializers.Serializer):
+    booking_keys = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=settings.BOOKING_BULK_WRITE_LIMIT,
+    )
+    atomic = serializers.BooleanField(default=True)
+
+
+class BookingBulkWriteItemSerializer(serializers.Serializer):
+    booking_key = serializers.UUIDField()
+    booking = BookingSerializer(allow_null=True)
+    error = serializers.CharField(allow_null=True)
+
+
+class BookingBulkWriteResponseSerializer(serializers.Serializer):
+    error = serializers.CharField(required=False)
+    results = BookingBulkWriteItemSerializer(many=True)
+
+
 class BookingUpdateSerializer(serializers.Serializer):
     starts_at = serializers.DateTimeField(required=False)
     ends_at = serializers.DateTimeField(required=False)
     applicants = serializers.IntegerField(required=False)
 
 
+class BookingListRequestSerializer(serializers.Serializer):
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(default=50, min_value=1, max_value=500)
+    starts_at_from = serializers.DateTimeField(required=False)
+    starts_at_to = serializers.DateTimeField(required=False)
+    status = serializers.ChoiceField(
+        choices=BookingProjection.Status.choices, required=False
+    )
+
+
+class BookingPageSerializer(serializers.Serializer):
+    next = serializers.CharField(allow_null=True)
+    results = BookingSerializer(many=True)
+
+
+@method_decorator(profiling.profile_request, name="dispatch")
 class BookingViewSet(viewsets.ViewSet):
     lookup_field = "booking_key"
     permission_classes = [permissions.IsAuthenticated]
 
     @extend_schema(
-        responses={200: BookingSerializer(many=True)},
+        parameters=[
+            BookingListRequestSerializer,
+            EVENT_ID_PARAMETER,
+            IF_NONE_MATCH_PARAMETER,
+        ],
+        responses={200: BookingPageSerializer, 304: None},
     )
     def list(self, request):
-        data = booking_handler.handle_list(user=request.user)
+        request_serializer = BookingListRequestSerializer(data=request.query_params)
+        request_serializer.is_valid(raise_exception=True)
+        request_data = dict(request_serializer.validated_data)
+        headers = _wait_for_projection(request)
+        # read before the page, so a concurrent write can only make it stale
+        etag = booking_handler.handle_list_etag(user=request.user)
+        not_modified = _not_modified(request, etag, headers)
+        if not_modified is not None:
+            return not_modified
+        result = booking_handler.handle_list(
+            user=request.user,
+            cursor=request_data.pop("cursor", None),
+            limit=request_data.pop("limit"),
+            filters=request_data,
+        )
+        if result.is_error():
+            return response.Response(
+                {"error": result.unwrap_error()},
+                status=result.get_metadata("status", status.HTTP_400_BAD_REQUEST),
+                headers=headers,
+            )
+        # rendered straight from the handler's rows, which the serializers in
+        # the schema describe (see utils.renderers)
         return response.Response(
-            data=BookingSerializer(data, many=True).data,
+            data=_page_data(result.unwrap()),
             status=status.HTTP_200_OK,
+            headers={**_etag_headers(etag), **headers},
         )
 
     @extend_schema(
-        responses={200: BookingSerializer},
+        parameters=[EVENT_ID_PARAMETER, IF_NONE_MATCH_PARAMETER],
+        responses={200: BookingSerializer, 304: None},
     )
     def retrieve(self, request, booking_key):
+        headers = _wait_for_projection(request)
+        if "If-None-Match" in request.headers:
+            # revalidated against the booking's version stamp before the
+            # booking itself is read, as list() does with its generation
+            version = booking_handler.handle_retrieve_version(
+                user=request.user, booking_key=booking_key
+            )
+            if version is not None:
+                not_modified = _not_modified(request, _version_etag(version), headers)
+                if not_modified is not None:
+                    return not_modified
         result = booking_handler.handle_retrieve(
             user=request.user,
             booking_key=booking_key,
@@ -61,10 +283,16 @@ class BookingViewSet(viewsets.ViewSet):
             return response.Response(
                 {"error": result.unwrap_error()},
                 status=result.get_metadata("status", status.HTTP_400_BAD_REQUEST),
+                headers=headers,
             )
+        etag = _booking_etag(result.unwrap())
+        not_modified = _not_modified(request, etag, headers)
+        if not_modified is not None:
+            return not_modified
         return response.Response(
-            BookingSerializer(result.unwrap()).data,
+            result.unwrap(),
             status=status.HTTP_200_OK,
+            headers={"ETag": etag, **headers},
         )
 
     @extend_schema(
@@ -88,10 +316,87 @@ class BookingViewSet(viewsets.ViewSet):
         return response.Response(
             BookingSerializer(result.unwrap()).data,
             status=status.HTTP_201_CREATED,
+            headers={
+                "ETag": _booking_etag(result.unwrap()),
+                **_event_headers(result),
+            },
+        )
+
+    @extend_schema(
+        request=BookingBulkCreateSerializer,
+        responses={
+            201: BookingBulkCreateResponseSerializer,
+            207: BookingBulkCreateResponseSerializer,
+            400: BookingBulkCreateResponseSerializer,
+        },
+    )
+    @action(detail=False, methods=["POST"])
+    def bulk(self, request):
+        request_serializer = BookingBulkCreateSerializer(data=request.data)
+        request_serializer.is_valid(raise_exception=True)
+        request_data = request_serializer.validated_data
+        result = booking_handler.handle_bulk_create(
+            user=request.user,
+            items=request_data["bookings"],
+            atomic=request_data["atomic"],
         )
+        return _bulk_response(result, status.HTTP_201_CREATED)
+
+    @extend_schema(
+        request=BookingBulkWriteSerializer,
+        responses={
+            200: BookingBulkWriteResponseSerializer,
+            207: BookingBulkWriteResponseSerializer,
+            400: BookingBulkWriteResponseSerializer,
+            409: BookingBulkWriteResponseSerializer,
+        },
+    )
+    @action(
+        detail=False,
+        methods=["POST"],
+        url_path="bulk/approve",
+        permission_classes=[permissions.IsAdminUser],
+    )
+    def bulk_approve(self, request):
+        request_serializer = BookingBulkWriteSerializer(data=request.data)
+        request_serializer.is_valid(raise_exception=True)
+        request_data = request_serializer.validated_data
+        result = booking_handler.handle_bulk_approve(
+            user=request.user,
+            booking_keys=request_data["booking_keys"],
+            atomic=request_data["atomic"],
+        )
+        return _bulk_response(result, status.HTTP_200_OK)
+
+    @extend_schema(
+        request=BookingBulkWriteSerializer,
+        responses={
+            200: BookingBulkWriteResponseSerializer,
+            207: BookingBulkWriteResponseSerializer,
+            400: BookingBulkWriteResponseSerializer,
+            409: BookingBulkWriteResponseSerializer,
+        },
+    )
+    @action(
+        detail=False,
+        methods=["POST"],
+        url_path="bulk/delete",
+        permission_classes=[permissions.IsAdminUser],
+    )
+    def bulk_delete(self, request):
+        request_serializer = BookingBulkWriteSerializer(data=request.data)
+        request_serializer.is_valid(raise_exception=True)
+        request_data = request_serializer.validated_data
+        result = booking_handler.handle_bulk_delete(
+            user=request.user,
+            booking_keys=request_data["booking_keys"],
+            atomic=request_data["atomic"],
+        )
+        return _bulk_response(result, status.HTTP_200_OK)
 
     @extend_schema(
         request=BookingUpdateSerializer,
+        parameters=[IF_MATCH_PARAMETER],
         responses={200: BookingSerializer},
     )
     def partial_update(self, request, booking_key):
@@ -102,6 +407,7 @@ class BookingViewSet(viewsets.ViewSet):
             user=request.user,
             booking_key=booking_key,
             data=request_data,
+            expected_version=_if_match_version(request),
         )
         if result.is_error():
             return response.Response(
@@ -111,10 +417,15 @@ class BookingViewSet(viewsets.ViewSet):
         return response.Response(
             BookingSerializer(result.unwrap()).data,
             status=status.HTTP_200_OK,
+            headers={
+                "ETag": _booking_etag(result.unwrap()),
+                **_event_headers(result),
+            },
         )
 
     @extend_schema(
         request=BookingUpdateSerializer,
+        parameters=[IF_MATCH_PARAMETER],
         responses={200: BookingSerializer},
     )
     def update(self, request, booking_key):
@@ -129,6 +440,7 @@ class BookingViewSet(viewsets.ViewSet):
                 "ends_at": request_data["ends_at"],
                 "applicants": request_data["applicants"],
             },
+            expected_version=_if_match_version(request),
         )
         if result.is_error():
             return response.Response(
@@ -138,24 +450,34 @@ class BookingViewSet(viewsets.ViewSet):
         return response.Response(
             BookingSerializer(result.unwrap()).data,
             status=status.HTTP_200_OK,
+            headers={
+                "ETag": _booking_etag(result.unwrap()),
+                **_event_headers(result),
+            },
         )
 
     @extend_schema(
+        parameters=[IF_MATCH_PARAMETER],
         responses={204: None},
     )
     def destroy(self, request, booking_key):
         result = booking_handler.handle_delete(
             user=request.user,
             booking_key=booking_key,
+            expected_version=_if_match_version(request),
         )
         if result.is_error():
             return response.Response(
                 {"error": result.unwrap_error()},
                 status=result.get_metadata("status", status.HTTP_400_BAD_REQUEST),
             )
-        return response.Response(status=status.HTTP_204_NO_CONTENT)
+        return response.Response(
+            status=status.HTTP_204_NO_CONTENT,
+            headers=_event_headers(result),
+        )
 
     @extend_schema(
+        parameters=[IF_MATCH_PARAMETER],
         responses={200: BookingSerializer},
     )
     @action(
@@ -167,15 +489,20 @@ class BookingViewSet(viewsets.ViewSet):
         result = booking_handler.handle_approve(
             user=request.user,
             booking_key=booking_key,
+            expected_version=_if_match_version(request),
         )
         if result.is_error():
             return response.Response(
                 {"error": result.unwrap_error()},
-                status=status.HTTP_400_BAD_REQUEST,
+                status=result.get_metadata("status", status.HTTP_400_BAD_REQUEST),
             )
         return response.Response(
             BookingSerializer(result.unwrap()).data,
             status=status.HTTP_200_OK,
+            headers={
+                "ETag": _booking_etag(result.unwrap()),
+                **_event_headers(result),
+            },
         )
 
 
@@ -189,20 +516,85 @@ class BookingAvailabilitySerializer(serializers.Serializer):
 
 
 @extend_schema(
-    description="List available capacity per hour for a given date.",
+    description=(
+        "List available capacity per hour for a given date. Pending bookings "
+        "count against it as well as approved ones."
+    ),
     request=BookingAvailabilityRequestSerializer,
-    responses={200: BookingAvailabilitySerializer(many=True)},
+    parameters=[EVENT_ID_PARAMETER, IF_NONE_MATCH_PARAMETER],
+    responses={200: BookingAvailabilitySerializer(many=True), 304: None},
 )
+@profiling.profile_request
 @api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated])
 def list_availability(request) -> response.Response:
     serializer = BookingAvailabilityRequestSerializer(data=request.query_params)
     serializer.is_valid(raise_exception=True)
+    headers = _wait_for_projection(request)
+    etag = booking_handler.handle_list_availability_etag(user_id=request.user.id)
+    not_modified = _not_modified(request, etag, headers)
+    if not_modified is not None:
+        return not_modified
     data = booking_handler.handle_list_availability(
         date=serializer.validated_data["date_utc"],
         user_id=request.user.id,
     )
     return response.Response(
-        data=BookingAvailabilitySerializer(data, many=True).data,
+        data=_availability_data(data),
         status=status.HTTP_200_OK,
+        headers={**_etag_headers(etag), **headers},
+    )
+
+
+class ExportRequestSerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=["ndjson", "csv"], default="ndjson")
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+
+EXPORT_CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _export_response(chunks, output: str, name: str) -> StreamingHttpResponse:
+    return StreamingHttpResponse(
+        chunks,
+        content_type=EXPORT_CONTENT_TYPES[output],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{output}"'},
+    )
+
+
+@extend_schema(
+    description="Stream bookings starting in [since, until) as NDJSON or CSV.",
+    parameters=[ExportRequestSerializer],
+    responses={(200, "application/x-ndjson"): str, (200, "text/csv"): str},
+)
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def export_bookings(request):
+    serializer = ExportRequestSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    return _export_response(
+        booking_handler.handle_export_bookings(filters=serializer.validated_data),
+        output=serializer.validated_data["output"],
+        name="bookings",
+    )
+
+
+@extend_schema(
+    description="Stream booking events recorded in [since, until) as NDJSON or CSV.",
+    parameters=[ExportRequestSerializer],
+    responses={(200, "application/x-ndjson"): str, (200, "text/csv"): str},
+)
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def export_events(request):
+    serializer = ExportRequestSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    return _export_response(
+        booking_handler.handle_export_events(filters=serializer.validated_data),
+        output=serializer.validated_data["output"],
+        name="booking-events",
     )
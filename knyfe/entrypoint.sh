@@ -0,0 +1,24 @@
+#!/bin/sh
+# Production entrypoint: `entrypoint.sh wsgi` serves the whole API with
+# gunicorn, `entrypoint.sh asgi` serves the async read endpoints with uvicorn.
+set -e
+
+export DJANGO_SETTINGS_MODULE="${DJANGO_SETTINGS_MODULE:-knyfe.production_settings}"
+
+poetry install --only main --no-interaction --no-ansi --no-root --no-cache
+
+case "${1:-wsgi}" in
+    wsgi)
+        python3 manage.py migrate --no-input
+        exec gunicorn knyfe.wsgi:application --config gunicorn.conf.py
+        ;;
+    asgi)
+        exec uvicorn knyfe.asgi:application \
+            --host 0.0.0.0 --port 8001 \
+            --workers "${UVICORN_WORKERS:-2}" \
+            --no-access-log
+        ;;
+    *)
+        exec "$@"
+        ;;
+esac
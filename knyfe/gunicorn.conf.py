@@ -0,0 +1,16 @@
+# gunicorn settings for knyfe.wsgi; see entrypoint.sh
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# each thread keeps its own persistent database connection, so at most
+# workers * threads connections are open at once
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+timeout = 30
+graceful_timeout = 30
+# recycle workers now and then, so slow leaks cannot build up
+max_requests = 10_000
+max_requests_jitter = 1_000
+accesslog = "-"
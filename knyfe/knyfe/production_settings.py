@@ -0,0 +1,66 @@
+"""
+Production settings for knyfe; select with
+DJANGO_SETTINGS_MODULE=knyfe.production_settings.
+
+https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
+"""
+
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+# Off, so the query log of every connection is not kept in memory either.
+DEBUG = False
+
+ALLOWED_HOSTS = [
+    host.strip()
+    for host in os.environ.get("DJANGO_ALLOWED_HOSTS", "localhost").split(",")
+    if host.strip()
+]
+
+
+# Database
+# Keep each WSGI worker thread's connections to the primary and its replicas
+# open across requests instead of connecting per request, and check them before
+# reusing them after an error or a restarted server. Under ASGI, synchronous
+# views get a new thread per request and cannot reuse connections; the async
+# endpoints use utils.async_db's pools.
+
+DATABASES = {
+    alias: {
+        **database,
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", "600")),
+        "CONN_HEALTH_CHECKS": True,
+    }
+    for alias, database in DATABASES.items()
+}
+
+
+# Cache
+# Every gunicorn and uvicorn worker is a process of its own, so the booking
+# caches must be shared between them (see the CACHES comment in settings).
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.redis.RedisCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "redis://localhost:6379/0"),
+    }
+}
+if CACHES["default"]["BACKEND"] == "django.core.cache.backends.locmem.LocMemCache":
+    raise ImproperlyConfigured(
+        "CACHE_BACKEND must be shared between processes in production; "
+        "LocMemCache is private to each worker."
+    )
+
+
+# Security
+# https://docs.djangoproject.com/en/4.2/ref/settings/#secure-proxy-ssl-header
+
+SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
+SESSION_COOKIE_SECURE = os.environ.get("DJANGO_SECURE_COOKIES", "1") == "1"
+CSRF_COOKIE_SECURE = SESSION_COOKIE_SECURE
@@ -32,7 +32,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "utils.metrics.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "utils.db_router.PrimaryPinMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -76,6 +78,49 @@ DATABASES = {
     }
 }
 
+# Read replicas of "default", as comma separated "host[:port][/name]" entries
+# in DB_REPLICAS, e.g. "replica-1,replica-2:5433", or "localhost/knyfe_replica"
+# for a second local database; missing parts are the primary's. Booking reads
+# go to a replica (see utils.db_router) except for DATABASE_PRIMARY_PIN_SECONDS
+# after a client's own write. Tests read the primary's database through them.
+_DB_REPLICAS = [entry.strip() for entry in os.environ.get("DB_REPLICAS", "").split(",")]
+DATABASE_REPLICAS = []
+for _entry in filter(None, _DB_REPLICAS):
+    _address, _, _name = _entry.partition("/")
+    _host, _, _port = _address.partition(":")
+    _alias = f"replica{len(DATABASE_REPLICAS) + 1}"
+    DATABASES[_alias] = {
+        **DATABASES["default"],
+        "HOST": _host or DATABASES["default"]["HOST"],
+        "PORT": _port or DATABASES["default"]["PORT"],
+        "NAME": _name or DATABASES["default"]["NAME"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(_alias)
+DATABASE_ROUTERS = ["utils.db_router.ReplicaRouter"]
+DATABASE_PRIMARY_PIN_SECONDS = int(os.environ.get("DB_PRIMARY_PIN_SECONDS", "5"))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/ref/settings/#caches
+# Booking projections, availability and the list/availability ETag generations
+# are cached here, and writers invalidate them in this cache only. The default
+# LocMemCache is private to each process, so it is only correct while a single
+# process serves the API, as `runserver` does: with more, the other processes
+# serve stale reads and 304s until their entries expire. Point
+# CACHE_BACKEND/CACHE_LOCATION at a shared backend (e.g.
+# django.core.cache.backends.redis.RedisCache) before running more than one;
+# knyfe.production_settings defaults to Redis and refuses LocMemCache.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -121,9 +166,78 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Custom settings
 AUTH_USER_MODEL = "bookings.User"
 
+# "sync" applies booking events to the projections inside the request; "async"
+# only appends them and leaves projection to `manage.py run_projector`.
+BOOKING_PROJECTION_MODE = os.environ.get("BOOKING_PROJECTION_MODE", "sync")
+# Longest booking accepted, in hours; bounds the capacity buckets one write
+# touches.
+BOOKING_MAX_DURATION_HOURS = 24
+# Most bookings one `POST /api/bookings/bulk/` request may create.
+BOOKING_BULK_CREATE_LIMIT = 1_000
+# Most bookings one `POST /api/bookings/bulk/approve/` or `.../bulk/delete/`
+# request may write.
+BOOKING_BULK_WRITE_LIMIT = 10_000
+# How long a read sent with `X-Booking-Event-Id` waits for that event to be
+# projected before it is served anyway.
+BOOKING_READ_YOUR_WRITES_TIMEOUT = 2.0
+# Per-request SQL timing, `Server-Timing` headers and the Prometheus `/metrics`
+# endpoint; when off the middleware is dropped from the stack entirely.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "0") == "1"
+# `/metrics` is served to staff sessions, and to scrapers that send
+# `Authorization: Bearer <METRICS_TOKEN>` when it is set.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+# Share of booking API requests profiled with cProfile (0 to 1); staff can also
+# profile a single request with `X-Profile: 1`. Only the newest
+# PROFILING_MAX_FILES profiles are kept; list them with `manage.py profiles`.
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_DIR = os.environ.get("PROFILING_DIR", str(BASE_DIR / "profiles"))
+PROFILING_MAX_FILES = 200
+# Connections per ASGI worker for the async read endpoints under `api/async/`;
+# requests beyond it wait for a free connection on the event loop.
+ASYNC_DB_POOL_SIZE = int(os.environ.get("ASYNC_DB_POOL_SIZE", "20"))
+# The event table is partitioned by month; `manage.py create_event_partitions`
+# (also run after every `migrate`) keeps BOOKING_EVENT_PARTITIONS_AHEAD months
+# ready, and `manage.py archive_event_partitions` moves months older than
+# BOOKING_EVENT_HOT_MONTHS into gzipped files under BOOKING_EVENT_ARCHIVE_DIR.
+BOOKING_EVENT_PARTITIONS_AHEAD = 3
+BOOKING_EVENT_HOT_MONTHS = int(os.environ.get("BOOKING_EVENT_HOT_MONTHS", "12"))
+BOOKING_EVENT_ARCHIVE_DIR = os.environ.get(
+    "BOOKING_EVENT_ARCHIVE_DIR", str(BASE_DIR / "archive")
+)
+# Each process keeps an in-memory replica of the booking projections, tailing
+# the event log every BOOKING_READ_MODEL_POLL_INTERVAL seconds, and serves list,
+# retrieve and availability from it; responses then carry how stale it was in
+# `X-Booking-Read-Model-Staleness`.
+BOOKING_READ_MODEL = os.environ.get("BOOKING_READ_MODEL", "0") == "1"
+BOOKING_READ_MODEL_POLL_INTERVAL = float(
+    os.environ.get("BOOKING_READ_MODEL_POLL_INTERVAL", "0.2")
+)
+# Single booking writes arriving within BOOKING_GROUP_COMMIT_WINDOW seconds of
+# each other are committed together in one transaction by a per-process flusher
+# thread, at most BOOKING_GROUP_COMMIT_MAX_BATCH at a time.
+BOOKING_GROUP_COMMIT = os.environ.get("BOOKING_GROUP_COMMIT", "0") == "1"
+BOOKING_GROUP_COMMIT_WINDOW = float(
+    os.environ.get("BOOKING_GROUP_COMMIT_WINDOW", "0.002")
+)
+BOOKING_GROUP_COMMIT_MAX_BATCH = 100
+# seconds a write waits for the flusher to pick it up before its caller gets a
+# TimeoutError
+BOOKING_GROUP_COMMIT_TIMEOUT = float(
+    os.environ.get("BOOKING_GROUP_COMMIT_TIMEOUT", "10")
+)
+
 # django rest framework settings
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": [
+        "utils.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "utils.renderers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
 # drf-spectacular settings
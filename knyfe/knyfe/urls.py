@@ -1,7 +1,8 @@
-from bookings import views
+from bookings import async_views, views
 from django.urls import include, path
 from drf_spectacular import views as spectacular_views
 from rest_framework import routers
+from utils import metrics
 
 router = routers.DefaultRouter()
 router.register(r"bookings", views.BookingViewSet, basename="bookings")
@@ -14,6 +15,22 @@ urlpatterns = [
         views.list_availability,
         name="availability",
     ),
+    # async reads, for ASGI servers
+    path("api/async/bookings/", async_views.list_bookings, name="async-bookings"),
+    path(
+        "api/async/bookings/<uuid:booking_key>/",
+        async_views.retrieve_booking,
+        name="async-booking",
+    ),
+    path(
+        "api/async/availability/segments/",
+        async_views.list_availability,
+        name="async-availability",
+    ),
+    path("api/exports/bookings/", views.export_bookings, name="export-bookings"),
+    path("api/exports/events/", views.export_events, name="export-events"),
+    # metrics
+    path("metrics", metrics.metrics_view, name="metrics"),
     # schema
     path("schema/", spectacular_views.SpectacularAPIView.as_view(), name="schema"),
     path(
@@ -0,0 +1,79 @@
+import asyncio
+import time
+import typing
+import weakref
+
+import psycopg
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, models
+from psycopg_pool import AsyncConnectionPool
+
+from . import db_router, metrics
+
+# one pool per event loop and database alias, since a pool's connections belong
+# to the loop that opened them; an ASGI worker runs a single loop
+_LoopPools = typing.Dict[str, asyncio.Future]
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopPools]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+async def get_pool(alias: str = DEFAULT_DB_ALIAS) -> AsyncConnectionPool:
+    """the running loop's pool of autocommit connections to the `alias`
+    database, opened on first use"""
+    pools = _pools.setdefault(asyncio.get_running_loop(), {})
+    pool = pools.get(alias)
+    if pool is None:
+        pool = pools[alias] = asyncio.ensure_future(_open_pool(alias))
+    return await pool
+
+
+async def _open_pool(alias: str) -> AsyncConnectionPool:
+    # the same parameters and adapters as Django's own connections, so queries
+    # compiled by the ORM bind and load values the way they do through it
+    kwargs = connections[alias].get_connection_params()
+    kwargs["cursor_factory"] = psycopg.AsyncClientCursor
+    kwargs["autocommit"] = True
+    pool = AsyncConnectionPool(
+        kwargs=kwargs,
+        min_size=1,
+        max_size=settings.ASYNC_DB_POOL_SIZE,
+        configure=_configure,
+        open=False,
+    )
+    await pool.open()
+    return pool
+
+
+async def _configure(conn: psycopg.AsyncConnection) -> None:
+    await conn.execute("SET TIME ZONE 'UTC'")
+
+
+async def close_pool() -> None:
+    for pool in _pools.pop(asyncio.get_running_loop(), {}).values():
+        await (await pool).close()
+
+
+async def fetch_all(
+    query: typing.Union[str, "models.QuerySet"],
+    params: typing.Sequence = (),
+) -> typing.List[tuple]:
+    """rows of raw SQL, or of a `values_list()` queryset compiled by the ORM,
+    read from the database utils.db_router routes reads to"""
+    if isinstance(query, models.QuerySet):
+        query, params = query.query.sql_with_params()
+    pool = await get_pool(db_router.read_alias())
+    async with pool.connection() as conn:
+        started_at = time.perf_counter()
+        cursor = await conn.execute(query, params)
+        rows = await cursor.fetchall()
+        metrics.observe_async_query(time.perf_counter() - started_at, len(rows))
+        return rows
+
+
+async def fetch_one(
+    query: typing.Union[str, "models.QuerySet"],
+    params: typing.Sequence = (),
+) -> typing.Optional[tuple]:
+    rows = await fetch_all(query, params)
+    return rows[0] if rows else None
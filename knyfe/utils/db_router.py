@@ -0,0 +1,136 @@
+"""routing of booking reads to read replicas
+
+Reads made inside `replica_reads()` go to one of settings.DATABASE_REPLICAS;
+everything else, writes included, stays on the "default" primary. A client
+that has just written carries PIN_COOKIE for DATABASE_PRIMARY_PIN_SECONDS, and
+its reads stay on the primary until the cookie expires, so that they see the
+write however far the replicas lag behind.
+"""
+
+import contextlib
+import contextvars
+import random
+import typing
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = "knyfe_primary"
+
+_read_alias: contextvars.ContextVar[typing.Optional[str]] = contextvars.ContextVar(
+    "read_alias", default=None
+)
+_pinned: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "pinned_to_primary", default=False
+)
+
+
+class ReplicaRouter:
+    """sends the ORM reads of a `replica_reads()` block to its replica"""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas follow the primary's schema through replication
+        return db == DEFAULT_DB_ALIAS
+
+
+def reads_from_replica() -> bool:
+    """whether a `replica_reads()` block entered now would leave the primary"""
+    return bool(
+        settings.DATABASE_REPLICAS
+        and not _pinned.get()
+        # a replica cannot see the open transaction's own writes
+        and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+    )
+
+
+@contextlib.contextmanager
+def replica_reads() -> typing.Iterator[str]:
+    """route the ORM reads in this block, and read_connection(), to a replica
+    picked at random, unless reads_from_replica() says otherwise; yields the
+    alias read from"""
+    alias = (
+        random.choice(settings.DATABASE_REPLICAS)
+        if reads_from_replica()
+        else DEFAULT_DB_ALIAS
+    )
+    token = _read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _read_alias.reset(token)
+
+
+def read_alias() -> str:
+    return _read_alias.get() or DEFAULT_DB_ALIAS
+
+
+def read_connection():
+    """connection for raw SQL reads, which routers never see"""
+    return connections[read_alias()]
+
+
+def cache_timeout(timeout: int) -> int:
+    """how long rows read in the current block may be cached: a replica may lag
+    by up to DATABASE_PRIMARY_PIN_SECONDS, so its rows only that long"""
+    if read_alias() == DEFAULT_DB_ALIAS:
+        return timeout
+    return min(timeout, settings.DATABASE_PRIMARY_PIN_SECONDS)
+
+
+class PrimaryPinMiddleware:
+    """pins a client to the primary for DATABASE_PRIMARY_PIN_SECONDS after each
+    successful write; removed from the stack unless DATABASE_REPLICAS"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _pinned.set(PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self._pin(request, response)
+
+    async def __acall__(self, request):
+        token = _pinned.set(PIN_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self._pin(request, response)
+
+    def _pin(self, request, response):
+        if request.method not in ("GET", "HEAD", "OPTIONS") and (
+            response.status_code < 400
+        ):
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=settings.DATABASE_PRIMARY_PIN_SECONDS,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
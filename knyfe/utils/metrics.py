@@ -0,0 +1,222 @@
+import bisect
+import contextlib
+import contextvars
+import hmac
+import threading
+import time
+import typing
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, PermissionDenied
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+ROW_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000)
+
+
+class Histogram:
+    def __init__(self, buckets: typing.Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """process-local per-endpoint histograms; each worker process is scraped on
+    its own"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests: typing.Dict[tuple, int] = {}
+        self.histograms: typing.Dict[tuple, Histogram] = {}
+
+    def observe_request(
+        self,
+        method: str,
+        route: str,
+        status: int,
+        seconds: float,
+        queries: int,
+        rows: int,
+    ) -> None:
+        labels = (("method", method), ("route", route))
+        with self.lock:
+            key = (*labels, ("status", str(status)))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for name, buckets, value in (
+                ("http_request_duration_seconds", LATENCY_BUCKETS, seconds),
+                ("http_request_db_queries", QUERY_COUNT_BUCKETS, queries),
+                ("http_request_db_rows", ROW_BUCKETS, rows),
+            ):
+                histogram = self.histograms.get((name, labels))
+                if histogram is None:
+                    histogram = self.histograms[(name, labels)] = Histogram(buckets)
+                histogram.observe(value)
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = ["# TYPE http_requests_total counter"]
+        with self.lock:
+            for labels, value in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{_labels(labels)} {value}")
+            histograms = sorted(self.histograms.items())
+            for name in sorted({name for (name, _), _ in histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (histogram_name, labels), histogram in histograms:
+                    if histogram_name == name:
+                        lines.extend(_render_histogram(name, labels, histogram))
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        with self.lock:
+            self.requests.clear()
+            self.histograms.clear()
+
+
+registry = Registry()
+
+
+def _labels(labels: typing.Iterable[typing.Tuple[str, str]]) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _render_histogram(name, labels, histogram: Histogram) -> typing.List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+        cumulative += count
+        lines.append(
+            f"{name}_bucket{_labels((*labels, ('le', str(bound))))} {cumulative}"
+        )
+    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+    return lines
+
+
+class QueryStats:
+    """`connection.execute_wrapper` that counts, times and sums the rows of every
+    query run while it is installed"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.observe(
+                time.perf_counter() - started_at,
+                getattr(context["cursor"], "rowcount", -1),
+            )
+
+    def observe(self, seconds: float, rowcount: int) -> None:
+        self.seconds += seconds
+        self.count += 1
+        if rowcount > 0:
+            self.rows += rowcount
+
+
+# stats of the async request being served, for queries that bypass Django's
+# connections
+_async_query_stats: contextvars.ContextVar[typing.Optional[QueryStats]] = (
+    contextvars.ContextVar("async_query_stats", default=None)
+)
+
+
+def observe_async_query(seconds: float, rowcount: int) -> None:
+    stats = _async_query_stats.get()
+    if stats is not None:
+        stats.observe(seconds, rowcount)
+
+
+class RequestMetricsMiddleware:
+    """times each request and its SQL, adds a `Server-Timing` header and records
+    per-endpoint histograms; removed from the stack unless METRICS_ENABLED"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # keep async views on the event loop under ASGI
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = QueryStats()
+        started_at = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        return self._observe(request, response, stats, started_at)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        started_at = time.perf_counter()
+        token = _async_query_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _async_query_stats.reset(token)
+        return self._observe(request, response, stats, started_at)
+
+    def _observe(self, request, response, stats: QueryStats, started_at: float):
+        seconds = time.perf_counter() - started_at
+        response["Server-Timing"] = (
+            f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries", '
+            f"app;dur={(seconds - stats.seconds) * 1000:.1f}, "
+            f"total;dur={seconds * 1000:.1f}"
+        )
+        match = request.resolver_match
+        registry.observe_request(
+            method=request.method,
+            route=match.route if match else "unmatched",
+            status=response.status_code,
+            seconds=seconds,
+            queries=stats.count,
+            rows=stats.rows,
+        )
+        return response
+
+
+def metrics_view(request):
+    """the registry for staff sessions and for scrapers sending
+    `Authorization: Bearer <METRICS_TOKEN>`"""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if not (request.user.is_staff or _has_metrics_token(request)):
+        raise PermissionDenied
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def _has_metrics_token(request) -> bool:
+    token = settings.METRICS_TOKEN
+    if not token:
+        return False
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(
+        credentials.encode(), token.encode()
+    )
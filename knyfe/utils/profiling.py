@@ -0,0 +1,102 @@
+import cProfile
+import datetime
+import functools
+import os
+import random
+import re
+import time
+import typing
+
+from django.conf import settings
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+PROFILE_SUFFIX = ".prof"
+
+
+def profile_request(view):
+    """profile the wrapped view with cProfile for sampled requests, and for staff
+    requests sent with `X-Profile: 1`; each profile is written to PROFILING_DIR,
+    which keeps only the newest PROFILING_MAX_FILES"""
+
+    @functools.wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if not _should_profile(request):
+            return view(request, *args, **kwargs)
+        profiler = cProfile.Profile()
+        started_at = time.perf_counter()
+        response = profiler.runcall(view, request, *args, **kwargs)
+        elapsed = time.perf_counter() - started_at
+        response[PROFILE_ID_HEADER] = save_profile(
+            profiler, request.method, request.path, response.status_code, elapsed
+        )
+        return response
+
+    return wrapped
+
+
+def _should_profile(request) -> bool:
+    if request.headers.get(PROFILE_HEADER) == "1" and request.user.is_staff:
+        return True
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+class ProfileInfo(typing.NamedTuple):
+    name: str
+    path: str
+    captured_at: datetime.datetime
+    method: str
+    route: str
+    status: int
+    elapsed_ms: int
+
+
+def save_profile(
+    profiler: cProfile.Profile,
+    method: str,
+    path: str,
+    status: int,
+    elapsed: float,
+) -> str:
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    route = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+    name = (
+        f"{time.time_ns()}-{method}-{route}-{status}-{round(elapsed * 1000)}ms"
+        f"{PROFILE_SUFFIX}"
+    )
+    profiler.dump_stats(os.path.join(directory, name))
+    for info in list_profiles()[settings.PROFILING_MAX_FILES :]:
+        os.remove(info.path)
+    return name
+
+
+def list_profiles() -> typing.List[ProfileInfo]:
+    """captured profiles, newest first"""
+    directory = settings.PROFILING_DIR
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        match = re.fullmatch(
+            rf"(\d+)-([A-Z]+)-(.+)-(\d{{3}})-(\d+)ms{re.escape(PROFILE_SUFFIX)}", name
+        )
+        if match:
+            profiles.append(
+                (
+                    int(match.group(1)),
+                    ProfileInfo(
+                        name=name,
+                        path=os.path.join(directory, name),
+                        captured_at=datetime.datetime.fromtimestamp(
+                            int(match.group(1)) / 1e9, datetime.timezone.utc
+                        ),
+                        method=match.group(2),
+                        route=match.group(3),
+                        status=int(match.group(4)),
+                        elapsed_ms=int(match.group(5)),
+                    ),
+                )
+            )
+    return [info for _, info in sorted(profiles, reverse=True)]